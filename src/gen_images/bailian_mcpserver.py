@@ -4,10 +4,14 @@
 此MCP服务器提供调用阿里云百炼平台生图API的工具。
 """
 
+import asyncio
 import json
+import logging
 import os
 import time
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Optional
 import httpx
 from mcp.server.fastmcp import FastMCP, Context
 from starlette.datastructures import Headers
@@ -16,8 +20,14 @@ from starlette.datastructures import Headers
 # 阿里云百炼baseurl
 BAILIAN_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
 
-# 创建全局MCP实例用于装饰器
-mcp = FastMCP(name="阿里云百炼生图API MCP服务器")
+# 查询任务结果的轮询间隔：从初始间隔开始每次乘以增长倍数，直到 retry_interval
+POLL_INITIAL_INTERVAL = float(os.getenv("BAILIAN_POLL_INITIAL_INTERVAL", "1"))
+POLL_BACKOFF = 1.5
+
+# 生图任务从提交到完成的典型秒数，初始值之后按实际完成的任务更新
+TYPICAL_COMPLETION_SECONDS = float(os.getenv("BAILIAN_TYPICAL_COMPLETION", "15"))
+
+logger = logging.getLogger(__name__)
 
 
 def get_api_key_from_context(ctx: Context) -> str:
@@ -43,31 +53,93 @@ def get_api_key_from_context(ctx: Context) -> str:
     )
 
 
-def get_http_client(api_key: str) -> httpx.Client:
-    """获取HTTP客户端"""
-    return httpx.Client(
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        timeout=30.0,
-    )
+_http_client: Optional[httpx.AsyncClient] = None
 
 
-def get_http_aclient(api_key: str) -> httpx.Client:
-    """获取HTTP客户端"""
-    return httpx.Client(
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            "X-DashScope-Async": "enable",
-        },
-        timeout=30.0,
-    )
+def get_http_client() -> httpx.AsyncClient:
+    """获取所有请求共享的HTTP客户端，复用连接；API密钥按请求通过请求头传入"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=30.0)
+    return _http_client
+
+
+# 正在进行的MCP会话数，最后一个会话结束时关闭共享的HTTP客户端
+_active_sessions = 0
+
+
+@asynccontextmanager
+async def http_client_lifespan(server: FastMCP) -> AsyncIterator[dict]:
+    """
+    MCP会话的生命周期
+
+    stdio 模式下唯一的会话结束即服务器退出；HTTP 模式下没有活动会话时关闭客户端，
+    下一个请求会重新创建。关闭在会话所在的事件循环中进行，不受退出时的任务取消影响。
+    """
+    global _active_sessions, _http_client
+    _active_sessions += 1
+    try:
+        yield {}
+    finally:
+        _active_sessions -= 1
+        if _active_sessions == 0 and _http_client is not None:
+            client, _http_client = _http_client, None
+            await asyncio.shield(client.aclose())
+
+
+# 创建全局MCP实例用于装饰器
+mcp = FastMCP(name="阿里云百炼生图API MCP服务器", lifespan=http_client_lifespan)
+
+
+def auth_headers(api_key: str, async_task: bool = False) -> dict:
+    """构建请求头，async_task 为真时以异步任务方式提交"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    if async_task:
+        headers["X-DashScope-Async"] = "enable"
+    return headers
+
+
+class CompletionTracker:
+    """记录生图任务从提交到完成的耗时（指数移动平均），用于安排轮询时刻"""
+
+    def __init__(self, typical: float):
+        self.typical = typical
+
+    def observe(self, output: dict, waited: float) -> None:
+        """按任务的提交和结束时间更新典型耗时，缺少时间字段时使用本次等待的时长"""
+        seconds = waited
+        try:
+            fmt = "%Y-%m-%d %H:%M:%S.%f"
+            submit = datetime.strptime(output["submit_time"], fmt)
+            end = datetime.strptime(output["end_time"], fmt)
+            seconds = (end - submit).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            pass
+        if seconds > 0:
+            self.typical = 0.8 * self.typical + 0.2 * seconds
+
+    def next_delay(self, attempt: int, elapsed: float, max_interval: float) -> float:
+        """
+        下一次查询前等待的秒数
+
+        间隔从 POLL_INITIAL_INTERVAL 开始按 POLL_BACKOFF 增长，不超过 max_interval；
+        预计完成时刻早于下一次查询时，改为在预计完成时刻查询。
+        """
+        delay = min(max_interval, POLL_INITIAL_INTERVAL * POLL_BACKOFF**attempt)
+        expected = self.typical - elapsed
+        if POLL_INITIAL_INTERVAL <= expected < delay:
+            delay = expected
+        return max(delay, 0.1)
+
+
+completion_tracker = CompletionTracker(TYPICAL_COMPLETION_SECONDS)
 
 
 @mcp.tool()
-def generate_image(
+async def generate_image(
     ctx: Context,
     prompt: str,
     size: str = "1328*1328",
@@ -120,27 +192,27 @@ def generate_image(
         data["input"]["negative_prompt"] = negative_prompt
 
     try:
-        with get_http_aclient(api_key) as client:
-            response = client.post(
-                f"{BAILIAN_BASE_URL}/services/aigc/text2image/image-synthesis",
-                json=data,
+        response = await get_http_client().post(
+            f"{BAILIAN_BASE_URL}/services/aigc/text2image/image-synthesis",
+            json=data,
+            headers=auth_headers(api_key, async_task=True),
+        )
+        response.raise_for_status()
+        result = response.json()
+
+        # 检查响应是否包含任务ID
+        if "output" in result and "task_id" in result["output"]:
+            return json.dumps(
+                {
+                    "task_id": result["output"]["task_id"],
+                    "task_status": result["output"]["task_status"],
+                    "request_id": result.get("request_id", ""),
+                },
+                ensure_ascii=False,
+                indent=2,
             )
-            response.raise_for_status()
-            result = response.json()
-
-            # 检查响应是否包含任务ID
-            if "output" in result and "task_id" in result["output"]:
-                return json.dumps(
-                    {
-                        "task_id": result["output"]["task_id"],
-                        "task_status": result["output"]["task_status"],
-                        "request_id": result.get("request_id", ""),
-                    },
-                    ensure_ascii=False,
-                    indent=2,
-                )
-            else:
-                return f"API响应错误: {result}"
+        else:
+            return f"API响应错误: {result}"
 
     except httpx.RequestError as e:
         return f"请求错误: {str(e)}"
@@ -151,16 +223,18 @@ def generate_image(
 
 
 @mcp.tool()
-def get_image_generation_result(
+async def get_image_generation_result(
     ctx: Context, task_id: str, max_retries: int = 30, retry_interval: int = 3
 ) -> str:
     """
-    根据任务ID查询图像生成结果
+    根据任务ID查询图像生成结果，等待期间发送进度通知
+
+    查询间隔从1秒开始逐渐增长，并在任务的预计完成时刻附近查询。
 
     Args:
         task_id: 图像生成任务的ID
-        max_retries: 最大重试次数
-        retry_interval: 重试间隔（秒）
+        max_retries: 最大查询次数
+        retry_interval: 最大查询间隔（秒）
 
     Returns:
         results: 任务结果列表，包括图像URL、prompt、部分任务执行失败报错信息等
@@ -170,28 +244,39 @@ def get_image_generation_result(
     except ValueError as e:
         return f"认证错误: {str(e)}"
 
+    start = time.monotonic()
     try:
-        with get_http_client(api_key) as client:
-            for _ in range(max_retries):
-                response = client.get(
-                    f"{BAILIAN_BASE_URL}/tasks/{task_id}",
-                    headers={"Authorization": f"Bearer {api_key}"},
-                )
-                response.raise_for_status()
-                result = response.json()
-
-                # 检查任务状态
-                task_status = result.get("output", {}).get("task_status", "UNKNOWN")
-
-                # 如果任务完成或失败，返回结果
-                if task_status in ["SUCCEEDED", "FAILED", "CANCELED"]:
-                    return json.dumps(result, ensure_ascii=False, indent=2)
+        for attempt in range(max_retries):
+            response = await get_http_client().get(
+                f"{BAILIAN_BASE_URL}/tasks/{task_id}",
+                headers=auth_headers(api_key),
+            )
+            response.raise_for_status()
+            result = response.json()
 
-                # 如果任务仍在进行中，等待后重试
-                time.sleep(retry_interval)
+            # 检查任务状态
+            output = result.get("output", {})
+            task_status = output.get("task_status", "UNKNOWN")
+            elapsed = time.monotonic() - start
+
+            # 如果任务完成或失败，返回结果
+            if task_status in ["SUCCEEDED", "FAILED", "CANCELED"]:
+                if task_status == "SUCCEEDED":
+                    completion_tracker.observe(output, elapsed)
+                return json.dumps(result, ensure_ascii=False, indent=2)
+
+            # 如果任务仍在进行中，报告进度后等待，等待期间不阻塞其他请求
+            await ctx.report_progress(
+                elapsed,
+                max(completion_tracker.typical, elapsed),
+                f"任务状态: {task_status}，已等待 {elapsed:.0f} 秒",
+            )
+            await asyncio.sleep(
+                completion_tracker.next_delay(attempt, elapsed, retry_interval)
+            )
 
-            # 超过最大重试次数
-            return f"查询超时: 任务 {task_id} 仍未完成"
+        # 超过最大查询次数
+        return f"查询超时: 任务 {task_id} 仍未完成"
 
     except httpx.RequestError as e:
         return f"请求错误: {str(e)}"
@@ -202,7 +287,7 @@ def get_image_generation_result(
 
 
 @mcp.tool()
-def image_edit_generation(
+async def image_edit_generation(
     ctx: Context,
     prompt: str,
     image: str,
@@ -266,29 +351,30 @@ def image_edit_generation(
         data["parameters"]["negative_prompt"] = negative_prompt
 
     try:
-        with get_http_client(api_key) as client:
-            print(f"请求数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
-            response = client.post(
-                f"{BAILIAN_BASE_URL}/services/aigc/multimodal-generation/generation",
-                json=data,
+        # stdio 模式下标准输出是协议通道，调试信息只能写入日志
+        logger.debug("请求数据: %s", json.dumps(data, ensure_ascii=False))
+        response = await get_http_client().post(
+            f"{BAILIAN_BASE_URL}/services/aigc/multimodal-generation/generation",
+            json=data,
+            headers=auth_headers(api_key),
+        )
+        response.raise_for_status()
+        result = response.json()
+
+        # 检查响应是否包含任务ID
+        if "output" in result and "choices" in result["output"]:
+            return json.dumps(
+                {
+                    "image_url": result["output"]["choices"][0]["message"][
+                        "content"
+                    ][0]["image"],
+                    "request_id": result.get("request_id", ""),
+                },
+                ensure_ascii=False,
+                indent=2,
             )
-            response.raise_for_status()
-            result = response.json()
-
-            # 检查响应是否包含任务ID
-            if "output" in result and "choices" in result["output"]:
-                return json.dumps(
-                    {
-                        "image_url": result["output"]["choices"][0]["message"][
-                            "content"
-                        ][0]["image"],
-                        "request_id": result.get("request_id", ""),
-                    },
-                    ensure_ascii=False,
-                    indent=2,
-                )
-            else:
-                return f"API响应错误: {result}"
+        else:
+            return f"API响应错误: {result}"
 
     except httpx.RequestError as e:
         return f"请求错误: {str(e)}"
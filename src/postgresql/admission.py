@@ -0,0 +1,208 @@
+"""
+HTTP 模式下的准入控制
+
+限制全局和每个客户端同时执行的工具调用数，超出时在客户端之间公平排队或直接拒绝。
+"""
+
+import asyncio
+import functools
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional
+
+from mcp.shared.context import RequestContext
+
+from .config import ADMISSION_CONFIG
+from .session import request_context, session_key
+
+
+# === 准入控制 ===
+
+
+class AdmissionRejected(Exception):
+    """服务器繁忙，工具调用未被执行"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    HTTP 模式下多个客户端共享同一进程和连接池时的工具调用准入控制
+
+    同时执行的调用数不超过 max_active（全局）和 client_max_active（每个客户端）。
+    超出时调用进入所属客户端的等待队列，名额空出后在有等待调用的客户端之间轮流放行，
+    单个客户端的大量请求不会饿死其他客户端。排队总数或单个客户端的排队数达到上限、
+    或按平均执行时间估算的等待时间超过 queue_timeout 时立即拒绝并给出建议的重试秒数，
+    而不是让请求长时间排队直到客户端超时。所有方法都在事件循环中调用，不需要加锁。
+    """
+
+    def __init__(
+        self,
+        max_active: int,
+        client_max_active: int,
+        max_queued: int,
+        client_max_queued: int,
+        queue_timeout: float,
+        client_header: str,
+    ):
+        self.max_active = max(1, max_active)
+        self.client_max_active = max(1, client_max_active)
+        self.max_queued = max_queued
+        self.client_max_queued = client_max_queued
+        self.queue_timeout = queue_timeout
+        self.client_header = client_header
+        # 仅在 HTTP 模式下由 main() 启用，stdio 模式只有一个客户端
+        self.enabled = False
+        self._active: Dict[str, int] = {}
+        self._total_active = 0
+        # 客户端 -> 等待中的调用，按轮转顺序排列
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._total_queued = 0
+        # 调用占用名额的平均秒数（指数移动平均），用于估算等待时间
+        self._avg_hold = 1.0
+        self._counters = {"admitted": 0, "enqueued": 0, "rejected": 0, "timed_out": 0}
+
+    def client_id(self, context: Optional[RequestContext]) -> str:
+        """客户端标识：client_header 请求头，未提供时为客户端地址，都没有时为MCP会话"""
+        request = getattr(context, "request", None)
+        if request is not None:
+            value = request.headers.get(self.client_header)
+            if value:
+                return f"header:{value}"
+            if request.client:
+                return f"addr:{request.client.host}"
+        return session_key(context)
+
+    def retry_after(self) -> int:
+        """按排队数和平均执行时间估算的等待秒数"""
+        wait = self._avg_hold * (self._total_queued + 1) / self.max_active
+        return max(1, math.ceil(wait))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._counters["rejected"] += 1
+        return AdmissionRejected(reason, self.retry_after())
+
+    def _grant(self, client: str) -> None:
+        self._active[client] = self._active.get(client, 0) + 1
+        self._total_active += 1
+        self._counters["admitted"] += 1
+
+    async def acquire(self, client: str) -> None:
+        """获取执行名额，需要等待时排队，无法在 queue_timeout 内获得时抛出 AdmissionRejected"""
+        if (
+            self._total_active < self.max_active
+            and self._active.get(client, 0) < self.client_max_active
+            and client not in self._queues
+        ):
+            self._grant(client)
+            return
+
+        queue = self._queues.get(client)
+        if self._total_queued >= self.max_queued:
+            raise self._reject("排队的请求已达上限")
+        if queue is not None and len(queue) >= self.client_max_queued:
+            raise self._reject("该客户端排队的请求已达上限")
+        if self.retry_after() > self.queue_timeout:
+            raise self._reject("预计等待时间过长")
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[client] = deque()
+        queue.append(waiter)
+        self._total_queued += 1
+        self._counters["enqueued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 超时或取消的同时已被放行，归还名额
+                self.release(client, 0.0)
+            else:
+                waiter.cancel()
+                self._discard(client, waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._counters["timed_out"] += 1
+            raise self._reject("排队等待超时")
+
+    def _discard(self, client: str, waiter: "asyncio.Future") -> None:
+        queue = self._queues.get(client)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._total_queued -= 1
+            if not queue:
+                del self._queues[client]
+
+    def release(self, client: str, held: float) -> None:
+        """归还名额，并在有等待调用的客户端之间轮流放行"""
+        self._active[client] -= 1
+        if not self._active[client]:
+            del self._active[client]
+        self._total_active -= 1
+        if held > 0:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+        if client in self._queues:
+            # 刚执行完的客户端排到轮转顺序的末尾
+            self._queues.move_to_end(client)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for client in list(self._queues):
+            if self._total_active >= self.max_active:
+                return
+            if self._active.get(client, 0) >= self.client_max_active:
+                continue
+            queue = self._queues.pop(client)
+            waiter = queue.popleft()
+            self._total_queued -= 1
+            if queue:
+                # 放行后移到轮转顺序的末尾
+                self._queues[client] = queue
+            self._grant(client)
+            waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """准入控制统计信息"""
+        return {
+            "enabled": self.enabled,
+            "max_active": self.max_active,
+            "client_max_active": self.client_max_active,
+            "max_queued": self.max_queued,
+            "client_max_queued": self.client_max_queued,
+            "active": self._total_active,
+            "queued": self._total_queued,
+            "clients": len(set(self._active) | set(self._queues)),
+            "avg_hold_seconds": round(self._avg_hold, 3),
+            **self._counters,
+        }
+
+
+admission = AdmissionController(**ADMISSION_CONFIG)
+
+
+def with_admission(func: Callable[..., Any]) -> Callable[..., Any]:
+    """HTTP 模式下调用前获取执行名额，服务器繁忙时直接返回带重试秒数的错误信息"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not admission.enabled:
+            return await func(*args, **kwargs)
+        client = admission.client_id(request_context())
+        try:
+            await admission.acquire(client)
+        except AdmissionRejected as e:
+            return (
+                f"错误: 服务器繁忙（{e.reason}），请在 {e.retry_after} 秒后重试"
+                f"（retry_after={e.retry_after}）"
+            )
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            admission.release(client, time.perf_counter() - start)
+
+    return wrapper
@@ -0,0 +1,120 @@
+"""
+批量查询
+
+在一次调用中并发执行多条只读语句，或在同一个一致性快照中依次执行。
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from .cost_guard import apply_cost_guard
+from .db import (
+    _snapshot_session,
+    aexecute_query_limited,
+    decode_rows,
+    get_pool,
+    new_cursor_name,
+    register_text_passthrough,
+)
+from .formatting import result_size
+from .pool import apply_timeouts
+from .query_cache import query_cache
+
+
+# === 批量查询 ===
+
+
+def execute_batch_consistent(
+    statements: List[Tuple[int, str]], max_rows: int
+) -> Dict[int, Dict[str, Any]]:
+    """
+    在同一连接的同一个 REPEATABLE READ 只读事务中依次执行多条查询
+
+    所有语句看到同一个数据快照。每条语句在独立的保存点中执行，
+    出错时回滚到保存点，不影响后续语句。返回 {语句序号: 结果或错误}。
+    """
+    outcomes: Dict[int, Dict[str, Any]] = {}
+    try:
+        with get_pool().connection() as conn:
+            # 快照会话的连接已处于会话的快照事务中
+            if _snapshot_session.get() is None:
+                # SET TRANSACTION 必须是事务中的第一条语句
+                conn.rollback()
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+                    )
+            apply_timeouts(conn)
+            for index, sql in statements:
+                start = time.perf_counter()
+                with conn.cursor() as cur:
+                    cur.execute("SAVEPOINT mcp_batch")
+                try:
+                    with conn.cursor(name=new_cursor_name()) as cur:
+                        register_text_passthrough(cur)
+                        cur.itersize = max_rows + 1
+                        cur.execute(sql)
+                        rows = cur.fetchmany(max_rows + 1)
+                        results = decode_rows(cur.description, rows[:max_rows])
+                    with conn.cursor() as cur:
+                        cur.execute("RELEASE SAVEPOINT mcp_batch")
+                    outcomes[index] = {
+                        "results": results,
+                        "truncated": len(rows) > max_rows,
+                    }
+                except psycopg2.Error as e:
+                    with conn.cursor() as cur:
+                        cur.execute("ROLLBACK TO SAVEPOINT mcp_batch")
+                    outcomes[index] = {"error": f"SQL查询执行失败: {e}"}
+                outcomes[index]["elapsed_ms"] = round(
+                    (time.perf_counter() - start) * 1000, 2
+                )
+            conn.rollback()
+    except psycopg2.Error as e:
+        raise Exception(f"批量查询执行失败: {e}")
+    return outcomes
+
+
+async def guarded_statement(
+    sql: str, max_rows: int, cache_key: Optional[Tuple[Any, ...]]
+) -> Dict[str, Any]:
+    """经过代价检查后执行一条语句，结果写入查询结果缓存"""
+    error, executed_sql, rewrite = await apply_cost_guard(sql, max_rows)
+    if error:
+        return {"error": error}
+    generation = query_cache.generation
+    results, truncated = await aexecute_query_limited(executed_sql, max_rows=max_rows)
+    # 抽样结果每次都不同，不缓存
+    if cache_key and not (rewrite and rewrite["rewrite"] == "tablesample"):
+        query_cache.set(
+            cache_key, (results, truncated), result_size(results), generation
+        )
+    outcome = {"results": results, "truncated": truncated}
+    if rewrite:
+        outcome["cost_guard"] = {**rewrite, "executed_query": executed_sql}
+    return outcome
+
+
+async def run_batch_statement(
+    sql: str, max_rows: int, use_cache: bool, semaphore: asyncio.Semaphore
+) -> Dict[str, Any]:
+    """并发模式下执行一条语句：代价检查、查询结果缓存和执行与 execute_readonly_query 一致"""
+    start = time.perf_counter()
+    async with semaphore:
+        try:
+            cache_key = None
+            if query_cache.enabled and _snapshot_session.get() is None:
+                cache_key = query_cache.make_key(sql, max_rows)
+            hit = query_cache.get(cache_key) if cache_key and use_cache else None
+            if hit is not None:
+                results, truncated = hit
+                outcome = {"results": results, "truncated": truncated, "cached": True}
+            else:
+                outcome = await guarded_statement(sql, max_rows, cache_key)
+        except Exception as e:
+            outcome = {"error": str(e)}
+    outcome["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return outcome
@@ -0,0 +1,275 @@
+"""
+列统计
+
+单次扫描计算所有列统计量的查询（大表自动抽样），以及基于 pg_stats 的列画像。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2 import errorcodes
+
+from .config import ANALYZE_SAMPLE_ROWS, ANALYZE_SAMPLE_THRESHOLD
+from .db import aexecute_query
+from .row_counts import ESTIMATED_ROWS_SQL
+
+
+# === 列统计 ===
+
+# 表的列及其类型分类（pg_type.typcategory），以及 pg_stats 中的不同值数量估算
+COLUMN_TYPES_QUERY = """
+SELECT
+    a.attname AS column_name,
+    quote_ident(a.attname) AS column_ident,
+    format_type(a.atttypid, a.atttypmod) AS data_type,
+    bt.typname AS base_type,
+    bt.typcategory AS type_category,
+    s.n_distinct
+FROM pg_attribute a
+JOIN pg_class c ON c.oid = a.attrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_type t ON t.oid = a.atttypid
+JOIN pg_type bt ON bt.oid = CASE WHEN t.typtype = 'd' THEN t.typbasetype ELSE t.oid END
+LEFT JOIN pg_stats s
+    ON s.schemaname = n.nspname
+    AND s.tablename = c.relname
+    AND s.attname = a.attname
+    AND s.inherited = c.relhassubclass
+WHERE a.attrelid = %s::regclass
+AND a.attnum > 0
+AND NOT a.attisdropped
+ORDER BY a.attnum;
+"""
+
+# 可以计算平均值的数值类型
+AVERAGE_TYPES = {"int2", "int4", "int8", "numeric", "float4", "float8", "money"}
+
+# 没有对应 avg() 聚合、需要先转换为 numeric 的类型
+AVERAGE_CASTS = {"money": "numeric"}
+
+# 只与个别列有关的错误（该列的类型不支持某个聚合或运算），出现时逐列重试；
+# 超时、取消、连接断开等其他错误直接报告，不再重复扫描
+COLUMN_ERROR_CODES = {
+    errorcodes.UNDEFINED_FUNCTION,
+    errorcodes.DATATYPE_MISMATCH,
+    errorcodes.CANNOT_COERCE,
+    errorcodes.INDETERMINATE_DATATYPE,
+}
+
+# 支持排序比较（可计算不同值数量）的类型分类：
+# 布尔、日期时间、枚举、网络地址、数值、字符串、时间间隔、位串
+SORTABLE_CATEGORIES = {"B", "D", "E", "I", "N", "S", "T", "V"}
+
+
+def choose_sampling(
+    estimated_rows: Optional[int], method: str, percent: float
+) -> Optional[Tuple[str, float]]:
+    """确定抽样方式，返回 (SYSTEM/BERNOULLI, 百分比)，不抽样时返回None"""
+    if method == "none":
+        return None
+    if method == "auto":
+        if not estimated_rows or estimated_rows <= ANALYZE_SAMPLE_THRESHOLD:
+            return None
+        method = "system"
+    if percent <= 0:
+        if not estimated_rows:
+            return None
+        percent = ANALYZE_SAMPLE_ROWS * 100 / estimated_rows
+    percent = round(max(0.0001, min(percent, 100.0)), 4)
+    if percent >= 100:
+        return None
+    return method.upper(), percent
+
+
+def distinct_estimate(
+    n_distinct: Optional[float], rows: Optional[int]
+) -> Optional[int]:
+    """按 pg_stats.n_distinct 估算不同值数量，负数表示不同值数量与行数的比例"""
+    if n_distinct is None:
+        return None
+    if n_distinct < 0:
+        return round(-n_distinct * rows) if rows is not None else None
+    return round(n_distinct)
+
+
+def build_column_stats_query(
+    table_name: str,
+    columns: List[Dict[str, Any]],
+    sampling: Optional[Tuple[str, float]] = None,
+    exact_distinct: bool = False,
+) -> Tuple[str, Dict[str, Dict[str, str]]]:
+    """
+    构造单次扫描计算所有列统计量的查询
+
+    exact_distinct 为真时对可排序的列计算 COUNT(DISTINCT)，每列需要额外的排序或哈希，
+    默认不计算，不同值数量改用 pg_stats 的估算。
+    返回 (SQL, {列名: {统计量名: 结果列别名}})。
+    """
+    select_items = ["COUNT(*) AS scanned_rows"]
+    aliases: Dict[str, Dict[str, str]] = {}
+    for i, col in enumerate(columns):
+        ident = col["column_ident"]
+        exprs = {"non_null_count": f"COUNT({ident})"}
+        category = col["type_category"]
+        if exact_distinct and (
+            category in SORTABLE_CATEGORIES or col["base_type"] == "uuid"
+        ):
+            exprs["distinct_count"] = f"COUNT(DISTINCT {ident})"
+        if col["base_type"] in AVERAGE_TYPES:
+            exprs["min_value"] = f"MIN({ident})"
+            exprs["max_value"] = f"MAX({ident})"
+            cast = AVERAGE_CASTS.get(col["base_type"])
+            exprs["avg_value"] = f"AVG({ident}::{cast})" if cast else f"AVG({ident})"
+        elif category in ("D", "T"):
+            exprs["min_value"] = f"MIN({ident})"
+            exprs["max_value"] = f"MAX({ident})"
+        elif category == "S":
+            exprs["min_length"] = f"MIN(length({ident}))"
+            exprs["max_length"] = f"MAX(length({ident}))"
+            exprs["avg_length"] = f"AVG(length({ident}))"
+        elif category == "B":
+            exprs["true_count"] = f"COUNT(*) FILTER (WHERE {ident})"
+
+        aliases[col["column_name"]] = {}
+        for key, expr in exprs.items():
+            alias = f"c{i}_{key}"
+            select_items.append(f"{expr} AS {alias}")
+            aliases[col["column_name"]][key] = alias
+
+    sample_clause = ""
+    if sampling:
+        sample_clause = f" TABLESAMPLE {sampling[0]} ({sampling[1]})"
+    query = (
+        "SELECT\n    "
+        + ",\n    ".join(select_items)
+        + f"\nFROM {table_name}{sample_clause};"
+    )
+    return query, aliases
+
+
+def is_column_error(error: Exception) -> bool:
+    """错误是否只与个别列有关（原始 psycopg2 异常保存在 __cause__ 中）"""
+    return getattr(error.__cause__, "pgcode", None) in COLUMN_ERROR_CODES
+
+
+async def scan_column_stats(
+    table_name: str,
+    columns: List[Dict[str, Any]],
+    sampling: Optional[Tuple[str, float]] = None,
+    exact_distinct: bool = False,
+) -> Tuple[Optional[int], Dict[str, Dict[str, Any]]]:
+    """
+    计算所有列的统计量，返回 (扫描行数, {列名: 统计量})
+
+    先在一次扫描中计算所有列；只有因某列类型不支持某个聚合而失败时才逐列重试，
+    失败的列只返回 error，其余列的统计量照常返回。超时、取消等其他错误直接抛出。
+    """
+    try:
+        query, aliases = build_column_stats_query(
+            table_name, columns, sampling, exact_distinct
+        )
+        scan = (await aexecute_query(query, json_safe=True))[0]
+        return scan["scanned_rows"], {
+            name: {key: scan[alias] for key, alias in column_aliases.items()}
+            for name, column_aliases in aliases.items()
+        }
+    except Exception as e:
+        if len(columns) <= 1 or not is_column_error(e):
+            raise
+
+    scanned_rows = None
+    column_stats: Dict[str, Dict[str, Any]] = {}
+    for col in columns:
+        try:
+            query, aliases = build_column_stats_query(
+                table_name, [col], sampling, exact_distinct
+            )
+            scan = (await aexecute_query(query, json_safe=True))[0]
+        except Exception as e:
+            if not is_column_error(e):
+                raise
+            column_stats[col["column_name"]] = {"error": str(e)}
+            continue
+        if scanned_rows is None:
+            scanned_rows = scan["scanned_rows"]
+        column_stats[col["column_name"]] = {
+            key: scan[alias] for key, alias in aliases[col["column_name"]].items()
+        }
+    return scanned_rows, column_stats
+
+
+# 从 pg_stats 读取每列的统计信息，不扫描表数据
+COLUMN_PROFILE_QUERY = f"""
+SELECT
+    a.attname AS column_name,
+    format_type(a.atttypid, a.atttypmod) AS data_type,
+    NOT a.attnotnull AS nullable,
+    {ESTIMATED_ROWS_SQL} AS estimated_rows,
+    coalesce(st.last_analyze, st.last_autoanalyze) AS last_analyze,
+    s.attname IS NOT NULL AS has_stats,
+    s.null_frac,
+    s.n_distinct,
+    s.avg_width,
+    s.most_common_vals::text::text[] AS most_common_vals,
+    s.most_common_freqs,
+    s.histogram_bounds::text::text[] AS histogram_bounds,
+    s.correlation
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_attribute a
+    ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+LEFT JOIN pg_stat_all_tables st ON st.relid = c.oid
+LEFT JOIN pg_stats s
+    ON s.schemaname = n.nspname
+    AND s.tablename = c.relname
+    AND s.attname = a.attname
+    AND s.inherited = c.relhassubclass
+WHERE c.oid = %s::regclass
+ORDER BY a.attnum;
+"""
+
+
+def build_column_profile(
+    row: Dict[str, Any], estimated_rows: Optional[int], top_n: int
+) -> Dict[str, Any]:
+    """把 pg_stats 的一行整理为列画像"""
+    profile: Dict[str, Any] = {
+        "data_type": row["data_type"],
+        "nullable": row["nullable"],
+    }
+    if not row["has_stats"]:
+        profile["has_stats"] = False
+        return profile
+
+    rows = estimated_rows or 0
+    n_distinct = row["n_distinct"]
+    profile.update(
+        {
+            "null_ratio": round(row["null_frac"], 4),
+            "estimated_null_count": round(row["null_frac"] * rows),
+            "estimated_distinct": distinct_estimate(n_distinct, rows),
+            "is_unique": n_distinct == -1,
+            "avg_width_bytes": row["avg_width"],
+        }
+    )
+    if row["most_common_vals"]:
+        profile["most_common_values"] = [
+            {"value": value, "frequency": round(freq, 4)}
+            for value, freq in list(
+                zip(row["most_common_vals"], row["most_common_freqs"])
+            )[:top_n]
+        ]
+    bounds = row["histogram_bounds"]
+    if bounds:
+        last = len(bounds) - 1
+        profile["histogram"] = {
+            "min": bounds[0],
+            "p25": bounds[last // 4],
+            "median": bounds[last // 2],
+            "p75": bounds[last * 3 // 4],
+            "max": bounds[last],
+            "buckets": last,
+        }
+    if row["correlation"] is not None:
+        # 物理顺序与逻辑顺序的相关性，接近±1时范围查询适合使用索引
+        profile["correlation"] = round(row["correlation"], 4)
+    return profile
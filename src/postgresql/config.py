@@ -0,0 +1,204 @@
+"""
+服务器配置
+
+连接参数、连接池、超时、缓存、代价检查、导出、运行指标与准入控制等设置，均来自环境变量。
+"""
+
+import json
+import os
+import tempfile
+from typing import Dict
+
+
+# 数据库连接配置
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "5432")),
+    "database": os.getenv("DB_NAME", "postgres"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+}
+
+# 多数据库配置文件（JSON），未配置时只服务上面 DB_* 环境变量指定的数据库
+DB_CONFIG_FILE = os.getenv("DB_CONFIG_FILE", "")
+
+# 只读副本列表（逗号分隔），每项为 host[:port] 或连接串/URI，未指定的参数沿用 DB_CONFIG
+DB_REPLICAS = [
+    item.strip() for item in os.getenv("DB_REPLICAS", "").split(",") if item.strip()
+]
+
+# 只读副本路由配置
+REPLICA_CONFIG = {
+    # 负载均衡策略：round_robin、least_connections 或 lag_aware
+    "strategy": os.getenv("DB_REPLICA_STRATEGY", "round_robin"),
+    # 复制延迟超过该秒数的副本暂不使用（0表示不限制）
+    "max_lag": float(os.getenv("DB_REPLICA_MAX_LAG", "30")),
+    # 检查副本可用性与复制延迟的间隔秒数
+    "check_interval": float(os.getenv("DB_REPLICA_HEALTH_CHECK_INTERVAL", "10")),
+    # 所有副本都不可用时是否回退到主库
+    "fallback_to_primary": os.getenv("DB_REPLICA_FALLBACK_TO_PRIMARY", "true").lower()
+    in ("1", "true", "yes"),
+}
+
+
+# 连接池配置
+POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    # 空闲超过该秒数的连接将被关闭（保留min_size个）
+    "idle_timeout": float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300")),
+    # 连接最大存活秒数，超过后在归还或借出时被替换
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+    # 借出连接时的最长等待秒数
+    "checkout_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    # 空闲超过该秒数的连接在借出前执行 SELECT 1 健康检查（0表示每次都检查）
+    "health_check_interval": float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "10")),
+}
+
+# 会话级超时（毫秒，0表示不限制），建立连接时设置，避免查询、锁等待或空闲事务无限期占用后端
+DB_TIMEOUTS = {
+    "statement_timeout": int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000")),
+    "lock_timeout": int(os.getenv("DB_LOCK_TIMEOUT_MS", "5000")),
+    "idle_in_transaction_session_timeout": int(
+        os.getenv("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", "60000")
+    ),
+}
+
+# 按工具覆盖超时的JSON对象，如 {"analyze_table_stats": {"statement_timeout": 120000}}
+TOOL_TIMEOUTS: Dict[str, Dict[str, int]] = {
+    tool: {name: int(value) for name, value in timeouts.items() if name in DB_TIMEOUTS}
+    for tool, timeouts in json.loads(os.getenv("DB_TOOL_TIMEOUTS") or "{}").items()
+}
+
+# 执行阻塞数据库调用的线程数，默认与连接池最大连接数一致
+DB_EXECUTOR_WORKERS = int(
+    os.getenv("DB_EXECUTOR_WORKERS", str(POOL_CONFIG["max_size"]))
+)
+
+# execute_readonly_query 默认返回行数与允许的最大返回行数
+QUERY_DEFAULT_ROWS = 100
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "1000"))
+
+# 分页游标配置
+CURSOR_CONFIG = {
+    # 游标空闲超过该秒数后被回收
+    "ttl": float(os.getenv("QUERY_CURSOR_TTL", "300")),
+    # 每个MCP会话最多同时打开的游标数，超出时关闭该会话最久未使用的游标
+    "max_per_session": int(os.getenv("QUERY_CURSOR_MAX_PER_SESSION", "3")),
+    # 全局最多同时打开的游标数（每个游标占用一个连接），默认为连接池上限的一半
+    "max_open": int(
+        os.getenv(
+            "QUERY_CURSOR_MAX_OPEN", str(max(1, POOL_CONFIG["max_size"] // 2))
+        )
+    ),
+}
+
+# 快照会话配置
+SNAPSHOT_SESSION_CONFIG = {
+    # 会话空闲超过该秒数后自动关闭并归还连接
+    "idle_timeout": float(os.getenv("SNAPSHOT_SESSION_IDLE_TIMEOUT", "300")),
+    # 最多同时打开的快照会话数（每个会话占用一个连接），默认为连接池上限的四分之一
+    "max_open": int(
+        os.getenv(
+            "SNAPSHOT_SESSION_MAX_OPEN", str(max(1, POOL_CONFIG["max_size"] // 4))
+        )
+    ),
+}
+
+# 模式元数据缓存配置
+SCHEMA_CACHE_CONFIG = {
+    "max_entries": int(os.getenv("SCHEMA_CACHE_MAX_ENTRIES", "1024")),
+    # 缓存条目的最长存活秒数
+    "ttl": float(os.getenv("SCHEMA_CACHE_TTL", "600")),
+    # 检查系统目录版本的最小间隔秒数
+    "check_interval": float(os.getenv("SCHEMA_CACHE_CHECK_INTERVAL", "5")),
+    # 可选：DDL事件触发器发送通知的频道，配置后通过LISTEN即时失效缓存
+    "notify_channel": os.getenv("SCHEMA_CACHE_NOTIFY_CHANNEL", ""),
+}
+
+# 查询结果缓存配置（默认关闭）
+QUERY_CACHE_CONFIG = {
+    "enabled": os.getenv("QUERY_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"),
+    "ttl": float(os.getenv("QUERY_CACHE_TTL", "60")),
+    # 所有缓存结果占用的总字节数上限
+    "max_bytes": int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+}
+
+# 返回给客户端的单个文本/bytea值的最大字符数，超出部分截断为预览（0表示不限制）
+QUERY_VALUE_MAX_CHARS = int(os.getenv("QUERY_VALUE_MAX_CHARS", "2000"))
+
+# 单次响应的字节数上限，超出时截断结果行（0表示不限制）
+RESPONSE_MAX_BYTES = int(os.getenv("RESPONSE_MAX_BYTES", "262144"))
+
+# 精确行数统计（COUNT(*)）的超时毫秒数
+EXACT_COUNT_TIMEOUT_MS = int(os.getenv("EXACT_COUNT_TIMEOUT_MS", "5000"))
+
+# 列统计抽样配置：估算行数超过阈值时自动使用 TABLESAMPLE，抽样目标行数约为 ANALYZE_SAMPLE_ROWS
+ANALYZE_SAMPLE_THRESHOLD = int(os.getenv("ANALYZE_SAMPLE_THRESHOLD", "1000000"))
+ANALYZE_SAMPLE_ROWS = int(os.getenv("ANALYZE_SAMPLE_ROWS", "100000"))
+
+# 执行前的 EXPLAIN 代价检查。代价按实际读取的行数折算（与LIMIT的估算方式一致）
+COST_GUARD_CONFIG = {
+    # 估算代价上限（0表示不检查）
+    "max_cost": float(os.getenv("QUERY_MAX_COST", "1000000")),
+    # 任一计划节点的估算行数上限，可拦截意外的笛卡尔积（0表示不检查）
+    "max_plan_rows": int(os.getenv("QUERY_MAX_PLAN_ROWS", "0")),
+    # 超过阈值时的处理：reject（拒绝执行）或 rewrite（改写为LIMIT或TABLESAMPLE抽样查询）
+    "action": os.getenv("QUERY_COST_GUARD_ACTION", "reject").lower(),
+}
+
+# execute_readonly_batch 配置
+BATCH_CONFIG = {
+    # 单次批量调用最多包含的语句数
+    "max_statements": int(os.getenv("QUERY_BATCH_MAX_STATEMENTS", "20")),
+    # 并发模式下同时占用的连接数，避免一次批量调用占满连接池
+    "concurrency": int(os.getenv("QUERY_BATCH_CONCURRENCY", "4")),
+}
+
+# 查询结果导出配置
+EXPORT_CONFIG = {
+    # 导出文件所在的目录
+    "dir": os.getenv(
+        "QUERY_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "pg_mcp_exports")
+    ),
+    # 单次导出的最大数据量（未压缩的CSV字节数，0表示不限制）
+    "max_bytes": int(os.getenv("QUERY_EXPORT_MAX_BYTES", str(1024 * 1024 * 1024))),
+    # 导出文件的保留秒数，过期文件在下一次导出时删除（0表示不删除）
+    "ttl": float(os.getenv("QUERY_EXPORT_TTL", "86400")),
+    # 导出查询的估算代价上限（0表示不限制）。导出本来就要读取全部结果，
+    # 不套用交互查询的 QUERY_MAX_COST，数据量由 max_bytes 限制
+    "max_cost": float(os.getenv("QUERY_EXPORT_MAX_COST", "0")),
+    # 导出查询的 statement_timeout（毫秒，0表示不限制）。导出要读完整个结果，
+    # 不套用交互查询的 DB_STATEMENT_TIMEOUT_MS
+    "statement_timeout_ms": int(os.getenv("QUERY_EXPORT_STATEMENT_TIMEOUT_MS", "0")),
+}
+
+# export_query 默认使用导出超时，DB_TOOL_TIMEOUTS 中显式配置的值优先
+TOOL_TIMEOUTS.setdefault("export_query", {}).setdefault(
+    "statement_timeout", EXPORT_CONFIG["statement_timeout_ms"]
+)
+
+# 运行指标直方图的分桶上界
+METRICS_CONFIG = {
+    # 耗时（秒）
+    "latency_buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    # 响应大小（字节）
+    "bytes_buckets": tuple(256 * 4**i for i in range(9)),
+}
+
+# HTTP 模式下工具调用的准入控制（stdio 模式不启用）
+ADMISSION_CONFIG = {
+    # 同时执行的工具调用数上限，默认与数据库线程数相同
+    "max_active": int(os.getenv("HTTP_MAX_CONCURRENCY", str(DB_EXECUTOR_WORKERS))),
+    # 每个客户端同时执行的工具调用数上限
+    "client_max_active": int(os.getenv("HTTP_CLIENT_MAX_CONCURRENCY", "2")),
+    # 所有客户端排队的调用总数上限，超出时立即拒绝
+    "max_queued": int(os.getenv("HTTP_MAX_QUEUE", str(4 * DB_EXECUTOR_WORKERS))),
+    # 每个客户端排队的调用数上限
+    "client_max_queued": int(os.getenv("HTTP_CLIENT_MAX_QUEUE", "4")),
+    # 排队的最长秒数，预计等待时间超过该值时立即拒绝
+    "queue_timeout": float(os.getenv("HTTP_QUEUE_TIMEOUT", "10")),
+    # 标识客户端的请求头，未提供时按客户端地址区分
+    "client_header": os.getenv("HTTP_CLIENT_ID_HEADER", "x-client-id").lower(),
+}
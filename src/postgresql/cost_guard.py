@@ -0,0 +1,297 @@
+"""
+执行计划检查
+
+执行前用 EXPLAIN 估算代价，超过阈值时拒绝或改写为 LIMIT / TABLESAMPLE 查询，并生成计划摘要。
+"""
+
+import re
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from .config import COST_GUARD_CONFIG
+from .db import aexecute_query
+from .query_cache import TABLE_REFERENCE_PATTERN
+
+
+# === 执行计划检查 ===
+
+# 超过该估算行数的表视为大表，对其顺序扫描会在计划摘要中提示
+LARGE_TABLE_ROWS = 100000
+
+# 表引用之后出现这些关键字时说明表没有别名
+NON_ALIAS_KEYWORDS = set(
+    "where join inner left right full cross natural on using group order limit "
+    "offset fetch for union intersect except having window tablesample lateral".split()
+)
+
+TABLE_REFERENCE_PATTERN_CI = re.compile(TABLE_REFERENCE_PATTERN.pattern, re.IGNORECASE)
+TABLE_ALIAS_PATTERN = re.compile(r"\s+(?:as\s+)?(\"[^\"]+\"|[a-z_][\w$]*)", re.IGNORECASE)
+
+# 按正则改写表引用无法正确处理的结构：字符串常量、$$常量、注释、
+# 参数中带 FROM 的函数（如 extract(year FROM d)）、IS DISTINCT FROM，以及含空白的带引号标识符
+SAMPLING_UNSAFE_PATTERN = re.compile(
+    r"'|\$|--|/\*|\b(?:extract|substring|position|trim|overlay)\s*\("
+    r"|\bdistinct\s+from\b|\"[^\"]*\s[^\"]*\"",
+    re.IGNORECASE,
+)
+
+
+def check_readonly_sql(sql: str) -> Optional[str]:
+    """检查是否为只读查询，不是时返回错误信息"""
+    sql_upper = sql.strip().upper()
+    readonly_keywords = ["SELECT", "WITH"]
+    forbidden_keywords = [
+        "INSERT",
+        "UPDATE",
+        "DELETE",
+        "DROP",
+        "CREATE",
+        "ALTER",
+        "TRUNCATE",
+    ]
+
+    if not any(sql_upper.startswith(keyword) for keyword in readonly_keywords):
+        return "错误: 只支持SELECT和WITH查询语句"
+
+    if any(keyword in sql_upper for keyword in forbidden_keywords):
+        return "错误: 不允许执行修改数据的SQL语句"
+    return None
+
+
+async def explain_plan(sql: str, verbose: bool = False) -> Dict[str, Any]:
+    """执行 EXPLAIN（不带ANALYZE，不会真正执行查询）并返回根计划节点"""
+    options = "FORMAT JSON, VERBOSE" if verbose else "FORMAT JSON"
+    rows = await aexecute_query(f"EXPLAIN ({options}) {sql}")
+    return rows[0]["QUERY PLAN"][0]["Plan"]
+
+
+def iter_plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """深度优先遍历计划节点"""
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from iter_plan_nodes(child)
+
+
+def effective_cost(plan: Dict[str, Any], rows_needed: int) -> float:
+    """
+    只读取前 rows_needed 行的估算代价
+
+    与优化器估算 LIMIT 的方式相同：启动代价加上按行数比例折算的剩余代价。
+    排序、聚合等需要先处理全部输入的计划启动代价本身就很高，不会被低估。
+    """
+    startup, total = plan["Startup Cost"], plan["Total Cost"]
+    fraction = min(1.0, rows_needed / max(plan["Plan Rows"], 1))
+    return startup + (total - startup) * fraction
+
+
+def cost_violation(
+    plan: Dict[str, Any],
+    rows_needed: int,
+    max_cost: Optional[float] = None,
+    max_plan_rows: Optional[int] = None,
+) -> Optional[str]:
+    """计划超过代价或行数阈值时返回原因，阈值默认取 COST_GUARD_CONFIG"""
+    if max_cost is None:
+        max_cost = COST_GUARD_CONFIG["max_cost"]
+    if max_plan_rows is None:
+        max_plan_rows = COST_GUARD_CONFIG["max_plan_rows"]
+    if max_cost:
+        cost = effective_cost(plan, rows_needed)
+        if cost > max_cost:
+            return f"估算代价 {cost:.0f} 超过上限 {max_cost:.0f}"
+    if max_plan_rows:
+        node = max(iter_plan_nodes(plan), key=lambda n: n["Plan Rows"])
+        if node["Plan Rows"] > max_plan_rows:
+            return (
+                f"计划节点 {node['Node Type']} 的估算行数 {node['Plan Rows']} "
+                f"超过上限 {max_plan_rows}"
+            )
+    return None
+
+
+def strip_statement(sql: str) -> str:
+    """去掉末尾的分号，便于把查询嵌入其他语句"""
+    return sql.strip().rstrip(";").rstrip()
+
+
+def wrap_limit(sql: str, limit: int) -> str:
+    """用 LIMIT 包装查询，让优化器选择尽快返回前几行的计划"""
+    return f"SELECT * FROM (\n{strip_statement(sql)}\n) AS limited_query LIMIT {int(limit)}"
+
+
+def add_tablesample(sql: str, tables: Set[str], percent: float) -> str:
+    """
+    把对指定表的引用替换为 TABLESAMPLE SYSTEM 抽样子查询
+
+    原有别名保留为子查询别名，没有别名时以表名作为别名，其余列引用不受影响。
+    查询中有无法安全改写的结构，或以 模式.表.列 的形式引用抽样表的列时，原样返回。
+    """
+    if SAMPLING_UNSAFE_PATTERN.search(sql):
+        return sql
+    for table in tables:
+        name = re.escape(table)
+        if re.search(rf'\.\s*(?:"{name}"|{name})\s*\.', sql, re.IGNORECASE):
+            return sql
+
+    def replace(match: "re.Match[str]") -> str:
+        reference = match.group(1)
+        name = re.split(r"\s*\.\s*", reference)[-1]
+        bare = name.strip('"') if name.startswith('"') else name.lower()
+        if bare not in tables:
+            return match.group(0)
+        keyword = match.group(0)[: match.start(1) - match.start(0)]
+        sampled = f"(SELECT * FROM {reference} TABLESAMPLE SYSTEM ({percent:g}))"
+        alias = TABLE_ALIAS_PATTERN.match(sql, match.end())
+        if alias is None or alias.group(1).lower() in NON_ALIAS_KEYWORDS:
+            sampled += f" AS {name}"
+        return keyword + sampled
+
+    return TABLE_REFERENCE_PATTERN_CI.sub(replace, sql)
+
+
+def sampled_tables(plan: Dict[str, Any]) -> Set[str]:
+    """代价占比较大的顺序扫描所涉及的表，作为抽样改写的对象"""
+    threshold = plan["Total Cost"] * 0.1
+    return {
+        node["Relation Name"]
+        for node in iter_plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan" and node["Total Cost"] >= threshold
+    }
+
+
+async def apply_cost_guard(
+    sql: str, max_rows: int, allow_limit: bool = True
+) -> Tuple[Optional[str], str, Optional[Dict[str, Any]]]:
+    """
+    执行前用 EXPLAIN 检查查询代价
+
+    返回 (错误信息, 实际执行的SQL, 改写说明)。超过阈值时按配置拒绝，
+    或依次尝试用 LIMIT 包装、对大表 TABLESAMPLE 抽样，改写后仍超限则拒绝。
+    """
+    if not (COST_GUARD_CONFIG["max_cost"] or COST_GUARD_CONFIG["max_plan_rows"]):
+        return None, sql, None
+    rows_needed = max_rows + 1
+    plan = await explain_plan(sql)
+    reason = cost_violation(plan, rows_needed)
+    if reason is None:
+        return None, sql, None
+
+    original_cost = round(effective_cost(plan, rows_needed), 2)
+    if COST_GUARD_CONFIG["action"] == "rewrite":
+        if allow_limit:
+            limited = wrap_limit(sql, rows_needed)
+            limited_plan = await explain_plan(limited)
+            if cost_violation(limited_plan, rows_needed) is None:
+                return None, limited, {
+                    "rewrite": "limit",
+                    "estimated_cost": original_cost,
+                    "rewritten_cost": limited_plan["Total Cost"],
+                }
+
+        tables = sampled_tables(plan)
+        percent = 100.0
+        current = plan
+        # 抽样页按随机读计算代价，代价与抽样比例并非线性，按改写后的估算逐步收紧
+        for _ in range(4):
+            if not tables:
+                break
+            ratio = 0.8 * COST_GUARD_CONFIG["max_cost"] / max(
+                effective_cost(current, rows_needed), 1
+            )
+            percent = max(0.01, min(100.0, float(f"{percent * ratio:.2g}")))
+            sampled = add_tablesample(sql, tables, percent)
+            if sampled == sql:
+                break
+            try:
+                current = await explain_plan(sampled)
+            except Exception:
+                break
+            if cost_violation(current, rows_needed) is None:
+                return None, sampled, {
+                    "rewrite": "tablesample",
+                    "sample_percent": percent,
+                    "sampled_tables": sorted(tables),
+                    "estimated_cost": original_cost,
+                    "rewritten_cost": round(effective_cost(current, rows_needed), 2),
+                    "note": "结果来自抽样数据，聚合值需按抽样比例换算",
+                }
+
+    return (
+        f"错误: 查询的{reason}，已拒绝执行。"
+        "请使用 explain_query 查看执行计划，添加过滤条件、利用索引或缩小查询范围后重试",
+        sql,
+        None,
+    )
+
+
+def describe_table(node: Dict[str, Any]) -> str:
+    """计划节点所扫描的表，VERBOSE计划中带模式名"""
+    if "Schema" in node:
+        return f"{node['Schema']}.{node['Relation Name']}"
+    return node["Relation Name"]
+
+
+def summarize_plan(
+    plan: Dict[str, Any], rows_needed: int, table_rows: Dict[str, Any]
+) -> Dict[str, Any]:
+    """提取计划中对优化查询有用的部分：顺序扫描、使用的索引、连接和排序，以及潜在问题"""
+    seq_scans, index_scans, joins, sorts, warnings = [], [], [], [], []
+    for node in iter_plan_nodes(plan):
+        node_type = node["Node Type"]
+        if node_type == "Seq Scan":
+            table = describe_table(node)
+            scan = {"table": table, "estimated_rows": node["Plan Rows"]}
+            if table in table_rows:
+                scan["table_rows"] = table_rows[table]
+            if "Filter" in node:
+                scan["filter"] = node["Filter"]
+            seq_scans.append(scan)
+            if (table_rows.get(table) or 0) >= LARGE_TABLE_ROWS:
+                warnings.append(
+                    f"对大表 {table}（约 {table_rows[table]} 行）执行顺序扫描"
+                    + ("，过滤条件没有可用的索引" if "Filter" in node else "")
+                )
+        elif "Index Name" in node:
+            scan = {
+                "index": node["Index Name"],
+                "scan_type": node_type,
+                "estimated_rows": node["Plan Rows"],
+            }
+            if "Relation Name" in node:
+                scan["table"] = describe_table(node)
+            if "Index Cond" in node:
+                scan["condition"] = node["Index Cond"]
+            index_scans.append(scan)
+        elif node_type in ("Nested Loop", "Hash Join", "Merge Join"):
+            join = {
+                "type": node_type,
+                "join_type": node.get("Join Type"),
+                "estimated_rows": node["Plan Rows"],
+            }
+            condition = (
+                node.get("Hash Cond") or node.get("Merge Cond") or node.get("Join Filter")
+            )
+            if condition:
+                join["condition"] = condition
+            joins.append(join)
+            if node_type == "Nested Loop" and not condition and not any(
+                "Index Cond" in child for child in iter_plan_nodes(node["Plans"][1])
+            ):
+                warnings.append(
+                    f"存在没有连接条件的嵌套循环（估算 {node['Plan Rows']} 行），可能是意外的笛卡尔积"
+                )
+        elif node_type in ("Sort", "Incremental Sort"):
+            sorts.append({"sort_key": node.get("Sort Key"), "estimated_rows": node["Plan Rows"]})
+
+    summary = {
+        "top_node": plan["Node Type"],
+        "startup_cost": plan["Startup Cost"],
+        "total_cost": plan["Total Cost"],
+        "estimated_rows": plan["Plan Rows"],
+        "effective_cost": round(effective_cost(plan, rows_needed), 2),
+        "seq_scans": seq_scans,
+        "index_scans": index_scans,
+        "joins": joins,
+        "sorts": sorts,
+        "warnings": warnings,
+    }
+    return {key: value for key, value in summary.items() if value != []}
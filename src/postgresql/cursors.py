@@ -0,0 +1,364 @@
+"""
+分页
+
+服务端游标在页与页之间保持打开；有主键的表改用keyset续页令牌，不占用连接。
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from .config import CURSOR_CONFIG, QUERY_DEFAULT_ROWS
+from .db import (
+    RAW_COLUMN_PREFIX,
+    current_database,
+    decode_rows,
+    execute_query,
+    get_pool,
+    new_cursor_name,
+    register_text_passthrough,
+)
+from .pool import _cancel_scope, apply_timeouts
+from .session import on_session_close
+
+
+# === 分页：服务端游标与keyset续页令牌 ===
+
+
+class HeldCursor:
+    """被保留用于分页的服务端游标及其占用的连接"""
+
+    def __init__(self, token: str, session: str, pool, conn, cursor, query: str):
+        self.token = token
+        self.session = session
+        # 连接所属的连接池，回收线程中没有当前数据库上下文，归还时使用
+        self.pool = pool
+        self.conn = conn
+        self.cursor = cursor
+        self.query = query
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.rows_fetched = 0
+        # 预读的一行，用于判断是否还有下一页
+        self.lookahead: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def fetch_page(self, page_size: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """读取下一页，返回 (结果行, 是否还有更多行)"""
+        fetched = self.cursor.fetchmany(page_size + 1 - len(self.lookahead))
+        rows = self.lookahead + decode_rows(self.cursor.description, fetched)
+        self.lookahead = rows[page_size:]
+        self.rows_fetched += min(len(rows), page_size)
+        self.last_used = time.monotonic()
+        return rows[:page_size], bool(self.lookahead)
+
+
+class CursorRegistry:
+    """
+    分页游标注册表
+
+    每个令牌对应一个在事务中保持打开的服务端游标，后续翻页直接 FETCH 而不重新执行查询。
+    空闲超过TTL的游标由后台线程回收，并限制每个会话及全局的游标数量。
+    """
+
+    def __init__(self, ttl: float = 300, max_per_session: int = 3, max_open: int = 5):
+        self.ttl = ttl
+        self.max_per_session = max(1, max_per_session)
+        self.max_open = max(1, max_open)
+        self._entries: Dict[str, HeldCursor] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._counters = {"opened": 0, "closed": 0, "expired": 0, "evicted": 0}
+
+    def _release(self, entry: HeldCursor) -> None:
+        with entry.lock:
+            try:
+                entry.cursor.close()
+            except psycopg2.Error:
+                pass
+            entry.pool.putconn(entry.conn)
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(
+                target=self._reap_loop, name="pg-cursor-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        interval = max(1.0, min(self.ttl / 2, 30.0))
+        while True:
+            time.sleep(interval)
+            self.reap()
+
+    def reap(self) -> int:
+        """关闭空闲超过TTL的游标，返回关闭的数量"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                self._entries.pop(token)
+                for token, entry in list(self._entries.items())
+                if now - entry.last_used > self.ttl and not entry.lock.locked()
+            ]
+            self._counters["expired"] += len(expired)
+        for entry in expired:
+            self._release(entry)
+        return len(expired)
+
+    def _evict_for(self, session: str) -> List[HeldCursor]:
+        """为新游标腾出位置（调用方需持有锁）"""
+        evicted = []
+        owned = sorted(
+            (e for e in self._entries.values() if e.session == session),
+            key=lambda e: e.last_used,
+        )
+        while len(owned) >= self.max_per_session:
+            evicted.append(self._entries.pop(owned.pop(0).token))
+        if len(self._entries) >= self.max_open:
+            for entry in sorted(self._entries.values(), key=lambda e: e.last_used):
+                evicted.append(self._entries.pop(entry.token))
+                if len(self._entries) < self.max_open:
+                    break
+        self._counters["evicted"] += len(evicted)
+        return evicted
+
+    def open(
+        self,
+        session: str,
+        query: str,
+        params: Optional[tuple] = None,
+        page_size: int = QUERY_DEFAULT_ROWS,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """执行查询并返回第一页；还有更多行时保留游标并返回续页令牌"""
+        with self._lock:
+            evicted = self._evict_for(session)
+        for entry in evicted:
+            self._release(entry)
+
+        pool = get_pool()
+        conn = pool.getconn()
+        token = "c." + secrets.token_urlsafe(18)
+        try:
+            # 游标在页与页之间处于空闲事务中，由回收线程按TTL关闭，不受空闲事务超时限制
+            apply_timeouts(
+                conn,
+                idle_in_transaction_session_timeout=int((self.ttl + 60) * 1000),
+            )
+            cursor = conn.cursor(name=new_cursor_name())
+            register_text_passthrough(cursor)
+            cursor.itersize = page_size + 1
+            cursor.execute(query, params)
+            entry = HeldCursor(token, session, pool, conn, cursor, query)
+            rows, has_more = entry.fetch_page(page_size)
+        except psycopg2.Error as e:
+            pool.putconn(conn, discard=conn.closed != 0)
+            raise Exception(f"SQL查询执行失败: {e}") from e
+
+        if not has_more:
+            cursor.close()
+            pool.putconn(conn)
+            return rows, None
+
+        # 连接由游标继续持有，不再随本次调用一起取消
+        scope = _cancel_scope.get()
+        if scope is not None:
+            scope.detach(conn)
+
+        with self._lock:
+            self._entries[token] = entry
+            self._counters["opened"] += 1
+        self._ensure_reaper()
+        return rows, token
+
+    def fetch(
+        self, session: str, token: str, page_size: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[str], int]:
+        """读取令牌对应游标的下一页，返回 (结果行, 下一页令牌, 已读取的行数)"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry.session != session:
+                raise Exception("分页令牌无效或已过期，请重新执行查询")
+            # 占用游标期间不会被回收
+            entry.lock.acquire()
+        # 读取期间请求被取消时同样取消游标连接上的 FETCH
+        scope = _cancel_scope.get()
+        if scope is not None:
+            scope.attach(entry.pool, entry.conn)
+        try:
+            rows, has_more = entry.fetch_page(page_size)
+        except psycopg2.Error as e:
+            entry.lock.release()
+            self.close(session, token)
+            raise Exception(f"读取下一页失败: {e}")
+        finally:
+            if scope is not None:
+                scope.detach(entry.conn)
+        entry.lock.release()
+        if not has_more:
+            self.close(session, token)
+            return rows, None, entry.rows_fetched
+        return rows, token, entry.rows_fetched
+
+    def unread(self, session: str, token: str, rows: List[Dict[str, Any]]) -> None:
+        """把未返回给客户端的行放回游标，下一页从这些行开始"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry.session != session or not rows:
+                return
+        with entry.lock:
+            entry.lookahead = rows + entry.lookahead
+            entry.rows_fetched -= len(rows)
+
+    def close(self, session: str, token: str) -> bool:
+        """关闭令牌对应的游标并归还连接"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry.session != session:
+                return False
+            del self._entries[token]
+            self._counters["closed"] += 1
+        self._release(entry)
+        return True
+
+    def close_session(self, session: str) -> int:
+        """关闭MCP会话的所有游标，返回关闭的数量"""
+        with self._lock:
+            owned = [
+                self._entries.pop(token)
+                for token, entry in list(self._entries.items())
+                if entry.session == session
+            ]
+            self._counters["closed"] += len(owned)
+        for entry in owned:
+            self._release(entry)
+        return len(owned)
+
+    def stats(self) -> Dict[str, Any]:
+        """游标统计信息"""
+        with self._lock:
+            sessions = {e.session for e in self._entries.values()}
+            return {
+                "open": len(self._entries),
+                "sessions": len(sessions),
+                "ttl": self.ttl,
+                "max_per_session": self.max_per_session,
+                "max_open": self.max_open,
+                **self._counters,
+            }
+
+
+cursor_registry = CursorRegistry(**CURSOR_CONFIG)
+on_session_close(cursor_registry.close_session)
+
+
+# 续页令牌的签名密钥，每个进程随机生成；令牌中的表名和主键列会拼入SQL，必须防止客户端篡改
+_KEYSET_SECRET = secrets.token_bytes(32)
+
+
+def _sign_keyset_payload(payload: bytes) -> str:
+    digest = hmac.new(_KEYSET_SECRET, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode("ascii")
+
+
+def encode_keyset_token(state: Dict[str, Any]) -> str:
+    """把keyset分页状态编码为带签名的不透明令牌"""
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":"), default=str)
+    payload = base64.urlsafe_b64encode(raw.encode("utf-8"))
+    return f"k.{payload.decode('ascii')}.{_sign_keyset_payload(payload)}"
+
+
+def decode_keyset_token(token: str) -> Dict[str, Any]:
+    """解析keyset分页令牌，签名不匹配（被篡改或由其他进程生成）时拒绝"""
+    try:
+        payload, signature = token[2:].rsplit(".", 1)
+        payload_bytes = payload.encode("ascii")
+    except (ValueError, UnicodeEncodeError):
+        raise Exception("分页令牌格式错误")
+    if not hmac.compare_digest(signature, _sign_keyset_payload(payload_bytes)):
+        raise Exception("分页令牌无效或已过期，请重新执行查询")
+    try:
+        state = json.loads(base64.urlsafe_b64decode(payload_bytes))
+        if not {"t", "k", "v", "n"} <= state.keys():
+            raise ValueError(token)
+        return state
+    except Exception:
+        raise Exception("分页令牌格式错误")
+
+
+def resolve_table_name(table_name: str) -> str:
+    """通过 regclass 解析表名，返回规范的（已加引号、必要时带模式的）标识符"""
+    rows = execute_query(
+        "SELECT %s::regclass::text AS table_name;",
+        (table_name,),
+        prepared="mcp_resolve_table_name",
+    )
+    return rows[0]["table_name"]
+
+
+def get_primary_key_columns(table_name: str) -> List[str]:
+    """获取表主键列（已加引号的标识符），无主键时返回空列表"""
+    query = """
+    SELECT quote_ident(a.attname) AS column_name
+    FROM pg_index i
+    JOIN pg_attribute a
+        ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+    WHERE i.indrelid = %s::regclass
+    AND i.indisprimary
+    ORDER BY array_position(i.indkey::int2[], a.attnum);
+    """
+    rows = execute_query(query, (table_name,), prepared="mcp_primary_key_columns")
+    return [row["column_name"] for row in rows]
+
+
+def keyset_next_token(
+    table_name: str, key_columns: List[str], key_values: List[Any], limit: int
+) -> str:
+    """生成从指定主键值之后继续读取的令牌"""
+    return encode_keyset_token(
+        {
+            "d": current_database().name,
+            "t": table_name,
+            "k": key_columns,
+            "v": key_values,
+            "n": limit,
+        }
+    )
+
+
+def fetch_keyset_page(
+    table_name: str,
+    key_columns: List[str],
+    limit: int,
+    after: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], List[List[Any]], bool]:
+    """按主键顺序读取一页数据，返回 (结果行, 每行的主键值, 是否还有更多行)"""
+    keys = ", ".join(key_columns)
+    key_aliases = ", ".join(
+        f"{col} AS {RAW_COLUMN_PREFIX}{i}" for i, col in enumerate(key_columns)
+    )
+    where = ""
+    params: List[Any] = []
+    if after is not None:
+        where = f"WHERE ({keys}) > ({', '.join(['%s'] * len(after))})"
+        params.extend(after)
+    params.append(limit + 1)
+    query = (
+        f"SELECT {key_aliases}, * FROM {table_name} {where} "
+        f"ORDER BY {keys} LIMIT %s;"
+    )
+    rows = execute_query(query, tuple(params), json_safe=True)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    keys = [
+        [row.pop(f"{RAW_COLUMN_PREFIX}{i}") for i in range(len(key_columns))]
+        for row in rows
+    ]
+    return rows, keys, has_more
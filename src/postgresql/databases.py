@@ -0,0 +1,201 @@
+"""
+多数据库
+
+已配置的数据库及其连接池、元数据缓存与搜索索引，以及按工具参数选择数据库的装饰器。
+"""
+
+import functools
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import psycopg2.extensions
+
+from .config import (
+    DB_CONFIG,
+    DB_CONFIG_FILE,
+    DB_REPLICAS,
+    POOL_CONFIG,
+    REPLICA_CONFIG,
+    SCHEMA_CACHE_CONFIG,
+)
+from .db import register_databases, use_database
+from .pool import ConnectionPool, ReplicaRouter, connect_database, create_pool
+from .query_cache import query_cache
+from .schema_cache import SchemaCache
+from .search import SchemaSearchIndex
+from .session import session_key
+from .snapshot_sessions import snapshot_sessions, use_snapshot_session
+
+
+# === 多数据库 ===
+
+
+class Database:
+    """
+    一个已配置的数据库
+
+    持有连接参数、连接池和该库的元数据缓存与搜索索引。
+    连接池在第一次访问时才创建，未使用的数据库不占用任何连接。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        config: Dict[str, Any],
+        pool_config: Optional[Dict[str, Any]] = None,
+        replicas: Optional[List[str]] = None,
+        replica_settings: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.config = config
+        self.pool_config = {**POOL_CONFIG, **(pool_config or {})}
+        self.replicas = replicas or []
+        self.replica_settings = {**REPLICA_CONFIG, **(replica_settings or {})}
+        self._pool: Optional[Union[ConnectionPool, ReplicaRouter]] = None
+        self._lock = threading.Lock()
+        self.schema_cache = SchemaCache(
+            **SCHEMA_CACHE_CONFIG, connect=functools.partial(connect_database, config)
+        )
+        self.search_index = SchemaSearchIndex(SCHEMA_CACHE_CONFIG["check_interval"])
+        # 表结构变化后缓存的查询结果可能不再正确
+        self.schema_cache.add_invalidation_hook(query_cache.clear)
+        # DDL通知或版本变化时立即检查哪些模式需要重建
+        self.schema_cache.add_invalidation_hook(self.search_index.mark_stale)
+
+    @property
+    def initialized(self) -> bool:
+        """连接池是否已经创建"""
+        return self._pool is not None
+
+    @property
+    def pool(self) -> Union[ConnectionPool, ReplicaRouter]:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = create_pool(
+                        self.config, self.pool_config, self.replicas, self.replica_settings
+                    )
+        return self._pool
+
+    def describe(self) -> Dict[str, Any]:
+        """不含密码的连接信息"""
+        return {
+            "host": self.config.get("host"),
+            "port": self.config.get("port"),
+            "database": self.config.get("database"),
+            "user": self.config.get("user"),
+            "replicas": len(self.replicas),
+            "pool_max_size": self.pool_config["max_size"],
+            "initialized": self.initialized,
+        }
+
+
+def database_config(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    配置文件中一个数据库的连接参数
+
+    可以用 dsn 给出连接串/URI，也可以分别给出 host、port、database、user、password；
+    password_env 指定从哪个环境变量读取密码。未给出的参数沿用 DB_* 环境变量。
+    """
+    config = dict(DB_CONFIG)
+    if entry.get("dsn"):
+        params = psycopg2.extensions.parse_dsn(entry["dsn"])
+        if "dbname" in params:
+            config["database"] = params.pop("dbname")
+        config.update(params)
+    for key in ("host", "port", "database", "user", "password", "connect_timeout"):
+        if key in entry:
+            config[key] = entry[key]
+    if "dbname" in entry:
+        config["database"] = entry["dbname"]
+    if entry.get("password_env"):
+        config["password"] = os.getenv(entry["password_env"], "")
+    return config
+
+
+class DatabaseRegistry:
+    """按名称管理已配置的数据库，未指定名称时使用默认数据库"""
+
+    def __init__(self, databases: Dict[str, Database], default: str):
+        if default not in databases:
+            raise ValueError(f"默认数据库 '{default}' 不在配置中")
+        self.databases = databases
+        self.default = default
+
+    def get(self, name: Optional[str] = None) -> Database:
+        database = self.databases.get(name or self.default)
+        if database is None:
+            raise Exception(
+                f"未配置的数据库 '{name}'，可用的数据库: {', '.join(self.databases)}"
+            )
+        return database
+
+    def initialized(self) -> List[Database]:
+        """已经创建连接池的数据库"""
+        return [db for db in self.databases.values() if db.initialized]
+
+
+def load_databases() -> DatabaseRegistry:
+    """
+    加载数据库配置
+
+    配置了 DB_CONFIG_FILE 时从JSON文件读取：
+    {"default": "app", "databases": {"app": {...}, "analytics": {...}}}，
+    每个数据库可以单独设置 pool（连接池参数）、replicas 和 replica（副本路由参数）。
+    否则只有一个名为 default 的数据库，来自 DB_* 环境变量。
+    """
+    if not DB_CONFIG_FILE:
+        return DatabaseRegistry(
+            {"default": Database("default", DB_CONFIG, replicas=DB_REPLICAS)}, "default"
+        )
+    with open(DB_CONFIG_FILE, encoding="utf-8") as f:
+        settings = json.load(f)
+    databases = {
+        name: Database(
+            name,
+            database_config(entry),
+            entry.get("pool"),
+            entry.get("replicas"),
+            entry.get("replica"),
+        )
+        for name, entry in settings["databases"].items()
+    }
+    return DatabaseRegistry(databases, settings.get("default") or next(iter(databases)))
+
+
+databases = load_databases()
+register_databases(databases)
+
+
+def with_database(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    按工具的 database 参数选择数据库，调用期间的查询和缓存都作用于该数据库
+
+    当前MCP会话打开了快照会话时，未指定 database 或指定的就是会话所在的数据库的调用
+    绑定到该快照会话，所有查询在会话的事务中执行。
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        session = snapshot_sessions.get(session_key())
+        name = kwargs.get("database") or (session.database.name if session else None)
+        try:
+            database = databases.get(name)
+        except Exception as e:
+            return f"错误: {e}"
+        with use_database(database.name), use_snapshot_session(database):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+async def in_database(name: str, func: Callable[..., Any], *args) -> str:
+    """在指定数据库中执行资源函数"""
+    try:
+        database = databases.get(name)
+    except Exception as e:
+        return f"错误: {e}"
+    with use_database(database.name):
+        return await func(*args)
@@ -0,0 +1,294 @@
+"""
+查询执行
+
+当前数据库与快照会话的上下文、执行阻塞数据库调用的线程池、结果解码和查询函数。
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import psycopg2
+import psycopg2.extensions
+
+from .config import DB_EXECUTOR_WORKERS, QUERY_DEFAULT_ROWS, QUERY_VALUE_MAX_CHARS
+from .metrics import record_call, timed_db_call
+from .pool import CancelScope, ConnectionPool, ReplicaRouter, _cancel_scope, apply_timeouts
+
+if TYPE_CHECKING:
+    from .databases import Database, DatabaseRegistry
+    from .snapshot_sessions import SnapshotSession
+
+
+T = TypeVar("T")
+
+# 服务端游标名称序号
+_cursor_ids = itertools.count(1)
+
+# 当前调用绑定的快照会话，由 with_database 设置
+_snapshot_session: "contextvars.ContextVar[Optional[SnapshotSession]]" = (
+    contextvars.ContextVar("pg_snapshot_session", default=None)
+)
+
+
+# === 当前数据库 ===
+
+# 当前调用所使用的数据库名称，由 use_database 设置，随上下文传递到数据库线程
+_current_database: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar(
+    "pg_database", default=None
+)
+
+# 已配置的数据库，由 databases 模块加载配置后注册
+_registry: Optional["DatabaseRegistry"] = None
+
+
+def register_databases(registry: "DatabaseRegistry") -> None:
+    """注册已配置的数据库，current_database 和 use_database 按名称从中查找"""
+    global _registry
+    _registry = registry
+
+
+def current_database() -> "Database":
+    """当前调用所使用的数据库"""
+    if _registry is None:
+        raise Exception("尚未加载数据库配置")
+    return _registry.get(_current_database.get())
+
+
+@contextmanager
+def use_database(name: Optional[str]) -> Iterator["Database"]:
+    """在上下文中切换当前数据库，名称为空时使用默认数据库"""
+    if _registry is None:
+        raise Exception("尚未加载数据库配置")
+    database = _registry.get(name)
+    token = _current_database.set(database.name)
+    try:
+        yield database
+    finally:
+        _current_database.reset(token)
+
+
+def get_pool() -> Union[ConnectionPool, ReplicaRouter, "SnapshotSession"]:
+    """获取当前数据库的连接池（首次使用时创建），调用绑定了快照会话时返回该会话"""
+    session = _snapshot_session.get()
+    if session is not None:
+        return session
+    return current_database().pool
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """获取执行阻塞数据库调用的有界线程池"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="pg-query"
+                )
+    return _executor
+
+
+async def run_in_db_executor(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    在数据库线程池中执行阻塞调用，避免阻塞MCP事件循环
+
+    等待期间协程被取消时，向本次调用借出的连接发送取消请求，终止后端正在执行的查询。
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    scope = CancelScope()
+    ctx = contextvars.copy_context()
+    ctx.run(_cancel_scope.set, scope)
+    try:
+        return await loop.run_in_executor(get_executor(), ctx.run, timed_db_call, call)
+    except asyncio.CancelledError:
+        # 取消请求需要建立网络连接，在单独的线程中发送，不阻塞事件循环
+        threading.Thread(target=scope.cancel, name="pg-cancel", daemon=True).start()
+        raise
+
+
+# === 结果解码 ===
+
+# 直接使用PostgreSQL文本表示的类型：numeric、date、time、timetz、timestamp、
+# timestamptz、interval、uuid、bytea，不再解析为Decimal/datetime等对象后再转回字符串
+TEXT_PASSTHROUGH = psycopg2.extensions.new_type(
+    (1700, 1082, 1083, 1266, 1114, 1184, 1186, 2950, 17),
+    "MCP_TEXT",
+    lambda value, cur: value,
+)
+TEXT_PASSTHROUGH_ARRAY = psycopg2.extensions.new_array_type(
+    (1231, 1182, 1183, 1270, 1115, 1185, 1187, 2951, 1001),
+    "MCP_TEXT_ARRAY",
+    TEXT_PASSTHROUGH,
+)
+
+BYTEA_OID = 17
+# text、varchar、bpchar、xml
+LONG_TEXT_OIDS = {25, 1043, 1042, 142}
+# 列名以该前缀开头的结果列保留完整值、不截断，用于需要原样回传给数据库的值（如keyset分页的主键）
+RAW_COLUMN_PREFIX = "__key_"
+
+
+def register_text_passthrough(cur) -> None:
+    """为游标注册文本直通的类型转换，结果值可直接序列化为JSON"""
+    psycopg2.extensions.register_type(TEXT_PASSTHROUGH, cur)
+    psycopg2.extensions.register_type(TEXT_PASSTHROUGH_ARRAY, cur)
+
+
+def preview_text(value: str) -> str:
+    """截断过长的文本值"""
+    if len(value) <= QUERY_VALUE_MAX_CHARS:
+        return value
+    return f"{value[:QUERY_VALUE_MAX_CHARS]}…（共{len(value)}字符）"
+
+
+def preview_bytea(value: str) -> str:
+    """截断过长的bytea值（十六进制文本表示 \\x...）"""
+    if len(value) <= QUERY_VALUE_MAX_CHARS:
+        return value
+    return f"{value[:QUERY_VALUE_MAX_CHARS]}…（共{(len(value) - 2) // 2}字节）"
+
+
+def column_decoders(description) -> List[Optional[Callable[[Any], Any]]]:
+    """根据结果列的类型OID为每列选择一次转换函数，不需要转换的列为None"""
+    if QUERY_VALUE_MAX_CHARS <= 0:
+        return [None] * len(description)
+    decoders: List[Optional[Callable[[Any], Any]]] = []
+    for col in description:
+        if col.name.startswith(RAW_COLUMN_PREFIX):
+            decoders.append(None)
+        elif col.type_code == BYTEA_OID:
+            decoders.append(preview_bytea)
+        elif col.type_code in LONG_TEXT_OIDS:
+            decoders.append(preview_text)
+        else:
+            decoders.append(None)
+    return decoders
+
+
+def decode_rows(description, rows: List[tuple]) -> List[Dict[str, Any]]:
+    """把元组行转换为字典，只对需要转换的列调用转换函数"""
+    record_call(rows=len(rows))
+    names = [col.name for col in description]
+    active = [
+        (i, decoder)
+        for i, decoder in enumerate(column_decoders(description))
+        if decoder is not None
+    ]
+    if not active:
+        return [dict(zip(names, row)) for row in rows]
+    results = []
+    for row in rows:
+        values = list(row)
+        for i, decoder in active:
+            if values[i] is not None:
+                values[i] = decoder(values[i])
+        results.append(dict(zip(names, values)))
+    return results
+
+
+def execute_query(
+    query: str,
+    params: Optional[tuple] = None,
+    timeout_ms: Optional[int] = None,
+    json_safe: bool = False,
+    prepared: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    执行SQL查询并返回结果
+
+    timeout_ms 用于限制本次查询的执行时间。json_safe 为真时数值、日期时间等类型
+    保留数据库的文本表示，长文本和bytea截断为预览，适用于直接返回给客户端的结果。
+    prepared 为语句名称：在快照会话的连接上只 PREPARE 一次，之后以 EXECUTE 执行。
+    执行失败时抛出的异常以原始的 psycopg2 异常为 __cause__，调用方可按 pgcode 区分错误。
+    """
+    try:
+        with get_pool().connection() as conn:
+            apply_timeouts(conn, timeout_ms)
+            # 只有快照会话的连接（SessionConnection）支持预备语句
+            if prepared and hasattr(conn, "prepare"):
+                query = conn.prepare(prepared, query)
+            with conn.cursor() as cur:
+                if json_safe:
+                    register_text_passthrough(cur)
+                cur.execute(query, params)
+                if not cur.description:
+                    return []
+                rows = cur.fetchall()
+                if json_safe:
+                    return decode_rows(cur.description, rows)
+                record_call(rows=len(rows))
+                names = [col.name for col in cur.description]
+                return [dict(zip(names, row)) for row in rows]
+    except psycopg2.Error as e:
+        raise Exception(f"SQL查询执行失败: {e}") from e
+
+
+async def aexecute_query(
+    query: str,
+    params: Optional[tuple] = None,
+    timeout_ms: Optional[int] = None,
+    json_safe: bool = False,
+    prepared: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """异步执行SQL查询，多个并发会话的查询可以并行执行"""
+    return await run_in_db_executor(
+        execute_query, query, params, timeout_ms, json_safe, prepared
+    )
+
+
+def new_cursor_name() -> str:
+    """生成唯一的服务端游标名称"""
+    return f"mcp_cursor_{os.getpid()}_{next(_cursor_ids)}"
+
+
+def execute_query_limited(
+    query: str, params: Optional[tuple] = None, max_rows: int = QUERY_DEFAULT_ROWS
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    通过服务端游标执行查询，只拉取 max_rows + 1 行
+
+    返回 (结果行, 是否被截断)。查询只能是可以声明游标的语句（SELECT/WITH/VALUES），
+    大结果集不会被完整加载到内存中。
+    """
+    try:
+        with get_pool().connection() as conn:
+            apply_timeouts(conn)
+            with conn.cursor(name=new_cursor_name()) as cur:
+                register_text_passthrough(cur)
+                cur.itersize = max_rows + 1
+                cur.execute(query, params)
+                rows = cur.fetchmany(max_rows + 1)
+                results = decode_rows(cur.description, rows[:max_rows])
+            conn.rollback()
+            return results, len(rows) > max_rows
+    except psycopg2.Error as e:
+        raise Exception(f"SQL查询执行失败: {e}") from e
+
+
+async def aexecute_query_limited(
+    query: str, params: Optional[tuple] = None, max_rows: int = QUERY_DEFAULT_ROWS
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """异步版本的 execute_query_limited"""
+    return await run_in_db_executor(execute_query_limited, query, params, max_rows)
@@ -0,0 +1,319 @@
+"""
+性能诊断
+
+基于统计视图的表访问方式、未使用与重复的索引、关系大小、膨胀估算和最耗时的查询。
+"""
+
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+import psycopg2.errors
+
+from .db import aexecute_query, decode_rows, get_pool, register_text_passthrough
+from .formatting import check_output_format, render_rows
+from .pool import apply_timeouts
+from .row_counts import ESTIMATED_ROWS_SQL
+
+
+# === 性能诊断 ===
+
+# 诊断查询共用的过滤条件：按模式名和表名收窄（参数为空时不过滤）
+DIAGNOSTIC_FILTER = """(%(schema)s::text IS NULL OR {schema} = %(schema)s)
+    AND (%(table)s::text IS NULL OR {table} = %(table)s)"""
+
+# 各表的访问方式：顺序扫描比例、顺序扫描读取的行数和缓存命中率
+TABLE_ACCESS_STATS_QUERY = f"""
+SELECT
+    s.schemaname AS schema_name,
+    s.relname AS table_name,
+    s.seq_scan,
+    s.seq_tup_read,
+    s.idx_scan,
+    round(
+        s.seq_scan::numeric / NULLIF(s.seq_scan + COALESCE(s.idx_scan, 0), 0), 4
+    )::float8 AS seq_scan_ratio,
+    s.seq_tup_read / NULLIF(s.seq_scan, 0) AS avg_rows_per_seq_scan,
+    s.n_live_tup,
+    s.n_dead_tup,
+    round(
+        io.heap_blks_hit::numeric / NULLIF(io.heap_blks_hit + io.heap_blks_read, 0), 4
+    )::float8 AS heap_cache_hit_ratio,
+    round(
+        io.idx_blks_hit::numeric / NULLIF(io.idx_blks_hit + io.idx_blks_read, 0), 4
+    )::float8 AS index_cache_hit_ratio,
+    s.n_tup_ins,
+    s.n_tup_upd,
+    s.n_tup_hot_upd,
+    s.n_tup_del,
+    pg_size_pretty(pg_total_relation_size(s.relid)) AS total_size,
+    greatest(s.last_vacuum, s.last_autovacuum) AS last_vacuum,
+    greatest(s.last_analyze, s.last_autoanalyze) AS last_analyze
+FROM pg_stat_user_tables s
+JOIN pg_statio_user_tables io ON io.relid = s.relid
+WHERE {DIAGNOSTIC_FILTER.format(schema="s.schemaname", table="s.relname")}
+ORDER BY s.seq_tup_read DESC, s.seq_scan DESC
+LIMIT %(limit)s;
+"""
+
+# 统计信息重置以来从未被扫描过的索引，不包括约束（主键、唯一、排他）所需的索引
+UNUSED_INDEXES_QUERY = f"""
+SELECT
+    s.schemaname AS schema_name,
+    s.relname AS table_name,
+    s.indexrelname AS index_name,
+    s.idx_scan,
+    pg_relation_size(s.indexrelid) AS index_bytes,
+    pg_size_pretty(pg_relation_size(s.indexrelid)) AS index_size,
+    pg_get_indexdef(s.indexrelid) AS definition,
+    (
+        SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()
+    ) AS stats_since
+FROM pg_stat_user_indexes s
+JOIN pg_index i ON i.indexrelid = s.indexrelid
+WHERE s.idx_scan = 0
+AND NOT i.indisunique
+AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = s.indexrelid)
+AND {DIAGNOSTIC_FILTER.format(schema="s.schemaname", table="s.relname")}
+ORDER BY index_bytes DESC
+LIMIT %(limit)s;
+"""
+
+# 与同表另一个索引完全相同，或其列是另一个B树索引的前缀（可由后者代替）的索引。
+# 唯一索引只在另一个索引同为唯一且列完全相同时才算重复；完全相同的一对索引只报告OID较小的一个。
+# 每个冗余索引只列出一个可代替它的索引，优先选择列最少的
+DUPLICATE_INDEXES_QUERY = f"""
+SELECT * FROM (
+SELECT DISTINCT ON (a.indexrelid)
+    n.nspname AS schema_name,
+    t.relname AS table_name,
+    ia.relname AS index_name,
+    CASE WHEN a.indkey::text = b.indkey::text THEN 'duplicate' ELSE 'prefix' END AS kind,
+    ib.relname AS covered_by,
+    pg_relation_size(a.indexrelid) AS index_bytes,
+    pg_size_pretty(pg_relation_size(a.indexrelid)) AS index_size,
+    pg_get_indexdef(a.indexrelid) AS definition,
+    pg_get_indexdef(b.indexrelid) AS covered_by_definition
+FROM pg_index a
+JOIN pg_index b ON b.indrelid = a.indrelid AND b.indexrelid <> a.indexrelid
+JOIN pg_class ia ON ia.oid = a.indexrelid
+JOIN pg_class ib ON ib.oid = b.indexrelid
+JOIN pg_class t ON t.oid = a.indrelid
+JOIN pg_namespace n ON n.oid = t.relnamespace
+WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
+AND NOT a.indisprimary
+AND a.indexprs IS NULL AND b.indexprs IS NULL
+AND a.indpred IS NULL AND b.indpred IS NULL
+AND a.indnatts = a.indnkeyatts
+AND ia.relam = ib.relam
+AND (
+    (
+        a.indkey::text = b.indkey::text
+        AND a.indclass::text = b.indclass::text
+        AND a.indoption::text = b.indoption::text
+        AND (a.indisunique, a.indexrelid) < (b.indisunique, b.indexrelid)
+        AND (NOT a.indisunique OR b.indisunique)
+    )
+    OR (
+        NOT a.indisunique
+        AND ia.relam = (SELECT oid FROM pg_am WHERE amname = 'btree')
+        AND b.indkey::text LIKE a.indkey::text || ' %%'
+        AND b.indclass::text LIKE a.indclass::text || ' %%'
+        AND b.indoption::text LIKE a.indoption::text || ' %%'
+    )
+)
+AND {DIAGNOSTIC_FILTER.format(schema="n.nspname", table="t.relname")}
+ORDER BY a.indexrelid, b.indnatts, b.indexrelid
+) AS redundant
+ORDER BY index_bytes DESC
+LIMIT %(limit)s;
+"""
+
+# 表、TOAST和索引占用的空间
+RELATION_SIZES_QUERY = f"""
+SELECT
+    n.nspname AS schema_name,
+    c.relname AS table_name,
+    {ESTIMATED_ROWS_SQL} AS estimated_rows,
+    pg_total_relation_size(c.oid) AS total_bytes,
+    pg_size_pretty(pg_total_relation_size(c.oid)) AS total_size,
+    pg_size_pretty(pg_relation_size(c.oid)) AS table_size,
+    pg_size_pretty(
+        pg_total_relation_size(c.oid) - pg_relation_size(c.oid) - pg_indexes_size(c.oid)
+    ) AS toast_size,
+    pg_size_pretty(pg_indexes_size(c.oid)) AS indexes_size,
+    (SELECT count(*) FROM pg_index i WHERE i.indrelid = c.oid) AS index_count
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'm')
+AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+AND n.nspname NOT LIKE 'pg\\_toast%%'
+AND {DIAGNOSTIC_FILTER.format(schema="n.nspname", table="c.relname")}
+ORDER BY total_bytes DESC
+LIMIT %(limit)s;
+"""
+
+# 表膨胀估算：按 pg_stats 中各列的平均宽度和空值比例估算每行大小，
+# 与 ANALYZE 时的行数相乘得到理论页数，再与实际页数比较
+TABLE_BLOAT_QUERY = f"""
+WITH columns AS (
+    SELECT
+        c.oid,
+        n.nspname,
+        c.relname,
+        c.reltuples,
+        c.relpages,
+        coalesce(
+            (
+                SELECT substring(option FROM 'fillfactor=(\\d+)')::int
+                FROM unnest(c.reloptions) AS option
+                WHERE option LIKE 'fillfactor=%%'
+            ),
+            100
+        ) AS fillfactor,
+        count(*) AS column_count,
+        count(s.attname) AS analyzed_columns,
+        sum(
+            (1 - coalesce(s.null_frac, 0)) * coalesce(s.avg_width, greatest(a.attlen, 0))
+        ) AS data_width,
+        bool_or(coalesce(s.null_frac, 0) > 0) AS has_nulls
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_stats s
+        ON s.schemaname = n.nspname AND s.tablename = c.relname AND s.attname = a.attname
+    WHERE c.relkind = 'r'
+    AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+    AND n.nspname NOT LIKE 'pg\\_toast%%'
+    AND {DIAGNOSTIC_FILTER.format(schema="n.nspname", table="c.relname")}
+    GROUP BY c.oid, n.nspname, c.relname, c.reltuples, c.relpages, c.reloptions
+),
+estimates AS (
+    SELECT
+        *,
+        current_setting('block_size')::numeric AS block_size,
+        -- 行头（23字节，含空值位图时加上位图）按8字节对齐，加数据宽度（对齐后）和4字节行指针
+        ceil((23 + CASE WHEN has_nulls THEN ceil(column_count / 8.0) ELSE 0 END) / 8) * 8
+            + ceil(data_width::numeric / 8) * 8 + 4 AS row_bytes
+    FROM columns
+),
+pages AS (
+    SELECT
+        *,
+        ceil(
+            greatest(reltuples, 0)::numeric * row_bytes
+            / ((block_size - 24) * fillfactor / 100)
+        ) AS expected_pages
+    FROM estimates
+)
+SELECT
+    nspname AS schema_name,
+    relname AS table_name,
+    reltuples::bigint AS estimated_rows,
+    relpages AS actual_pages,
+    expected_pages::bigint,
+    pg_size_pretty(relpages::bigint * block_size::bigint) AS table_size,
+    greatest(relpages - expected_pages, 0)::bigint * block_size::bigint AS bloat_bytes,
+    pg_size_pretty(
+        greatest(relpages - expected_pages, 0)::bigint * block_size::bigint
+    ) AS bloat_size,
+    round(
+        CASE WHEN relpages > 0 THEN greatest(1 - expected_pages / relpages, 0) ELSE 0 END, 4
+    )::float8 AS bloat_ratio,
+    fillfactor,
+    analyzed_columns = column_count AS fully_analyzed
+FROM pages
+-- 空表和从未分析过的表（reltuples 为 -1）无法估算
+WHERE relpages > 0 AND reltuples >= 0
+ORDER BY bloat_bytes DESC
+LIMIT %(limit)s;
+"""
+
+# pg_stat_statements 各排序方式对应的排序表达式
+TOP_QUERIES_ORDER = {
+    "total_time": "total_time",
+    "mean_time": "mean_time",
+    "calls": "calls",
+    "io": "shared_blks_read",
+}
+
+
+def fetch_top_queries(order_by: str, limit: int, min_calls: int) -> List[Dict[str, Any]]:
+    """
+    从 pg_stat_statements 读取当前数据库中最耗时的查询
+
+    PostgreSQL 13 起耗时列改名为 total_exec_time/mean_exec_time，
+    按连接的服务器版本选择列名，两种版本都只需一次查询。
+    """
+    try:
+        with get_pool().connection() as conn:
+            prefix = "exec_" if conn.server_version >= 130000 else ""
+            query = f"""
+            SELECT
+                queryid,
+                left(query, 500) AS query,
+                calls,
+                round({prefix}total_time::numeric, 2)::float8 AS total_time,
+                round({prefix}mean_time::numeric, 3)::float8 AS mean_time,
+                round({prefix}stddev_time::numeric, 3)::float8 AS stddev_time,
+                round(
+                    (
+                        100 * {prefix}total_time
+                        / NULLIF(sum({prefix}total_time) OVER (), 0)
+                    )::numeric,
+                    2
+                )::float8 AS percent_of_total_time,
+                rows,
+                round(rows::numeric / NULLIF(calls, 0), 1)::float8 AS rows_per_call,
+                shared_blks_hit,
+                shared_blks_read,
+                round(
+                    shared_blks_hit::numeric / NULLIF(shared_blks_hit + shared_blks_read, 0),
+                    4
+                )::float8 AS cache_hit_ratio,
+                temp_blks_written
+            FROM pg_stat_statements
+            WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+            AND calls >= %(min_calls)s
+            ORDER BY {TOP_QUERIES_ORDER[order_by]} DESC
+            LIMIT %(limit)s;
+            """
+            apply_timeouts(conn)
+            with conn.cursor() as cur:
+                register_text_passthrough(cur)
+                cur.execute(query, {"min_calls": min_calls, "limit": limit})
+                return decode_rows(cur.description, cur.fetchall())
+    except psycopg2.errors.UndefinedTable:
+        raise Exception(
+            "未安装 pg_stat_statements 扩展：需要在 shared_preload_libraries 中加载它，"
+            "并在当前数据库执行 CREATE EXTENSION pg_stat_statements"
+        )
+    except psycopg2.Error as e:
+        raise Exception(f"读取 pg_stat_statements 失败: {e}")
+
+
+async def run_diagnostic(
+    query: str,
+    schema_name: Optional[str],
+    table_name: Optional[str],
+    limit: int,
+    output_format: str,
+    max_bytes: int,
+) -> str:
+    """执行一条诊断查询并按输出格式渲染结果"""
+    error = check_output_format(output_format)
+    if error:
+        return error
+    params = {
+        "schema": schema_name,
+        "table": table_name,
+        "limit": max(1, min(limit, 100)),
+    }
+    rows = await aexecute_query(query, params, json_safe=True)
+    text, _ = render_rows(
+        rows,
+        output_format,
+        lambda kept: {"row_count": kept},
+        "results",
+        max_bytes,
+    )
+    return text
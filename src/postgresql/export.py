@@ -0,0 +1,201 @@
+"""
+查询结果导出
+
+用 COPY 把完整结果流式写入服务器本地的 CSV、gzip 压缩的CSV或 Parquet 文件。
+"""
+
+import csv
+import gzip
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from .config import EXPORT_CONFIG
+from .cost_guard import strip_statement
+from .db import get_pool
+from .metrics import record_call
+from .pool import apply_timeouts
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:  # 可选依赖，安装后支持导出为 Parquet 列式文件
+    pyarrow = None
+
+
+# === 查询结果导出 ===
+
+# 导出格式及文件扩展名
+EXPORT_FORMATS = {"csv": ".csv", "csv.gz": ".csv.gz", "parquet": ".parquet"}
+
+# 导出为 Parquet 时按列类型（pg_type OID）指定的 Arrow 类型，其余列均为字符串
+PARQUET_COLUMN_TYPES = {
+    16: "bool",
+    20: "int64",
+    21: "int16",
+    23: "int32",
+    700: "float32",
+    701: "float64",
+    1082: "date32",
+}
+
+# 最近导出的文件信息，供 export:// 资源读取
+_exports: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_exports_lock = threading.Lock()
+
+
+class CopyWriter:
+    """
+    接收 COPY TO STDOUT 输出的数据块
+
+    直接写入文件并统计字节数，只在内存中保留开头的一小段数据用于预览，
+    超过字节上限时抛出异常中止 COPY。
+    """
+
+    def __init__(self, file, max_bytes: int = 0, head_bytes: int = 65536):
+        self.file = file
+        self.max_bytes = max_bytes
+        self.head_bytes = head_bytes
+        self.bytes = 0
+        self.head = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.bytes += len(data)
+        if self.max_bytes and self.bytes > self.max_bytes:
+            raise Exception(f"导出数据超过 {self.max_bytes} 字节上限")
+        if len(self.head) < self.head_bytes:
+            self.head += data[: self.head_bytes - len(self.head)]
+        return self.file.write(data)
+
+
+def export_preview(
+    head: bytes, encoding: str, complete: bool, limit: int
+) -> Tuple[List[str], List[Dict[str, str]]]:
+    """从CSV开头的数据中解析列名和前几行，不完整的最后一行不计入"""
+    rows = list(csv.reader(io.StringIO(head.decode(encoding, errors="replace"))))
+    if not rows:
+        return [], []
+    columns, data = rows[0], rows[1:]
+    if not complete:
+        data = data[:-1]
+    return columns, [dict(zip(columns, row)) for row in data[:limit]]
+
+
+def csv_to_parquet(csv_path: str, parquet_path: str, column_types: Dict[str, str]) -> None:
+    """按批读取导出的CSV并写入 Parquet 文件，内存占用与数据量无关"""
+    reader = pyarrow.csv.open_csv(
+        csv_path,
+        convert_options=pyarrow.csv.ConvertOptions(
+            column_types={
+                name: pyarrow.type_for_alias(alias) for name, alias in column_types.items()
+            },
+            strings_can_be_null=True,
+            # COPY 的CSV中空值为不带引号的空字段，带引号的空字符串仍是空字符串
+            quoted_strings_can_be_null=False,
+            true_values=["t"],
+            false_values=["f"],
+        ),
+    )
+    with pyarrow.parquet.ParquetWriter(parquet_path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+def remember_export(name: str, info: Dict[str, Any]) -> None:
+    """记录导出文件的信息，只保留最近的256个"""
+    with _exports_lock:
+        _exports[name] = info
+        while len(_exports) > 256:
+            _exports.popitem(last=False)
+
+
+def export_info(name: str) -> Optional[Dict[str, Any]]:
+    """最近导出的文件信息，不存在（如服务器重启后）时返回None"""
+    with _exports_lock:
+        return _exports.get(name)
+
+
+def cleanup_exports(directory: str, ttl: float) -> int:
+    """删除超过保留时间的导出文件，返回删除的数量"""
+    if ttl <= 0:
+        return 0
+    removed = 0
+    cutoff = time.time() - ttl
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.startswith("export_"):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def export_query_result(
+    sql: str, file_format: str, path: str, preview_rows: int
+) -> Dict[str, Any]:
+    """
+    用 COPY (查询) TO STDOUT 把完整结果流式写入文件
+
+    数据按块直接写入磁盘，内存中只保留预览用的开头部分。Parquet 格式先写出临时CSV，
+    再按批转换。写入完成前使用临时文件名，失败时不会留下不完整的文件。
+    """
+    partial = path + ".partial"
+    csv_path = partial + ".csv" if file_format == "parquet" else partial
+    statement = strip_statement(sql)
+    try:
+        with get_pool().connection() as conn:
+            apply_timeouts(conn)
+            column_types: Dict[str, str] = {}
+            with conn.cursor() as cur:
+                if file_format == "parquet":
+                    cur.execute(f"SELECT * FROM (\n{statement}\n) AS export_query LIMIT 0")
+                    # 显式指定所有列的类型，避免按首批数据推断出错误的类型
+                    column_types = {
+                        col.name: PARQUET_COLUMN_TYPES.get(col.type_code, "string")
+                        for col in cur.description
+                    }
+                if file_format == "csv.gz":
+                    # 导出以速度优先，最低压缩级别对CSV已有明显的压缩效果
+                    file = gzip.open(csv_path, "wb", compresslevel=1)
+                else:
+                    file = open(csv_path, "wb")
+                with file:
+                    writer = CopyWriter(file, EXPORT_CONFIG["max_bytes"])
+                    cur.copy_expert(
+                        f"COPY (\n{statement}\n) TO STDOUT WITH (FORMAT csv, HEADER true)",
+                        writer,
+                    )
+                row_count = cur.rowcount
+                record_call(rows=row_count)
+            encoding = psycopg2.extensions.encodings.get(conn.encoding, "utf-8")
+            conn.rollback()
+        if file_format == "parquet":
+            csv_to_parquet(csv_path, partial, column_types)
+        os.replace(partial, path)
+    except psycopg2.Error as e:
+        raise Exception(f"导出查询结果失败: {e}")
+    finally:
+        for leftover in {csv_path, partial}:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    columns, preview = export_preview(
+        bytes(writer.head), encoding, writer.bytes <= writer.head_bytes, preview_rows
+    )
+    return {
+        "format": file_format,
+        "row_count": row_count,
+        "bytes": os.path.getsize(path),
+        "csv_bytes": writer.bytes,
+        "columns": columns,
+        "preview": preview,
+    }
@@ -0,0 +1,171 @@
+"""
+外键关系图
+
+整库外键约束构成的无向图，用于查找两张表之间的最短连接路径。
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from .db import aexecute_query, current_database
+from .snapshot import USER_SCHEMA_FILTER
+
+
+# === 外键关系图 ===
+
+# 整库的外键约束，标识符已按需加引号，可直接拼入SQL
+FOREIGN_KEYS_QUERY = f"""
+SELECT
+    con.conname AS constraint_name,
+    n.nspname AS schema_name,
+    c.relname AS table_name,
+    quote_ident(n.nspname) || '.' || quote_ident(c.relname) AS table_ident,
+    rn.nspname AS ref_schema,
+    rc.relname AS ref_table,
+    quote_ident(rn.nspname) || '.' || quote_ident(rc.relname) AS ref_table_ident,
+    ARRAY(
+        SELECT quote_ident(a.attname)
+        FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+        ORDER BY k.ord
+    ) AS columns,
+    ARRAY(
+        SELECT quote_ident(a.attname)
+        FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+        ORDER BY k.ord
+    ) AS ref_columns
+FROM pg_constraint con
+JOIN pg_class c ON c.oid = con.conrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_class rc ON rc.oid = con.confrelid
+JOIN pg_namespace rn ON rn.oid = rc.relnamespace
+WHERE con.contype = 'f'
+AND {USER_SCHEMA_FILTER}
+ORDER BY 2, 3, 1;
+"""
+
+
+class ForeignKeyGraph:
+    """
+    外键关系的无向图，节点为 (模式, 表)
+
+    每条外键约束是一条边，可以从任一端遍历；两表间的多个外键是不同的边。
+    最短连接路径用广度优先搜索在内存中求得。
+    """
+
+    def __init__(self, foreign_keys: List[Dict[str, Any]]):
+        self.edges = foreign_keys
+        self.idents: Dict[Tuple[str, str], str] = {}
+        self.adjacency: Dict[Tuple[str, str], List[Tuple[Tuple[str, str], int]]] = {}
+        for index, fk in enumerate(foreign_keys):
+            child = (fk["schema_name"], fk["table_name"])
+            parent = (fk["ref_schema"], fk["ref_table"])
+            self.idents[child] = fk["table_ident"]
+            self.idents[parent] = fk["ref_table_ident"]
+            if child == parent:
+                continue
+            self.adjacency.setdefault(child, []).append((parent, index))
+            self.adjacency.setdefault(parent, []).append((child, index))
+
+    def resolve(self, table_name: str) -> Tuple[str, str]:
+        """
+        把 "表" 或 "模式.表" 解析为节点；未指定模式且有多个同名表时优先 public
+
+        没有外键的表不在图中，此时按名称原样返回
+        """
+        if "." in table_name:
+            schema_name, _, name = table_name.partition(".")
+            return (schema_name.strip('"'), name.strip('"'))
+        name = table_name.strip('"')
+        candidates = sorted(node for node in self.adjacency if node[1] == name)
+        if len(candidates) > 1:
+            if ("public", name) in candidates:
+                return ("public", name)
+            qualified = ", ".join(f"{s}.{t}" for s, t in candidates)
+            raise ValueError(f"表名 '{name}' 不唯一，请指定模式: {qualified}")
+        return candidates[0] if candidates else ("public", name)
+
+    def shortest_paths(
+        self,
+        source: Tuple[str, str],
+        target: Tuple[str, str],
+        max_paths: int = 3,
+        max_depth: int = 6,
+    ) -> List[List[Tuple[Tuple[str, str], Tuple[str, str], int]]]:
+        """
+        返回最多 max_paths 条最短路径，每条路径是 (起点, 终点, 外键序号) 的列表
+
+        先用广度优先搜索得到到起点的距离，再从终点沿距离递减的边回溯枚举。
+        """
+        if source == target:
+            return []
+        depth = {source: 0}
+        frontier = [source]
+        while frontier and target not in depth and depth[frontier[0]] < max_depth:
+            next_frontier = []
+            for node in frontier:
+                for neighbor, _ in self.adjacency.get(node, ()):
+                    if neighbor not in depth:
+                        depth[neighbor] = depth[node] + 1
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        if target not in depth:
+            return []
+
+        paths: List[List[Tuple[Tuple[str, str], Tuple[str, str], int]]] = []
+
+        def walk(node: Tuple[str, str], suffix: list) -> None:
+            if len(paths) >= max_paths:
+                return
+            if node == source:
+                paths.append(suffix)
+                return
+            for neighbor, index in self.adjacency.get(node, ()):
+                if depth.get(neighbor) == depth[node] - 1:
+                    walk(neighbor, [(neighbor, node, index)] + suffix)
+
+        walk(target, [])
+        return paths
+
+    def describe_path(
+        self, path: List[Tuple[Tuple[str, str], Tuple[str, str], int]]
+    ) -> Dict[str, Any]:
+        """把路径转换为连接步骤、连接条件和可直接使用的 FROM ... JOIN 子句"""
+        aliases = {path[0][0]: "t0"}
+        steps = []
+        clauses = [f"FROM {self.idents[path[0][0]]} t0"]
+        for left, right, index in path:
+            fk = self.edges[index]
+            aliases[right] = f"t{len(aliases)}"
+            if (fk["schema_name"], fk["table_name"]) == left:
+                pairs = zip(fk["columns"], fk["ref_columns"])
+            else:
+                pairs = zip(fk["ref_columns"], fk["columns"])
+            predicate = " AND ".join(
+                f"{aliases[left]}.{lc} = {aliases[right]}.{rc}" for lc, rc in pairs
+            )
+            steps.append(
+                {
+                    "from": f"{left[0]}.{left[1]}",
+                    "to": f"{right[0]}.{right[1]}",
+                    "constraint": fk["constraint_name"],
+                    "on": predicate,
+                }
+            )
+            clauses.append(f"JOIN {self.idents[right]} {aliases[right]} ON {predicate}")
+        return {"length": len(path), "steps": steps, "sql": "\n".join(clauses)}
+
+    def stats(self) -> Dict[str, Any]:
+        """图的规模"""
+        return {"tables": len(self.adjacency), "foreign_keys": len(self.edges)}
+
+
+async def get_foreign_key_graph() -> ForeignKeyGraph:
+    """获取整库外键关系图，随模式缓存一起失效"""
+
+    async def load() -> ForeignKeyGraph:
+        return ForeignKeyGraph(await aexecute_query(FOREIGN_KEYS_QUERY, {"schema": None}))
+
+    return await current_database().schema_cache.get_or_load(
+        ("foreign_key_graph",), load
+    )
@@ -0,0 +1,164 @@
+"""
+输出格式
+
+把结果行渲染为 json、columnar、csv、tsv 或 markdown，并保证响应不超过字节预算。
+"""
+
+import csv
+import io
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import RESPONSE_MAX_BYTES
+from .metrics import measure_serialization
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，安装后JSON序列化更快
+    orjson = None
+
+
+# === 输出格式 ===
+
+# json: 缩进的对象数组；columnar: 列名只出现一次的紧凑JSON；csv/tsv/markdown: 表格文本
+OUTPUT_FORMATS = ("json", "columnar", "csv", "tsv", "markdown")
+
+
+def dumps_compact(obj: Any) -> str:
+    """紧凑JSON序列化，安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=str,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        ).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def result_size(results: Any) -> int:
+    """结果按紧凑JSON序列化后的字节数，用于统一估算缓存条目的大小"""
+    return len(dumps_compact(results).encode("utf-8"))
+
+
+def result_columns(rows: List[Dict[str, Any]]) -> List[str]:
+    """按出现顺序收集所有行的列名"""
+    columns: Dict[str, None] = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+    return list(columns)
+
+
+def cell_text(value: Any) -> str:
+    """把单元格的值转换为文本表格中的字符串"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return dumps_compact(value)
+    return str(value)
+
+
+def encode_row(row: Dict[str, Any], columns: List[str], fmt: str) -> str:
+    """按输出格式编码一行"""
+    if fmt == "columnar":
+        return dumps_compact([row.get(col) for col in columns])
+    if fmt in ("csv", "tsv"):
+        buf = io.StringIO()
+        csv.writer(
+            buf, delimiter="\t" if fmt == "tsv" else ",", lineterminator="\n"
+        ).writerow([cell_text(row.get(col)) for col in columns])
+        return buf.getvalue()
+    if fmt == "markdown":
+        cells = (
+            cell_text(row.get(col)).replace("|", "\\|").replace("\n", " ")
+            for col in columns
+        )
+        return "| " + " | ".join(cells) + " |\n"
+    return dumps_compact(row)
+
+
+def assemble_response(
+    meta: Dict[str, Any],
+    rows: List[Dict[str, Any]],
+    pieces: List[str],
+    columns: List[str],
+    fmt: str,
+    rows_key: str,
+) -> str:
+    """组装完整的响应文本"""
+    if fmt == "json":
+        return json.dumps(
+            {**meta, rows_key: rows}, indent=2, ensure_ascii=False, default=str
+        )
+    if fmt == "columnar":
+        head = dumps_compact({**meta, "columns": columns})
+        return f'{head[:-1]},"rows":[{",".join(pieces)}]}}'
+    header = encode_row(dict(zip(columns, columns)), columns, fmt)
+    if fmt == "markdown":
+        header += "|" + " --- |" * len(columns) + "\n"
+    # 文本格式的第一行为元信息
+    return dumps_compact(meta) + "\n" + header + "".join(pieces)
+
+
+def render_rows(
+    rows: List[Dict[str, Any]],
+    fmt: str,
+    build_meta: Callable[[int], Dict[str, Any]],
+    rows_key: str = "results",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+) -> Tuple[str, int]:
+    """
+    按指定格式渲染结果行，并保证响应不超过字节预算
+
+    build_meta 接收最终保留的行数并返回元信息（行数、是否截断、续页令牌等）。
+    超出预算时从末尾截断整行（至少保留一行），返回 (响应文本, 保留的行数)。
+    """
+    with measure_serialization():
+        columns = result_columns(rows)
+        pieces = [encode_row(row, columns, fmt) for row in rows]
+        kept = len(rows)
+
+        if max_bytes > 0:
+            # 不含数据行的响应大小，另外预留截断标记和续页令牌的空间
+            empty = assemble_response(build_meta(kept), [], [], columns, fmt, rows_key)
+            overhead = len(empty.encode("utf-8")) + 96
+            used = 0
+            for i, piece in enumerate(pieces):
+                used += len(piece.encode("utf-8")) + 2
+                if used + overhead > max_bytes:
+                    kept = max(1, i)
+                    break
+
+        while True:
+            text = assemble_response(
+                build_meta(kept), rows[:kept], pieces[:kept], columns, fmt, rows_key
+            )
+            size = len(text.encode("utf-8"))
+            if max_bytes <= 0 or size <= max_bytes or kept <= 1:
+                return text, kept
+            kept = max(1, min(kept - 1, int(kept * max_bytes / size)))
+
+
+def check_output_format(output_format: str) -> Optional[str]:
+    """校验输出格式参数，返回错误信息或None"""
+    if output_format not in OUTPUT_FORMATS:
+        return f"错误: output_format 只支持 {', '.join(OUTPUT_FORMATS)}"
+    return None
+
+
+def fit_rows(rows: List[Dict[str, Any]], budget: int, fmt: str) -> int:
+    """在字节预算内最多能保留的行数（至少保留一行），按输出格式估算每行的大小"""
+    used = 0
+    for i, row in enumerate(rows):
+        if fmt == "json":
+            text = json.dumps(row, indent=2, ensure_ascii=False, default=str)
+            # 嵌套在响应中时每行还要再缩进三层
+            size = len(text.encode("utf-8")) + 6 * (text.count("\n") + 1)
+        else:
+            size = len(encode_row(row, list(row), fmt).encode("utf-8"))
+        used += size + 2
+        if used > budget:
+            return max(1, i)
+    return len(rows)
@@ -0,0 +1,287 @@
+"""
+运行指标
+
+按工具汇总调用次数、耗时分布、读取的行数和响应大小，以 Prometheus 文本格式输出。
+"""
+
+import asyncio
+import bisect
+import contextvars
+import functools
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from .config import METRICS_CONFIG
+
+T = TypeVar("T")
+
+# === 运行指标 ===
+
+# 工具以字符串返回错误信息：以"错误"开头，或以"...失败: "开头
+TOOL_ERROR_PATTERN = re.compile(r"^(?:错误|[^\n]{0,80}?失败): ")
+
+# 当前工具调用的运行指标，由 with_metrics 设置
+_call_metrics: "contextvars.ContextVar[Optional[CallMetrics]]" = contextvars.ContextVar(
+    "pg_call_metrics", default=None
+)
+
+
+class CallMetrics:
+    """一次工具调用的数据库耗时、序列化耗时和读取的行数，批量查询中会被多个线程同时累加"""
+
+    __slots__ = ("db_seconds", "serialize_seconds", "rows", "_lock")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def add(
+        self, db_seconds: float = 0.0, serialize_seconds: float = 0.0, rows: int = 0
+    ) -> None:
+        with self._lock:
+            self.db_seconds += db_seconds
+            self.serialize_seconds += serialize_seconds
+            self.rows += rows
+
+
+def record_call(**values: Any) -> None:
+    """累加到当前工具调用的指标，不在工具调用中（如后台线程）时忽略"""
+    call = _call_metrics.get()
+    if call is not None:
+        call.add(**values)
+
+
+def timed_db_call(call: Callable[[], T]) -> T:
+    """在数据库线程中执行调用并记录耗时（包括等待连接池的时间）"""
+    start = time.perf_counter()
+    try:
+        return call()
+    finally:
+        record_call(db_seconds=time.perf_counter() - start)
+
+
+@contextmanager
+def measure_serialization() -> Iterator[None]:
+    """记录把结果编码为响应文本的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_call(serialize_seconds=time.perf_counter() - start)
+
+
+class Histogram:
+    """累积分桶的直方图，由 MetricsRegistry 的锁保护"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """按 Prometheus 文本格式生成 (后缀, le, 值)，桶计数为累积值"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield "_bucket", format_metric_value(bound), total
+        yield "_bucket", "+Inf", self.count
+        yield "_sum", "", self.sum
+        yield "_count", "", self.count
+
+
+def format_metric_value(value: float) -> str:
+    """数值的文本表示，整数不带小数点"""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """标签集的文本表示，转义反斜杠、双引号和换行"""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# (直方图, 指标名, 说明)
+HISTOGRAM_FAMILIES = (
+    ("duration", "pg_mcp_tool_duration_seconds", "工具调用总耗时（秒）"),
+    (
+        "db",
+        "pg_mcp_tool_db_seconds",
+        "工具调用在数据库线程中的耗时（秒），并发执行的语句累加计算",
+    ),
+    ("serialize", "pg_mcp_tool_serialize_seconds", "工具调用把结果编码为响应文本的耗时（秒）"),
+    ("response_bytes", "pg_mcp_tool_response_bytes", "工具响应的UTF-8字节数"),
+)
+
+
+class MetricsRegistry:
+    """
+    按工具名汇总的运行指标
+
+    每次调用记录调用次数（按结果状态区分）、总耗时、其中在数据库线程中的耗时与
+    编码响应的耗时、读取的行数和响应字节数，以 Prometheus 文本格式输出。
+    """
+
+    def __init__(
+        self, latency_buckets: Tuple[float, ...], bytes_buckets: Tuple[float, ...]
+    ):
+        self.latency_buckets = latency_buckets
+        self.bytes_buckets = bytes_buckets
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, str], int] = {}
+        self._rows: Dict[str, int] = {}
+        self._histograms: Dict[str, Dict[str, Histogram]] = {
+            name: {} for name, _, _ in HISTOGRAM_FAMILIES
+        }
+
+    def _histogram(self, name: str, tool: str) -> Histogram:
+        histograms = self._histograms[name]
+        histogram = histograms.get(tool)
+        if histogram is None:
+            buckets = (
+                self.bytes_buckets if name == "response_bytes" else self.latency_buckets
+            )
+            histogram = histograms[tool] = Histogram(buckets)
+        return histogram
+
+    def observe(
+        self,
+        tool: str,
+        status: str,
+        seconds: float,
+        call: CallMetrics,
+        response_bytes: Optional[int],
+    ) -> None:
+        """记录一次工具调用"""
+        with self._lock:
+            key = (tool, status)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            self._rows[tool] = self._rows.get(tool, 0) + call.rows
+            self._histogram("duration", tool).observe(seconds)
+            self._histogram("db", tool).observe(call.db_seconds)
+            self._histogram("serialize", tool).observe(call.serialize_seconds)
+            if response_bytes is not None:
+                self._histogram("response_bytes", tool).observe(response_bytes)
+
+    def render(self, gauges: List[Tuple[str, str, List[Tuple[Dict[str, str], Any]]]]) -> str:
+        """输出 Prometheus 文本格式（0.0.4），gauges 为 (名称, 说明, [(标签, 值)])"""
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            family(
+                "pg_mcp_tool_calls_total",
+                "counter",
+                "工具调用次数，status 为 ok/error/cancelled",
+            )
+            for (tool, status), count in sorted(self._calls.items()):
+                labels = format_labels({"tool": tool, "status": status})
+                lines.append(f"pg_mcp_tool_calls_total{labels} {count}")
+
+            family(
+                "pg_mcp_tool_rows_fetched_total", "counter", "工具调用从数据库读取的行数"
+            )
+            for tool, rows in sorted(self._rows.items()):
+                labels = format_labels({"tool": tool})
+                lines.append(f"pg_mcp_tool_rows_fetched_total{labels} {rows}")
+
+            for name, metric, help_text in HISTOGRAM_FAMILIES:
+                family(metric, "histogram", help_text)
+                for tool, histogram in sorted(self._histograms[name].items()):
+                    for suffix, le, value in histogram.samples():
+                        labels = {"tool": tool, "le": le} if le else {"tool": tool}
+                        lines.append(
+                            f"{metric}{suffix}{format_labels(labels)} "
+                            f"{format_metric_value(value)}"
+                        )
+
+        uptime = round(time.time() - self.started_at, 3)
+        family("pg_mcp_uptime_seconds", "gauge", "服务器运行时间（秒）")
+        lines.append(f"pg_mcp_uptime_seconds {format_metric_value(uptime)}")
+        for name, help_text, samples in gauges:
+            if not samples:
+                continue
+            family(name, "gauge", help_text)
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {format_metric_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(**METRICS_CONFIG)
+
+
+def with_metrics(func: Callable[..., Any]) -> Callable[..., Any]:
+    """记录工具的调用次数、耗时、数据库与序列化耗时、读取行数和响应大小"""
+    tool = func.__name__
+
+    def finish(start: float, call: CallMetrics, status: str, result: Any) -> None:
+        size = None
+        if isinstance(result, str):
+            size = len(result.encode("utf-8"))
+            if TOOL_ERROR_PATTERN.match(result):
+                status = "error"
+        metrics.observe(tool, status, time.perf_counter() - start, call, size)
+
+    if not asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            call = CallMetrics()
+            token = _call_metrics.set(call)
+            start = time.perf_counter()
+            status, result = "error", None
+            try:
+                result = func(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                _call_metrics.reset(token)
+                finish(start, call, status, result)
+
+        return wrapper
+
+    @functools.wraps(func)
+    async def async_wrapper(*args, **kwargs):
+        call = CallMetrics()
+        token = _call_metrics.set(call)
+        start = time.perf_counter()
+        status, result = "error", None
+        try:
+            result = await func(*args, **kwargs)
+            status = "ok"
+            return result
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            _call_metrics.reset(token)
+            finish(start, call, status, result)
+
+    return async_wrapper
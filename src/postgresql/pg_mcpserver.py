@@ -8,61 +8,118 @@ It offers:
 - Data analysis prompts
 """
 
+import asyncio
 import json
 import os
-from typing import Any, Dict, List, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from mcp.server.fastmcp import FastMCP
+import secrets
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mcp.server.fastmcp import Context, FastMCP
 from mcp.server.fastmcp.prompts import base
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+if not __package__:
+    # 作为脚本运行（uv run pg_mcpserver.py、mcp dev）时，按 postgresql 包导入同目录下的子模块
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postgresql.admission import admission, with_admission
+from postgresql.batch import execute_batch_consistent, run_batch_statement
+from postgresql.column_stats import (
+    COLUMN_PROFILE_QUERY,
+    COLUMN_TYPES_QUERY,
+    build_column_profile,
+    choose_sampling,
+    distinct_estimate,
+    scan_column_stats,
+)
+from postgresql.config import (
+    BATCH_CONFIG,
+    COST_GUARD_CONFIG,
+    EXACT_COUNT_TIMEOUT_MS,
+    EXPORT_CONFIG,
+    QUERY_DEFAULT_ROWS,
+    QUERY_MAX_ROWS,
+    RESPONSE_MAX_BYTES,
+)
+from postgresql.cost_guard import (
+    apply_cost_guard,
+    check_readonly_sql,
+    cost_violation,
+    explain_plan,
+    iter_plan_nodes,
+    summarize_plan,
+)
+from postgresql.cursors import (
+    cursor_registry,
+    decode_keyset_token,
+    fetch_keyset_page,
+    get_primary_key_columns,
+    keyset_next_token,
+    resolve_table_name,
+)
+from postgresql.databases import databases, in_database, with_database
+from postgresql.db import (
+    _snapshot_session,
+    aexecute_query,
+    aexecute_query_limited,
+    current_database,
+    get_pool,
+    run_in_db_executor,
+    use_database,
+)
+from postgresql.diagnostics import (
+    DUPLICATE_INDEXES_QUERY,
+    RELATION_SIZES_QUERY,
+    TABLE_ACCESS_STATS_QUERY,
+    TABLE_BLOAT_QUERY,
+    TOP_QUERIES_ORDER,
+    UNUSED_INDEXES_QUERY,
+    fetch_top_queries,
+    run_diagnostic,
+)
+from postgresql.export import (
+    EXPORT_FORMATS,
+    cleanup_exports,
+    export_info,
+    export_query_result,
+    pyarrow,
+    remember_export,
+)
+from postgresql.fkgraph import get_foreign_key_graph
+from postgresql.formatting import (
+    check_output_format,
+    dumps_compact,
+    fit_rows,
+    render_rows,
+    result_columns,
+    result_size,
+)
+from postgresql.metrics import measure_serialization, metrics, with_metrics
+from postgresql.pool import get_db_connection, with_tool_timeouts
+from postgresql.query_cache import query_cache
+from postgresql.row_counts import (
+    ESTIMATED_ROWS_SQL,
+    get_row_count,
+    get_row_count_estimate,
+)
+from postgresql.session import session_key, session_lifespan
+from postgresql.snapshot import get_database_snapshot, get_schema_snapshot
+from postgresql.snapshot_sessions import snapshot_sessions, use_snapshot_session
 
 
 # 创建MCP服务器实例
-mcp = FastMCP("PostgreSQL Database Server")
-
-# 数据库连接配置
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": int(os.getenv("DB_PORT", "5432")),
-    "database": os.getenv("DB_NAME", "postgres"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", ""),
-}
-
-
-def get_db_connection():
-    """获取数据库连接"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except psycopg2.Error as e:
-        raise Exception(f"数据库连接失败: {e}")
-
-
-def execute_query(query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
-    """执行SQL查询并返回结果"""
-    conn = None
-    try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, params)
-            if cur.description:
-                results = cur.fetchall()
-                return [dict(row) for row in results]
-            else:
-                return []
-    except psycopg2.Error as e:
-        raise Exception(f"SQL查询执行失败: {e}")
-    finally:
-        if conn:
-            conn.close()
+mcp = FastMCP("PostgreSQL Database Server", lifespan=session_lifespan)
 
 
 # === 资源：数据库模式信息 ===
 
 
 @mcp.resource("schema://tables")
-def get_all_tables() -> str:
+async def get_all_tables() -> str:
     """获取数据库中所有表的列表"""
     query = """
     SELECT 
@@ -74,20 +131,23 @@ def get_all_tables() -> str:
     ORDER BY schemaname, tablename;
     """
 
-    try:
-        results = execute_query(query)
+    async def load() -> str:
+        results = await aexecute_query(query)
         tables_info = {
-            "database": DB_CONFIG["database"],
+            "database": current_database().config["database"],
             "tables": results,
             "total_count": len(results),
         }
         return json.dumps(tables_info, indent=2, ensure_ascii=False)
+
+    try:
+        return await current_database().schema_cache.get_or_load(("tables",), load)
     except Exception as e:
         return f"获取表列表失败: {str(e)}"
 
 
 @mcp.resource("schema://table/{table_name}")
-def get_table_schema(table_name: str) -> str:
+async def get_table_schema(table_name: str) -> str:
     """获取指定表的详细模式信息"""
     # 获取表结构
     schema_query = """
@@ -114,11 +174,11 @@ def get_table_schema(table_name: str) -> str:
                 pg_catalog.pg_namespace pn 
                 ON pn.oid = pc.relnamespace
             WHERE 
-                pc.relname = 'api_request_log'
+                pc.relname = %s
                 AND pn.nspname = c.table_schema
         )
     WHERE 
-        c.table_name = 'api_request_log'
+        c.table_name = %s
         AND c.table_schema NOT IN ('information_schema', 'pg_catalog')
     ORDER BY 
         c.ordinal_position;
@@ -138,34 +198,42 @@ def get_table_schema(table_name: str) -> str:
     AND tc.table_schema NOT IN ('information_schema', 'pg_catalog');
     """
 
-    # 获取表行数
-    count_query = f"SELECT COUNT(*) as row_count FROM {table_name};"
-
-    try:
-        columns = execute_query(schema_query, (table_name,))
-        constraints = execute_query(constraints_query, (table_name,))
+    async def load() -> str:
+        # 三个查询互不依赖，并发执行；行数使用统计信息估算，避免全表扫描
+        columns, constraints, row_count_info = await asyncio.gather(
+            aexecute_query(schema_query, (table_name, table_name)),
+            aexecute_query(constraints_query, (table_name,)),
+            get_row_count_estimate(table_name),
+            return_exceptions=True,
+        )
+        if isinstance(columns, Exception):
+            raise columns
+        if isinstance(constraints, Exception):
+            raise constraints
 
-        # 安全地执行行数查询
-        try:
-            row_count_result = execute_query(count_query)
-            row_count = row_count_result[0]["row_count"] if row_count_result else 0
-        except Exception:
-            row_count = "无法获取"
+        # 行数查询失败不影响整体结果
+        if isinstance(row_count_info, Exception):
+            row_count_info = {"row_count": "无法获取"}
 
         table_info = {
             "table_name": table_name,
-            "row_count": row_count,
+            "row_count": row_count_info["row_count"],
+            "row_count_source": row_count_info.get("row_count_source"),
+            "last_analyze": row_count_info.get("last_analyze"),
             "columns": columns,
             "constraints": constraints,
         }
 
-        return json.dumps(table_info, indent=2, ensure_ascii=False)
+        return json.dumps(table_info, indent=2, ensure_ascii=False, default=str)
+
+    try:
+        return await current_database().schema_cache.get_or_load(("table", table_name), load)
     except Exception as e:
         return f"获取表 '{table_name}' 的模式信息失败: {str(e)}"
 
 
 @mcp.resource("schema://indexes/{table_name}")
-def get_table_indexes(table_name: str) -> str:
+async def get_table_indexes(table_name: str) -> str:
     """获取指定表的索引信息"""
     query = """
     SELECT 
@@ -177,173 +245,1411 @@ def get_table_indexes(table_name: str) -> str:
     ORDER BY indexname;
     """
 
-    try:
-        results = execute_query(query, (table_name,))
+    async def load() -> str:
+        results = await aexecute_query(query, (table_name,))
         indexes_info = {
             "table_name": table_name,
             "indexes": results,
             "total_count": len(results),
         }
         return json.dumps(indexes_info, indent=2, ensure_ascii=False)
+
+    try:
+        return await current_database().schema_cache.get_or_load(("indexes", table_name), load)
     except Exception as e:
         return f"获取表 '{table_name}' 的索引信息失败: {str(e)}"
 
 
+@mcp.resource("schema://database")
+async def get_database_schema() -> str:
+    """获取整个数据库的结构快照：各模式下所有表的列、注释、约束、外键、索引和大小估算"""
+    try:
+        snapshot = await get_database_snapshot()
+        return dumps_compact(
+            {
+                "database": current_database().config["database"],
+                "schemas": snapshot,
+                "table_count": sum(len(tables) for tables in snapshot.values()),
+            }
+        )
+    except Exception as e:
+        return f"获取数据库结构快照失败: {str(e)}"
+
+
+@mcp.resource("schema://database/{schema_name}")
+async def get_database_schema_by_schema(schema_name: str) -> str:
+    """获取单个模式的结构快照，大型数据库可按模式逐个读取"""
+    try:
+        tables = await get_schema_snapshot(schema_name)
+        return dumps_compact(
+            {
+                "database": current_database().config["database"],
+                "schema": schema_name,
+                "tables": tables,
+                "table_count": len(tables),
+            }
+        )
+    except Exception as e:
+        return f"获取模式 '{schema_name}' 的结构快照失败: {str(e)}"
+
+
+@mcp.resource("pg://{database}/tables")
+async def get_database_tables(database: str) -> str:
+    """获取指定数据库中所有表的列表"""
+    return await in_database(database, get_all_tables)
+
+
+@mcp.resource("pg://{database}/table/{table_name}")
+async def get_database_table_schema(database: str, table_name: str) -> str:
+    """获取指定数据库中表的详细模式信息"""
+    return await in_database(database, get_table_schema, table_name)
+
+
+@mcp.resource("pg://{database}/indexes/{table_name}")
+async def get_database_table_indexes(database: str, table_name: str) -> str:
+    """获取指定数据库中表的索引信息"""
+    return await in_database(database, get_table_indexes, table_name)
+
+
+@mcp.resource("pg://{database}/snapshot")
+async def get_database_snapshot_resource(database: str) -> str:
+    """获取指定数据库的结构快照"""
+    return await in_database(database, get_database_schema)
+
+
+@mcp.resource("pg://{database}/snapshot/{schema_name}")
+async def get_database_schema_snapshot(database: str, schema_name: str) -> str:
+    """获取指定数据库中单个模式的结构快照"""
+    return await in_database(database, get_database_schema_by_schema, schema_name)
+
+
+@mcp.resource("export://{file_name}")
+def get_export(file_name: str) -> str:
+    """获取 export_query 导出文件的信息（路径、行数、大小和预览），文件内容请直接读取该路径"""
+    path = os.path.join(EXPORT_CONFIG["dir"], os.path.basename(file_name))
+    if not os.path.isfile(path):
+        return f"错误: 导出文件 '{file_name}' 不存在或已过期"
+    info = export_info(os.path.basename(file_name))
+    if info is None:
+        # 服务器重启后只能提供文件本身的信息
+        info = {
+            "file": path,
+            "uri": Path(path).resolve().as_uri(),
+            "bytes": os.path.getsize(path),
+        }
+    return json.dumps(info, indent=2, ensure_ascii=False, default=str)
+
+
+@mcp.resource("config://databases")
+def get_databases() -> str:
+    """列出已配置的数据库，工具的 database 参数和 pg:// 资源使用这里的名称"""
+    return json.dumps(
+        {
+            "default": databases.default,
+            "databases": {
+                name: db.describe() for name, db in databases.databases.items()
+            },
+        },
+        indent=2,
+        ensure_ascii=False,
+    )
+
+
+@mcp.resource("stats://pool")
+def get_pool_stats() -> str:
+    """获取数据库连接池的统计信息（只包含已建立连接池的数据库）"""
+    stats = {
+        "databases": {db.name: db.pool.stats() for db in databases.initialized()},
+        "cursors": cursor_registry.stats(),
+        "snapshot_sessions": snapshot_sessions.stats(),
+        "admission": admission.stats(),
+    }
+    return json.dumps(stats, indent=2, ensure_ascii=False)
+
+
+@mcp.resource("stats://cache")
+def get_cache_stats() -> str:
+    """获取模式元数据缓存的统计信息"""
+    return json.dumps(
+        {
+            "databases": {
+                db.name: {
+                    "schema_cache": db.schema_cache.stats(),
+                    "search_index": db.search_index.stats(),
+                }
+                for db in databases.initialized()
+            },
+            "query_cache": query_cache.stats(),
+        },
+        indent=2,
+        ensure_ascii=False,
+    )
+
+
+# 以 gauge 形式输出的统计信息来源（指标名前缀: 说明）
+GAUGE_SOURCES = {
+    "pool": "连接池",
+    "replica_router": "只读副本路由",
+    "schema_cache": "模式元数据缓存",
+    "search_index": "模式搜索索引",
+    "cursors": "服务端游标",
+    "snapshot_sessions": "快照会话",
+    "query_cache": "查询结果缓存",
+    "admission": "HTTP 准入控制",
+}
+
+
+def collect_gauges() -> List[Tuple[str, str, List[Tuple[Dict[str, str], Any]]]]:
+    """把连接池、游标、快照会话和各缓存的统计信息中的数值项转换为指标，与 stats:// 资源一致"""
+    families: Dict[Tuple[str, str], List[Tuple[Dict[str, str], Any]]] = {}
+
+    def add(source: str, stats: Dict[str, Any], labels: Dict[str, str]) -> None:
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                families.setdefault((source, key), []).append((labels, value))
+
+    for db in databases.initialized():
+        pool_stats = db.pool.stats()
+        if "replicas" in pool_stats:
+            add("replica_router", pool_stats, {"database": db.name})
+            add("pool", pool_stats["primary"], {"database": db.name, "target": "primary"})
+            for name, replica_stats in pool_stats["replicas"].items():
+                add("pool", replica_stats, {"database": db.name, "target": name})
+        else:
+            add("pool", pool_stats, {"database": db.name, "target": "primary"})
+        add("schema_cache", db.schema_cache.stats(), {"database": db.name})
+        add("search_index", db.search_index.stats(), {"database": db.name})
+    add("cursors", cursor_registry.stats(), {})
+    add("snapshot_sessions", snapshot_sessions.stats(), {})
+    add("query_cache", query_cache.stats(), {})
+    add("admission", admission.stats(), {})
+    return [
+        (f"pg_mcp_{source}_{key}", f"{GAUGE_SOURCES[source]}统计信息中的 {key}", samples)
+        for (source, key), samples in sorted(families.items())
+    ]
+
+
+def render_metrics() -> str:
+    """Prometheus 文本格式的运行指标"""
+    return metrics.render(collect_gauges())
+
+
+@mcp.resource("stats://metrics", mime_type="text/plain")
+def get_metrics() -> str:
+    """
+    获取 Prometheus 文本格式的运行指标
+
+    包括各工具的调用次数、错误次数、耗时分布（总耗时、数据库耗时与序列化耗时）、
+    读取的行数和响应大小，以及连接池和缓存的统计信息。HTTP 模式下同样可以通过 /metrics 抓取。
+    """
+    return render_metrics()
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> Response:
+    """HTTP 模式下供 Prometheus 抓取的运行指标"""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # === 工具：SQL查询执行 ===
 
 
 @mcp.tool()
-def execute_readonly_query(sql: str) -> str:
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def execute_readonly_query(
+    ctx: Context,
+    sql: str,
+    max_rows: int = QUERY_DEFAULT_ROWS,
+    paginate: bool = False,
+    use_cache: bool = True,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
     """
     执行只读SQL查询
 
     Args:
         sql: 要执行的SQL查询语句（只支持SELECT语句）
+        max_rows: 最多返回的行数（默认100行，上限由 QUERY_MAX_ROWS 配置，默认1000行）
+        paginate: 是否保留服务端游标以便分页。为true且结果被截断时返回 next_token，
+            可通过 fetch_next_page 工具读取下一页而无需重新执行查询
+        use_cache: 服务器启用了结果缓存时是否允许返回缓存结果（需要最新数据时设为false）
+        output_format: 输出格式：json（默认）、columnar（列名只出现一次，最紧凑）、
+            csv、tsv、markdown（文本格式的第一行为JSON元信息）
+        max_bytes: 响应的最大字节数，超出时截断结果行（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
 
     Returns:
-        查询结果的JSON格式字符串
+        查询结果。结果被截断时 total_count 为 null。执行前会用 EXPLAIN 检查估算代价，
+        超过服务器配置的阈值时拒绝执行或改写查询（改写时元信息中包含 cost_guard）
     """
+    error = check_output_format(output_format)
+    if error:
+        return error
+
     # 检查是否为只读查询
-    sql_upper = sql.strip().upper()
-    readonly_keywords = ["SELECT", "WITH"]
-    forbidden_keywords = [
-        "INSERT",
-        "UPDATE",
-        "DELETE",
-        "DROP",
-        "CREATE",
-        "ALTER",
-        "TRUNCATE",
-    ]
+    error = check_readonly_sql(sql)
+    if error:
+        return error
+
+    max_rows = max(1, min(max_rows, QUERY_MAX_ROWS))
 
-    if not any(sql_upper.startswith(keyword) for keyword in readonly_keywords):
-        return "错误: 只支持SELECT和WITH查询语句"
+    try:
+        next_token = None
+        cached = False
+        cache_key = None
+        # 快照会话中的查询必须读取会话的快照，不使用缓存结果
+        if query_cache.enabled and not paginate and _snapshot_session.get() is None:
+            cache_key = query_cache.make_key(sql, max_rows)
+
+        rewrite = None
+        if paginate:
+            # 分页需要读取后续行，不能用LIMIT改写
+            error, executed_sql, rewrite = await apply_cost_guard(
+                sql, max_rows, allow_limit=False
+            )
+            if error:
+                return error
+            results, next_token = await run_in_db_executor(
+                cursor_registry.open, session_key(ctx), executed_sql, None, max_rows
+            )
+            truncated = next_token is not None
+        else:
+            hit = query_cache.get(cache_key) if cache_key and use_cache else None
+            if hit is not None:
+                results, truncated = hit
+                cached = True
+            else:
+                error, executed_sql, rewrite = await apply_cost_guard(sql, max_rows)
+                if error:
+                    return error
+                generation = query_cache.generation
+                # 服务端游标只拉取 max_rows + 1 行，用于判断是否截断
+                results, truncated = await aexecute_query_limited(
+                    executed_sql, max_rows=max_rows
+                )
+                # 抽样结果每次都不同，不缓存
+                if cache_key and not (rewrite and rewrite["rewrite"] == "tablesample"):
+                    query_cache.set(
+                        cache_key, (results, truncated), result_size(results), generation
+                    )
+
+        def build_meta(kept: int) -> Dict[str, Any]:
+            cut = kept < len(results)
+            meta = {
+                "query": sql,
+                "row_count": kept,
+                # 只有结果未被截断时总行数才是已知的
+                "total_count": None if truncated or cut else kept,
+                "truncated": truncated or cut,
+            }
+            if cut:
+                meta["truncated_by_bytes"] = True
+            if paginate:
+                meta["next_token"] = next_token
+            if cached:
+                meta["cached"] = True
+            if rewrite:
+                meta["cost_guard"] = {**rewrite, "executed_query": executed_sql}
+            return meta
+
+        text, kept = render_rows(results, output_format, build_meta, "results", max_bytes)
+        if paginate and next_token and kept < len(results):
+            # 超出字节预算的行放回游标，下一页从这些行开始
+            await run_in_db_executor(
+                cursor_registry.unread, session_key(ctx), next_token, results[kept:]
+            )
+        return text
+
+    except Exception as e:
+        return f"查询执行失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def execute_readonly_batch(
+    queries: List[str],
+    max_rows: int = QUERY_DEFAULT_ROWS,
+    consistent: bool = False,
+    use_cache: bool = True,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    在一次调用中执行多条只读SQL查询，适合一次分析需要的多个小型聚合查询
 
-    if any(keyword in sql_upper for keyword in forbidden_keywords):
-        return "错误: 不允许执行修改数据的SQL语句"
+    默认各语句使用连接池中的多个连接并发执行；consistent 为true时所有语句在同一连接的
+    同一个 REPEATABLE READ 只读事务中依次执行，看到同一个数据快照，结果之间相互一致。
+    单条语句失败不影响其他语句。
+
+    Args:
+        queries: 要执行的SQL查询语句列表（只支持SELECT和WITH语句）
+        max_rows: 每条语句最多返回的行数（默认100行，上限由 QUERY_MAX_ROWS 配置）
+        consistent: 是否在同一个一致性快照中执行所有语句（默认false，并发执行）
+        use_cache: 并发模式下是否允许返回缓存结果（一致性快照模式不使用缓存）
+        output_format: 输出格式：json（默认）或 columnar（每条语句的列名只出现一次）
+        max_bytes: 响应的最大字节数，按语句平均分配，超出时截断各语句的结果行（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        按输入顺序排列的每条语句的结果、耗时（毫秒）或错误信息
+    """
+    if output_format not in ("json", "columnar"):
+        return "错误: output_format 只支持 json, columnar"
+    if not queries:
+        return "错误: queries 不能为空"
+    if len(queries) > BATCH_CONFIG["max_statements"]:
+        return f"错误: 单次最多执行 {BATCH_CONFIG['max_statements']} 条语句"
+
+    max_rows = max(1, min(max_rows, QUERY_MAX_ROWS))
+    start = time.perf_counter()
+    outcomes: Dict[int, Dict[str, Any]] = {}
+    runnable = []
+    for index, sql in enumerate(queries):
+        error = check_readonly_sql(sql)
+        if error:
+            outcomes[index] = {"error": error}
+        else:
+            runnable.append((index, sql))
 
     try:
-        results = execute_query(sql)
+        semaphore = asyncio.Semaphore(max(1, BATCH_CONFIG["concurrency"]))
+        if consistent:
+            # 代价检查只需要执行计划，可以在其他连接上并发完成
+            async def guard(sql: str) -> Tuple[Optional[str], str, Optional[Dict[str, Any]]]:
+                async with semaphore:
+                    return await apply_cost_guard(sql, max_rows)
+
+            guarded = await asyncio.gather(
+                *(guard(sql) for _, sql in runnable), return_exceptions=True
+            )
+            statements = []
+            rewrites = {}
+            for (index, _), result in zip(runnable, guarded):
+                if isinstance(result, BaseException):
+                    outcomes[index] = {"error": str(result)}
+                elif result[0]:
+                    outcomes[index] = {"error": result[0]}
+                else:
+                    statements.append((index, result[1]))
+                    if result[2]:
+                        rewrites[index] = {**result[2], "executed_query": result[1]}
+            if statements:
+                executed = await run_in_db_executor(
+                    execute_batch_consistent, statements, max_rows
+                )
+                for index, outcome in executed.items():
+                    if index in rewrites:
+                        outcome["cost_guard"] = rewrites[index]
+                    outcomes[index] = outcome
+        else:
+            results = await asyncio.gather(
+                *(
+                    run_batch_statement(sql, max_rows, use_cache, semaphore)
+                    for _, sql in runnable
+                )
+            )
+            outcomes.update(zip((index for index, _ in runnable), results))
+    except Exception as e:
+        return f"批量查询执行失败: {str(e)}"
+
+    budget = max_bytes // len(queries) if max_bytes > 0 else 0
+    statements_out = []
+    for index, sql in enumerate(queries):
+        outcome = outcomes[index]
+        entry: Dict[str, Any] = {"index": index, "query": sql}
+        if "error" in outcome:
+            entry["error"] = outcome["error"]
+            if "elapsed_ms" in outcome:
+                entry["elapsed_ms"] = outcome["elapsed_ms"]
+            statements_out.append(entry)
+            continue
+        rows = outcome["results"]
+        kept = len(rows)
+        if budget:
+            # 预留语句文本和元信息的空间
+            overhead = 320 + len(sql.encode("utf-8"))
+            with measure_serialization():
+                kept = fit_rows(rows, budget - overhead, output_format)
+        entry["row_count"] = kept
+        entry["truncated"] = outcome["truncated"] or kept < len(rows)
+        if kept < len(rows):
+            entry["truncated_by_bytes"] = True
+        entry["elapsed_ms"] = outcome["elapsed_ms"]
+        for key in ("cached", "cost_guard"):
+            if key in outcome:
+                entry[key] = outcome[key]
+        if output_format == "columnar":
+            columns = result_columns(rows[:kept])
+            entry["columns"] = columns
+            entry["rows"] = [[row.get(col) for col in columns] for row in rows[:kept]]
+        else:
+            entry["results"] = rows[:kept]
+        statements_out.append(entry)
+
+    response = {
+        "mode": "consistent" if consistent else "concurrent",
+        "statement_count": len(queries),
+        "failed_count": sum(1 for entry in statements_out if "error" in entry),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        "statements": statements_out,
+    }
+    with measure_serialization():
+        if output_format == "columnar":
+            return dumps_compact(response)
+        return json.dumps(response, indent=2, ensure_ascii=False, default=str)
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def export_query(
+    sql: str,
+    file_format: str = "csv",
+    preview_rows: int = 5,
+    database: Optional[str] = None,
+) -> str:
+    """
+    把只读查询的完整结果导出到服务器本地文件，适合需要全部数据而不只是前几行的分析
+
+    通过 COPY 流式写入文件，内存占用与结果大小无关。返回文件路径、资源URI、行数、
+    文件大小和前几行预览，而不是数据本身。不受交互查询的代价上限限制，
+    服务器配置了 QUERY_EXPORT_MAX_COST 时按导出代价上限检查。
 
-        return json.dumps(
+    Args:
+        sql: 要导出的SQL查询语句（只支持SELECT和WITH语句）
+        file_format: 文件格式：csv（默认）、csv.gz（gzip压缩的CSV）、
+            parquet（列式格式，需要服务器安装 pyarrow）
+        preview_rows: 预览的行数（默认5，最多20）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        导出结果的JSON格式字符串，包含 file、uri、resource、row_count、bytes 和 preview
+    """
+    if file_format not in EXPORT_FORMATS:
+        return f"错误: file_format 只支持 {', '.join(EXPORT_FORMATS)}"
+    if file_format == "parquet" and pyarrow is None:
+        return "错误: 导出 parquet 格式需要在服务器上安装 pyarrow"
+    error = check_readonly_sql(sql)
+    if error:
+        return error
+
+    try:
+        # 导出需要读取全部结果，按完整代价和单独的导出代价上限检查，且不做抽样等改写
+        if EXPORT_CONFIG["max_cost"]:
+            plan = await explain_plan(sql)
+            reason = cost_violation(
+                plan, int(plan["Plan Rows"]), EXPORT_CONFIG["max_cost"], 0
+            )
+            if reason:
+                return (
+                    f"错误: 查询的{reason}，已拒绝导出。"
+                    "请使用 explain_query 查看执行计划，添加过滤条件或缩小查询范围后重试"
+                )
+
+        directory = EXPORT_CONFIG["dir"]
+        os.makedirs(directory, exist_ok=True)
+        cleanup_exports(directory, EXPORT_CONFIG["ttl"])
+        name = (
+            f"export_{time.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+            f"{EXPORT_FORMATS[file_format]}"
+        )
+        path = os.path.join(directory, name)
+        start = time.perf_counter()
+        result = await run_in_db_executor(
+            export_query_result, sql, file_format, path, max(0, min(preview_rows, 20))
+        )
+        info = {
+            "file": path,
+            "uri": Path(path).resolve().as_uri(),
+            "resource": f"export://{name}",
+            **result,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            "database": current_database().name,
+            "query": sql,
+        }
+        remember_export(name, info)
+        return json.dumps(info, indent=2, ensure_ascii=False, default=str)
+    except Exception as e:
+        return f"导出失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def explain_query(
+    sql: str, max_rows: int = QUERY_DEFAULT_ROWS, database: Optional[str] = None
+) -> str:
+    """
+    查看只读查询的执行计划摘要，不会真正执行查询
+
+    返回估算代价与行数、对哪些表做了顺序扫描（及表的估算大小）、使用了哪些索引、
+    连接方式和排序，以及潜在问题提示。可在执行较重的查询前用它检查并优化SQL；
+    结果同时说明 execute_readonly_query 的代价检查是否会拒绝或改写该查询。
+
+    Args:
+        sql: 要分析的SQL查询语句（只支持SELECT和WITH语句）
+        max_rows: 计划读取的行数，用于折算实际代价（默认100）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        执行计划摘要的JSON格式字符串
+    """
+    error = check_readonly_sql(sql)
+    if error:
+        return error
+    max_rows = max(1, min(max_rows, QUERY_MAX_ROWS))
+
+    try:
+        plan = await explain_plan(sql, verbose=True)
+        scanned = sorted(
             {
-                "query": sql,
-                "row_count": len(results),
-                "results": results[:100],  # 限制返回前100行
-                "truncated": len(results) > 100,
-            },
-            indent=2,
-            ensure_ascii=False,
-            default=str,
+                (node["Schema"], node["Relation Name"])
+                for node in iter_plan_nodes(plan)
+                if node["Node Type"] == "Seq Scan" and "Schema" in node
+            }
         )
+        table_rows = {}
+        if scanned:
+            rows = await aexecute_query(
+                f"""
+                SELECT n.nspname || '.' || c.relname AS table_name,
+                    {ESTIMATED_ROWS_SQL} AS estimated_rows
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN unnest(%s::text[], %s::text[]) AS t(schema_name, table_name)
+                    ON t.schema_name = n.nspname AND t.table_name = c.relname;
+                """,
+                ([s for s, _ in scanned], [t for _, t in scanned]),
+            )
+            table_rows = {row["table_name"]: row["estimated_rows"] for row in rows}
+
+        result = {"query": sql, "plan": summarize_plan(plan, max_rows + 1, table_rows)}
+        reason = cost_violation(plan, max_rows + 1)
+        if reason:
+            result["cost_guard"] = {
+                "exceeded": reason,
+                "action": COST_GUARD_CONFIG["action"],
+            }
+        return json.dumps(result, indent=2, ensure_ascii=False, default=str)
 
     except Exception as e:
-        return f"查询执行失败: {str(e)}"
+        return f"分析执行计划失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+def invalidate_query_cache(tables: Optional[List[str]] = None) -> str:
+    """
+    使查询结果缓存失效
+
+    Args:
+        tables: 数据发生变化的表名列表，为空时清空全部缓存
+
+    Returns:
+        失效的缓存条目数
+    """
+    if tables:
+        removed = query_cache.invalidate_tables(tables)
+        return f"已失效 {removed} 条引用 {', '.join(tables)} 的缓存结果"
+    entries = query_cache.stats()["entries"]
+    query_cache.clear()
+    return f"已清空查询结果缓存（{entries} 条）"
 
 
 @mcp.tool()
-def get_sample_data(table_name: str, limit: int = 10) -> str:
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def get_sample_data(
+    ctx: Context,
+    table_name: str,
+    limit: int = 10,
+    paginate: bool = False,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
     """
     获取表的样本数据
 
     Args:
         table_name: 表名
         limit: 返回的行数限制（默认10行，最大100行）
+        paginate: 表没有主键（如视图）时是否保留服务端游标以便分页。游标在页与页之间
+            占用一个连接，默认只读取一页并立即释放连接；有主键的表总是可以续页
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数，超出时截断结果行（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
 
     Returns:
-        样本数据的JSON格式字符串
+        样本数据。还有更多数据时返回 next_token，可通过 fetch_next_page 工具继续读取
     """
+    error = check_output_format(output_format)
+    if error:
+        return error
     if limit > 100:
         limit = 100
 
-    query = f"SELECT * FROM {table_name} LIMIT %s;"
-
     try:
-        results = execute_query(query, (limit,))
+        # 表名经 regclass 解析为规范标识符后再拼入SQL，续页令牌中记录的也是解析后的表名
+        table_name = await run_in_db_executor(resolve_table_name, table_name)
 
-        return json.dumps(
-            {
+        def build_meta(kept: int) -> Dict[str, Any]:
+            return {
                 "table_name": table_name,
-                "sample_size": len(results),
+                "sample_size": kept,
                 "requested_limit": limit,
-                "data": results,
-            },
-            indent=2,
-            ensure_ascii=False,
-            default=str,
+            }
+
+        # 有主键时按主键keyset分页，令牌本身记录位置，不占用连接
+        key_columns = await run_in_db_executor(get_primary_key_columns, table_name)
+        if key_columns:
+            results, keys, has_more = await run_in_db_executor(
+                fetch_keyset_page, table_name, key_columns, limit
+            )
+            return render_keyset_page(
+                table_name, key_columns, limit, results, keys, has_more,
+                output_format, max_bytes, build_meta,
+            )
+
+        if not paginate:
+            # 只读取一页（多读一行判断是否还有数据），连接随即归还连接池
+            results, truncated = await aexecute_query_limited(
+                f"SELECT * FROM {table_name}", max_rows=limit
+            )
+            text, _ = render_rows(
+                results,
+                output_format,
+                lambda kept: {
+                    **build_meta(kept),
+                    "truncated": truncated or kept < len(results),
+                },
+                "data",
+                max_bytes,
+            )
+            return text
+
+        session = session_key(ctx)
+        results, next_token = await run_in_db_executor(
+            cursor_registry.open, session, f"SELECT * FROM {table_name}", None, limit
+        )
+        return await render_cursor_page(
+            session, results, next_token, output_format, max_bytes, build_meta
         )
 
     except Exception as e:
         return f"获取表 '{table_name}' 样本数据失败: {str(e)}"
 
 
+def render_keyset_page(
+    table_name: str,
+    key_columns: List[str],
+    limit: int,
+    results: List[Dict[str, Any]],
+    keys: List[List[Any]],
+    has_more: bool,
+    output_format: str,
+    max_bytes: int,
+    build_meta: Callable[[int], Dict[str, Any]],
+) -> str:
+    """渲染keyset分页结果，续页令牌指向实际返回的最后一行"""
+
+    def meta_with_token(kept: int) -> Dict[str, Any]:
+        next_token = None
+        if kept and (has_more or kept < len(results)):
+            next_token = keyset_next_token(table_name, key_columns, keys[kept - 1], limit)
+        return {**build_meta(kept), "next_token": next_token}
+
+    text, _ = render_rows(results, output_format, meta_with_token, "data", max_bytes)
+    return text
+
+
+async def render_cursor_page(
+    session: str,
+    results: List[Dict[str, Any]],
+    next_token: Optional[str],
+    output_format: str,
+    max_bytes: int,
+    build_meta: Callable[[int], Dict[str, Any]],
+    rows_key: str = "data",
+) -> str:
+    """渲染服务端游标分页结果，超出字节预算的行放回游标"""
+    text, kept = render_rows(
+        results,
+        output_format,
+        lambda kept: {**build_meta(kept), "next_token": next_token},
+        rows_key,
+        max_bytes,
+    )
+    if next_token and kept < len(results):
+        await run_in_db_executor(
+            cursor_registry.unread, session, next_token, results[kept:]
+        )
+    return text
+
+
 @mcp.tool()
-def analyze_table_stats(table_name: str) -> str:
+@with_metrics
+@with_admission
+@with_tool_timeouts
+async def fetch_next_page(
+    ctx: Context,
+    token: str,
+    page_size: int = 0,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+) -> str:
     """
-    分析表的统计信息
+    根据续页令牌读取下一页结果
 
     Args:
-        table_name: 要分析的表名
+        token: execute_readonly_query、get_sample_data（无主键的表需 paginate=true）返回的 next_token
+        page_size: 本页行数，0表示沿用首次请求的行数
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数，超出时截断结果行（0表示不限制）
 
     Returns:
-        表统计信息的JSON格式字符串
+        下一页结果，next_token 为 null 表示已读取完毕
     """
-    # 获取表的基本统计信息
-    stats_query = f"""
-    SELECT 
-        COUNT(*) as total_rows
-    FROM {table_name};
+    error = check_output_format(output_format)
+    if error:
+        return error
+
+    try:
+        if token.startswith("k."):
+            state = decode_keyset_token(token)
+            limit = min(page_size or state["n"], 100)
+            # 令牌记录了生成它的数据库，续页在同一数据库中读取
+            with use_database(state.get("d")) as database, use_snapshot_session(database):
+                results, keys, has_more = await run_in_db_executor(
+                    fetch_keyset_page, state["t"], state["k"], limit, state["v"]
+                )
+                return render_keyset_page(
+                    state["t"], state["k"], limit, results, keys, has_more,
+                    output_format, max_bytes,
+                    lambda kept: {"table_name": state["t"], "row_count": kept},
+                )
+
+        page_size = max(1, min(page_size or QUERY_DEFAULT_ROWS, QUERY_MAX_ROWS))
+        session = session_key(ctx)
+        results, next_token, rows_fetched = await run_in_db_executor(
+            cursor_registry.fetch, session, token, page_size
+        )
+        return await render_cursor_page(
+            session, results, next_token, output_format, max_bytes,
+            lambda kept: {
+                "row_count": kept,
+                "rows_fetched": rows_fetched - (len(results) - kept),
+            },
+            "results",
+        )
+
+    except Exception as e:
+        return f"读取下一页失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_tool_timeouts
+async def close_cursor(ctx: Context, token: str) -> str:
     """
+    关闭不再需要的分页游标，提前释放其占用的数据库连接
 
-    # 获取数值列的统计信息
-    numeric_stats_query = """
-    SELECT 
-        column_name,
-        data_type
-    FROM information_schema.columns 
-    WHERE table_name = %s 
-    AND data_type IN ('integer', 'bigint', 'decimal', 'numeric', 'real', 'double precision')
-    AND table_schema NOT IN ('information_schema', 'pg_catalog');
+    Args:
+        token: execute_readonly_query 返回的 next_token
+
+    Returns:
+        操作结果
+    """
+    closed = await run_in_db_executor(cursor_registry.close, session_key(ctx), token)
+    return "游标已关闭" if closed else "游标不存在或已过期"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def open_snapshot_session(
+    ctx: Context,
+    export_snapshot: bool = False,
+    idle_timeout: float = 0,
+    database: Optional[str] = None,
+) -> str:
     """
+    打开快照会话：之后本会话的工具调用都在同一个 REPEATABLE READ 只读事务中执行
+
+    适合需要多次查询的分析（如数据质量报告）：所有查询看到同一个数据快照，结果之间相互一致，
+    并且固定使用同一个连接，复用已预备的目录查询。分析结束后请调用 close_snapshot_session。
+    再次调用会关闭当前会话并以新的快照重新打开。
+
+    Args:
+        export_snapshot: 是否导出快照。导出后会话连接正忙时的并发调用和分页游标
+            使用导入同一快照的其他连接并行执行，返回的 snapshot_id 也可用于
+            外部工具（SET TRANSACTION SNAPSHOT 或 pg_dump --snapshot）
+        idle_timeout: 空闲超过该秒数后自动关闭会话（0表示使用服务器默认值）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
 
+    Returns:
+        会话信息的JSON格式字符串
+    """
     try:
-        # 基本统计
-        basic_stats = execute_query(stats_query)
+        session = await run_in_db_executor(
+            snapshot_sessions.open,
+            session_key(ctx),
+            current_database(),
+            export_snapshot,
+            max(0.0, idle_timeout),
+        )
+        return json.dumps(session.describe(), indent=2, ensure_ascii=False)
+    except Exception as e:
+        return f"打开快照会话失败: {str(e)}"
 
-        # 数值列信息
-        numeric_columns = execute_query(numeric_stats_query, (table_name,))
 
-        # 为每个数值列计算统计信息
+@mcp.tool()
+@with_metrics
+@with_tool_timeouts
+async def close_snapshot_session(ctx: Context) -> str:
+    """
+    关闭本会话的快照会话，结束事务并释放其占用的数据库连接
+
+    Returns:
+        被关闭会话的统计信息
+    """
+    session = await run_in_db_executor(snapshot_sessions.close, session_key(ctx))
+    if session is None:
+        return "当前没有打开的快照会话"
+    return json.dumps(session.describe(), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def analyze_table_stats(
+    table_name: str,
+    exact_count: bool = False,
+    count_timeout_ms: int = EXACT_COUNT_TIMEOUT_MS,
+    sample_method: str = "auto",
+    sample_percent: float = 0,
+    exact_distinct: bool = False,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    分析表的统计信息
+
+    所有列的统计量在一次扫描中计算：空值比例，数值列的最小/最大/平均值，
+    日期时间列的最小/最大值，文本列的长度范围，布尔列的真值数量。
+    不同值数量默认取自 pg_stats 的估算（distinct_estimate，表未分析过时为null）。
+
+    Args:
+        table_name: 要分析的表名
+        exact_count: 是否执行 COUNT(*) 获取精确行数（默认使用统计信息估算，不扫描全表）
+        count_timeout_ms: 精确计数的超时毫秒数，超时后返回估算值
+        sample_method: 抽样方式：auto（大表自动按块抽样）、none（全表扫描）、
+            system（按数据块抽样，速度快）、bernoulli（按行抽样，更均匀）
+        sample_percent: 抽样百分比（0-100），为0时按估算行数自动计算
+        exact_distinct: 是否在扫描中用 COUNT(DISTINCT) 计算不同值数量（distinct_count），
+            每列需要额外的排序或哈希，宽表上明显变慢
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown，
+            非json格式时列统计以每列一行的表格输出
+        max_bytes: 响应的最大字节数（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        表统计信息。抽样时列统计量（如不同值数量）基于样本计算；
+        个别列无法计算时该列只返回 error，其余列照常返回
+    """
+    error = check_output_format(output_format)
+    if error:
+        return error
+    sample_method = sample_method.lower()
+    if sample_method not in ("auto", "none", "system", "bernoulli"):
+        return "错误: sample_method 只支持 auto、none、system、bernoulli"
+
+    try:
+        row_count_info, columns = await asyncio.gather(
+            get_row_count(table_name, exact_count, count_timeout_ms),
+            aexecute_query(COLUMN_TYPES_QUERY, (table_name,), prepared="mcp_column_types"),
+        )
+
+        sampling = choose_sampling(
+            row_count_info.get("row_count"), sample_method, sample_percent
+        )
+        scanned_rows, scanned = await scan_column_stats(
+            table_name, columns, sampling, exact_distinct
+        )
+
+        # 全表扫描时顺便得到了精确行数
+        if sampling is None and scanned_rows is not None:
+            row_count_info["row_count"] = scanned_rows
+            row_count_info["row_count_source"] = "exact"
+
         column_stats = {}
-        for col in numeric_columns:
-            col_name = col["column_name"]
-            try:
-                col_query = f"""
-                SELECT 
-                    MIN({col_name}) as min_value,
-                    MAX({col_name}) as max_value,
-                    AVG({col_name}) as avg_value,
-                    COUNT({col_name}) as non_null_count,
-                    COUNT(*) - COUNT({col_name}) as null_count
-                FROM {table_name};
-                """
-                col_result = execute_query(col_query)
-                column_stats[col_name] = col_result[0] if col_result else {}
-            except Exception:
-                column_stats[col_name] = {"error": "无法计算统计信息"}
+        for col in columns:
+            stats: Dict[str, Any] = {"data_type": col["data_type"]}
+            stats.update(scanned[col["column_name"]])
+            if "non_null_count" in stats:
+                stats["null_count"] = scanned_rows - stats["non_null_count"]
+                stats["null_ratio"] = (
+                    round(stats["null_count"] / scanned_rows, 4) if scanned_rows else None
+                )
+            stats["distinct_estimate"] = distinct_estimate(
+                col["n_distinct"], row_count_info.get("row_count")
+            )
+            column_stats[col["column_name"]] = stats
 
         analysis_result = {
             "table_name": table_name,
-            "basic_stats": basic_stats[0] if basic_stats else {},
-            "numeric_columns_stats": column_stats,
+            "basic_stats": {
+                "total_rows": row_count_info.pop("row_count"),
+                **row_count_info,
+            },
+            "sampling": {
+                "method": sampling[0].lower() if sampling else "none",
+                "percent": sampling[1] if sampling else 100,
+                "scanned_rows": scanned_rows,
+            },
         }
 
-        return json.dumps(analysis_result, indent=2, ensure_ascii=False, default=str)
+        if output_format == "json":
+            analysis_result["column_stats"] = column_stats
+            return json.dumps(
+                analysis_result, indent=2, ensure_ascii=False, default=str
+            )
+
+        rows = [{"column_name": name, **stats} for name, stats in column_stats.items()]
+
+        def build_meta(kept: int) -> Dict[str, Any]:
+            if kept < len(rows):
+                return {**analysis_result, "truncated_by_bytes": True}
+            return analysis_result
+
+        text, _ = render_rows(rows, output_format, build_meta, "column_stats", max_bytes)
+        return text
 
     except Exception as e:
         return f"分析表 '{table_name}' 统计信息失败: {str(e)}"
 
 
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def profile_table(
+    table_name: str, top_n: int = 10, database: Optional[str] = None
+) -> str:
+    """
+    基于 pg_stats 快速生成表的列画像，无论表多大都在毫秒级返回
+
+    只读取优化器统计信息，不扫描表数据：每列的空值比例、不同值数量估算、
+    高频值及其频率、分布分位点（来自直方图）以及物理顺序相关性。
+    统计信息来自最近一次ANALYZE，结果为估算值。
+
+    Args:
+        table_name: 表名
+        top_n: 每列最多返回的高频值数量（默认10）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        列画像的JSON格式字符串
+    """
+    try:
+        rows = await aexecute_query(
+            COLUMN_PROFILE_QUERY, (table_name,), prepared="mcp_column_profile"
+        )
+        if not rows:
+            return f"表 '{table_name}' 没有可分析的列"
+
+        estimated_rows = rows[0]["estimated_rows"]
+        columns = {
+            row["column_name"]: build_column_profile(row, estimated_rows, top_n)
+            for row in rows
+        }
+        missing = [name for name, p in columns.items() if p.get("has_stats") is False]
+
+        result = {
+            "table_name": table_name,
+            "estimated_rows": estimated_rows,
+            "last_analyze": rows[0]["last_analyze"],
+            "columns": columns,
+        }
+        if missing:
+            result["columns_without_stats"] = missing
+            result["hint"] = "部分列没有统计信息，可由DBA执行 ANALYZE 后重试，或使用 analyze_table_stats"
+
+        return json.dumps(result, indent=2, ensure_ascii=False, default=str)
+
+    except Exception as e:
+        return f"生成表 '{table_name}' 列画像失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def search_schema(
+    query: str,
+    limit: int = 20,
+    kind: str = "all",
+    schema_name: Optional[str] = None,
+    database: Optional[str] = None,
+) -> str:
+    """
+    按关键词搜索表和列，适合表数量很多、无法列出全部表的数据库
+
+    在内存倒排索引中匹配表名、列名及其注释：名称按 snake_case 和 camelCase 拆分，
+    支持前缀匹配和拼写相近的模糊匹配，结果按相关度排序。
+
+    Args:
+        query: 搜索关键词，如 "customer email" 或 "订单金额"
+        limit: 最多返回的结果数量（默认20）
+        kind: 结果类型，all（默认）、table 或 column
+        schema_name: 只在指定模式中搜索
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        按相关度排序的匹配结果JSON格式字符串
+    """
+    if kind not in ("all", "table", "column"):
+        return f"不支持的结果类型 '{kind}'，可选值: all, table, column"
+    try:
+        search_index = current_database().search_index
+        await search_index.refresh()
+        start = time.perf_counter()
+        results, total = search_index.search(
+            query, max(1, min(limit, QUERY_MAX_ROWS)), kind, schema_name
+        )
+        result = {
+            "query": query,
+            "results": results,
+            "total_matches": total,
+            "search_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+        if not results:
+            result["hint"] = "没有匹配结果，可以尝试更短的关键词或关键词的前缀"
+        return json.dumps(result, indent=2, ensure_ascii=False, default=str)
+
+    except Exception as e:
+        return f"搜索数据库结构失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def find_join_path(
+    from_table: str,
+    to_table: str,
+    max_paths: int = 3,
+    max_depth: int = 6,
+    database: Optional[str] = None,
+) -> str:
+    """
+    根据外键关系查找两张表之间的最短连接路径及连接条件
+
+    在缓存的整库外键关系图中搜索，无需逐表查询约束；
+    外键可以沿任一方向使用，返回每一步的连接条件和可直接使用的 FROM ... JOIN 子句。
+
+    Args:
+        from_table: 起始表名，可写为 "模式.表"
+        to_table: 目标表名，可写为 "模式.表"
+        max_paths: 最多返回的等长最短路径数量（默认3）
+        max_depth: 最多经过的连接次数（默认6）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        连接路径的JSON格式字符串
+    """
+    try:
+        graph = await get_foreign_key_graph()
+        source = graph.resolve(from_table)
+        target = graph.resolve(to_table)
+        if source == target:
+            return "起始表和目标表相同，无需连接"
+        paths = graph.shortest_paths(
+            source, target, max(1, max_paths), max(1, min(max_depth, 20))
+        )
+        if not paths:
+            return (
+                f"在 {max_depth} 次连接内没有找到从 '{from_table}' 到 '{to_table}' 的"
+                "外键路径，可能需要按业务字段手动连接"
+            )
+        result = {
+            "from_table": f"{source[0]}.{source[1]}",
+            "to_table": f"{target[0]}.{target[1]}",
+            "paths": [graph.describe_path(path) for path in paths],
+        }
+        return json.dumps(result, indent=2, ensure_ascii=False)
+
+    except Exception as e:
+        return f"查找连接路径失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def get_table_access_stats(
+    schema_name: Optional[str] = None,
+    table_name: Optional[str] = None,
+    limit: int = 20,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    查看各表的访问方式，找出缺少索引的表
+
+    返回顺序扫描与索引扫描次数、顺序扫描比例、每次顺序扫描平均读取的行数、
+    表和索引的缓存命中率、增删改次数及最近的 VACUUM/ANALYZE 时间。
+    结果按顺序扫描读取的总行数排序：排在前面、顺序扫描比例高且表较大的表最可能缺少索引。
+
+    Args:
+        schema_name: 只查看指定模式
+        table_name: 只查看指定表（不含模式名）
+        limit: 最多返回的行数（默认20，最多100）
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        诊断结果
+    """
+    try:
+        return await run_diagnostic(
+            TABLE_ACCESS_STATS_QUERY, schema_name, table_name, limit, output_format, max_bytes
+        )
+    except Exception as e:
+        return f"读取表访问统计失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def find_unused_indexes(
+    schema_name: Optional[str] = None,
+    table_name: Optional[str] = None,
+    limit: int = 20,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    查找统计信息重置以来从未被使用过的索引，按索引大小排序
+
+    不包括主键、唯一约束等约束所需的索引。stats_since 为统计信息的重置时间，
+    时间过短时结果不可靠；只读副本上的使用情况不会反映在主库的统计中。
+
+    Args:
+        schema_name: 只查看指定模式
+        table_name: 只查看指定表（不含模式名）
+        limit: 最多返回的行数（默认20，最多100）
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        诊断结果
+    """
+    try:
+        return await run_diagnostic(
+            UNUSED_INDEXES_QUERY, schema_name, table_name, limit, output_format, max_bytes
+        )
+    except Exception as e:
+        return f"查找未使用的索引失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def find_duplicate_indexes(
+    schema_name: Optional[str] = None,
+    table_name: Optional[str] = None,
+    limit: int = 20,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    查找重复或冗余的索引，按索引大小排序
+
+    kind 为 duplicate 表示与 covered_by 完全相同；prefix 表示其列是 covered_by 的前缀，
+    查询可以改用 covered_by。只比较不含表达式和部分索引条件的索引。
+
+    Args:
+        schema_name: 只查看指定模式
+        table_name: 只查看指定表（不含模式名）
+        limit: 最多返回的行数（默认20，最多100）
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        诊断结果
+    """
+    try:
+        return await run_diagnostic(
+            DUPLICATE_INDEXES_QUERY, schema_name, table_name, limit, output_format, max_bytes
+        )
+    except Exception as e:
+        return f"查找重复索引失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def get_relation_sizes(
+    schema_name: Optional[str] = None,
+    table_name: Optional[str] = None,
+    limit: int = 20,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    查看各表占用的空间，按总大小排序
+
+    返回估算行数以及表、TOAST、索引各自的大小和索引数量。
+
+    Args:
+        schema_name: 只查看指定模式
+        table_name: 只查看指定表（不含模式名）
+        limit: 最多返回的行数（默认20，最多100）
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        诊断结果
+    """
+    try:
+        return await run_diagnostic(
+            RELATION_SIZES_QUERY, schema_name, table_name, limit, output_format, max_bytes
+        )
+    except Exception as e:
+        return f"读取表大小失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def estimate_table_bloat(
+    schema_name: Optional[str] = None,
+    table_name: Optional[str] = None,
+    limit: int = 20,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    估算表的膨胀（死元组和空闲空间占用的页），按可回收的空间排序
+
+    根据 pg_stats 中的列平均宽度和空值比例估算理论页数，与实际页数比较，不扫描表数据。
+    结果为估算值：fully_analyzed 为 false 的表缺少列统计信息，估算可能偏高。
+
+    Args:
+        schema_name: 只查看指定模式
+        table_name: 只查看指定表（不含模式名）
+        limit: 最多返回的行数（默认20，最多100）
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        诊断结果
+    """
+    try:
+        return await run_diagnostic(
+            TABLE_BLOAT_QUERY, schema_name, table_name, limit, output_format, max_bytes
+        )
+    except Exception as e:
+        return f"估算表膨胀失败: {str(e)}"
+
+
+@mcp.tool()
+@with_metrics
+@with_admission
+@with_database
+@with_tool_timeouts
+async def get_top_queries(
+    order_by: str = "total_time",
+    limit: int = 20,
+    min_calls: int = 1,
+    output_format: str = "json",
+    max_bytes: int = RESPONSE_MAX_BYTES,
+    database: Optional[str] = None,
+) -> str:
+    """
+    从 pg_stat_statements 查看当前数据库中最耗资源的查询（需要服务器已安装该扩展）
+
+    返回调用次数、总耗时和平均耗时（毫秒）、占全部耗时的比例、返回行数、
+    缓存命中率和临时文件写入量。查询文本截取前500个字符。
+
+    Args:
+        order_by: 排序方式：total_time（默认，总耗时）、mean_time（平均耗时）、
+            calls（调用次数）、io（从磁盘读取的块数）
+        limit: 最多返回的查询数量（默认20，最多100）
+        min_calls: 只包含调用次数不少于该值的查询
+        output_format: 输出格式：json（默认）、columnar、csv、tsv、markdown
+        max_bytes: 响应的最大字节数（0表示不限制）
+        database: 数据库名称（见 config://databases），默认使用默认数据库
+
+    Returns:
+        按指定方式排序的查询统计
+    """
+    error = check_output_format(output_format)
+    if error:
+        return error
+    if order_by not in TOP_QUERIES_ORDER:
+        return f"错误: order_by 只支持 {', '.join(TOP_QUERIES_ORDER)}"
+    try:
+        rows = await run_in_db_executor(
+            fetch_top_queries, order_by, max(1, min(limit, 100)), max(1, min_calls)
+        )
+        text, _ = render_rows(
+            rows,
+            output_format,
+            lambda kept: {"order_by": order_by, "time_unit": "ms", "row_count": kept},
+            "results",
+            max_bytes,
+        )
+        return text
+    except Exception as e:
+        return f"读取查询统计失败: {str(e)}"
+
+
 # === 提示：常见数据分析任务 ===
 
 
@@ -361,6 +1667,7 @@ def data_exploration_prompt(table_name: str) -> str:
    - 检查索引配置
 
 2. **数据质量检查**
+   - 先使用 profile_table 工具基于统计信息快速获取各列画像，再针对可疑列做精确分析
    - 检查总行数和唯一行数
    - 识别是否有重复数据
    - 检查各列的空值情况
@@ -389,15 +1696,17 @@ def performance_analysis_prompt(table_name: str) -> str:
 
 1. **表大小和增长趋势**
    - 当前表的行数
-   - 表的存储空间使用情况
+   - 表的存储空间使用情况（get_relation_sizes）
+   - 估算的表膨胀（estimate_table_bloat）
 
 2. **索引分析**
    - 现有索引的配置
-   - 识别缺失的索引机会
-   - 检查是否有冗余或未使用的索引
+   - 识别缺失的索引机会：顺序扫描比例和读取行数（get_table_access_stats）
+   - 检查是否有冗余或未使用的索引（find_duplicate_indexes、find_unused_indexes）
 
 3. **查询模式分析**
-   - 基于表结构推断常见查询模式
+   - 涉及该表的高耗时查询（get_top_queries，需要 pg_stat_statements），
+     可用 explain_query 查看其执行计划
    - 识别可能的性能瓶颈
 
 4. **优化建议**
@@ -405,6 +1714,7 @@ def performance_analysis_prompt(table_name: str) -> str:
    - 查询优化建议
    - 表结构优化建议
 
+诊断工具都支持 table_name 参数，只查看该表的统计。
 请使用可用的工具来收集相关信息并提供具体的优化建议。
 """
 
@@ -456,6 +1766,11 @@ def data_quality_report_prompt(table_name: str) -> str:
     return f"""
 请为表 '{table_name}' 生成详细的数据质量报告。
 
+建议先使用 profile_table 工具获取各列的空值比例、不同值数量和高频值（基于统计信息，毫秒级返回），
+再用 analyze_table_stats 或查询工具对发现的问题列进行精确验证。
+需要执行多次查询时，可先调用 open_snapshot_session，使各项检查基于同一个数据快照，
+报告完成后调用 close_snapshot_session 释放连接。
+
 报告应包含以下内容：
 
 ## 1. 数据完整性检查
@@ -490,21 +1805,34 @@ def data_quality_report_prompt(table_name: str) -> str:
 def main():
     """运行MCP服务器"""
     print("启动 PostgreSQL MCP 服务器...")
-    print(
-        f"数据库连接配置: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-    )
+    for name, db in databases.databases.items():
+        config = db.config
+        print(
+            f"数据库连接配置 [{name}]: "
+            f"{config['host']}:{config['port']}/{config['database']}"
+        )
 
-    # 测试数据库连接
+    # 测试默认数据库连接并预热连接池，其他数据库在首次使用时才建立连接
     try:
-        conn = get_db_connection()
-        conn.close()
+        get_pool().warm_up()
+        with get_pool().connection():
+            pass
         print("数据库连接测试成功!")
     except Exception as e:
         print(f"数据库连接测试失败: {e}")
         print("请检查数据库配置和连接信息")
 
     # 启动MCP服务器
-    mcp.run()
+    if "--http" in sys.argv:
+        # 一个进程通过 streamable-http 服务多个客户端，共享连接池和缓存
+        admission.enabled = True
+        print(
+            f"HTTP 模式: http://{mcp.settings.host}:{mcp.settings.port}"
+            f"{mcp.settings.streamable_http_path}，指标: /metrics"
+        )
+        mcp.run(transport="streamable-http")
+    else:
+        mcp.run()
 
 
 if __name__ == "__main__":
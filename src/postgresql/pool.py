@@ -0,0 +1,628 @@
+"""
+数据库连接
+
+建立连接与会话级超时、取消正在执行的查询、线程安全的连接池和只读副本路由。
+"""
+
+import contextvars
+import functools
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+import psycopg2
+import psycopg2.extensions
+
+from .config import DB_CONFIG, DB_TIMEOUTS, TOOL_TIMEOUTS
+
+
+# 当前工具覆盖的超时设置，由 with_tool_timeouts 设置
+_tool_timeouts: "contextvars.ContextVar[Optional[Dict[str, int]]]" = (
+    contextvars.ContextVar("pg_tool_timeouts", default=None)
+)
+
+
+def connect_database(config: Dict[str, Any]):
+    """
+    按给定配置建立连接
+
+    会话级超时通过连接参数设置；所有工具都是只读的，
+    连接的事务均以 READ ONLY 模式开始，由服务器保证不会写入数据。
+    """
+    options = " ".join(f"-c {name}={value}" for name, value in DB_TIMEOUTS.items())
+    try:
+        conn = psycopg2.connect(**config, options=options)
+        conn.set_session(readonly=True)
+        return conn
+    except psycopg2.Error as e:
+        raise Exception(f"数据库连接失败: {e}")
+
+
+def get_db_connection():
+    """获取数据库连接"""
+    return connect_database(DB_CONFIG)
+
+
+def replica_config(entry: str, base: Dict[str, Any]) -> Dict[str, Any]:
+    """把副本配置项解析为连接参数，未指定的参数沿用 base"""
+    config = dict(base)
+    if "=" in entry or "://" in entry:
+        params = psycopg2.extensions.parse_dsn(entry)
+        if "dbname" in params:
+            config["database"] = params.pop("dbname")
+        config.update(params)
+    else:
+        host, _, port = entry.partition(":")
+        config["host"] = host
+        if port:
+            config["port"] = int(port)
+    return config
+
+
+def with_tool_timeouts(func: Callable[..., Any]) -> Callable[..., Any]:
+    """为异步工具应用 DB_TOOL_TIMEOUTS 中按工具名配置的超时，未配置时原样返回"""
+    timeouts = TOOL_TIMEOUTS.get(func.__name__)
+    if not timeouts:
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _tool_timeouts.set(timeouts)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _tool_timeouts.reset(token)
+
+    return wrapper
+
+
+def apply_timeouts(conn, timeout_ms: Optional[int] = None, **overrides: int) -> None:
+    """
+    在当前事务中覆盖会话级超时（等同于 SET LOCAL），事务结束后自动恢复
+
+    依次合并当前工具的超时配置、overrides 以及 timeout_ms（statement_timeout），
+    没有需要覆盖的设置时不发送任何语句。
+    """
+    settings = dict(_tool_timeouts.get() or {})
+    settings.update(overrides)
+    if timeout_ms:
+        settings["statement_timeout"] = int(timeout_ms)
+    if not settings:
+        return
+    calls = ", ".join("set_config(%s, %s, true)" for _ in settings)
+    params = [item for name, value in settings.items() for item in (name, str(int(value)))]
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {calls}", params)
+
+
+class CancelScope:
+    """
+    一次数据库调用所借出的连接
+
+    调用方的协程被取消（MCP请求被取消或客户端断开）时，取消这些连接上正在执行的查询，
+    后端立即停止工作，而不是在无人等待结果的情况下继续执行到结束。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns: Dict[Any, "ConnectionPool"] = {}
+        self.cancelled = False
+
+    def attach(self, pool: "ConnectionPool", conn) -> bool:
+        """记录借出的连接，调用已被取消时返回False"""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._conns[conn] = pool
+            return True
+
+    def detach(self, conn) -> None:
+        with self._lock:
+            self._conns.pop(conn, None)
+
+    def cancel(self) -> None:
+        """取消所有已借出连接上的查询，之后的借出请求直接失败"""
+        with self._lock:
+            self.cancelled = True
+            conns = list(self._conns.items())
+        for conn, pool in conns:
+            pool.cancel(conn)
+
+
+_cancel_scope: "contextvars.ContextVar[Optional[CancelScope]]" = contextvars.ContextVar(
+    "pg_cancel_scope", default=None
+)
+
+
+class ConnectionPool:
+    """
+    线程安全的数据库连接池
+
+    所有工具和资源共享同一个连接池，借出时按空闲时间做健康检查，
+    超过空闲超时或最大存活时间的连接会被关闭并按需重建。
+    """
+
+    def __init__(
+        self,
+        connect=get_db_connection,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300,
+        max_lifetime: float = 3600,
+        checkout_timeout: float = 30,
+        health_check_interval: float = 10,
+    ):
+        if max_size < 1:
+            raise ValueError("连接池最大连接数必须大于0")
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        # 空闲连接队列，元素为 (conn, 归还时间)，右端为最近归还的连接
+        self._idle: deque = deque()
+        # 连接创建时间，用于最大存活时间判断
+        self._created_at: Dict[Any, float] = {}
+        self._in_use = 0
+        self._opening = 0
+        self._closed = False
+        self._counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_waits": 0,
+            "checkout_timeouts": 0,
+            "health_check_failures": 0,
+            "cancellations": 0,
+            "cancel_failures": 0,
+            "total_wait_seconds": 0.0,
+        }
+
+    @property
+    def size(self) -> int:
+        """当前池中连接总数（含正在建立的连接）"""
+        return len(self._idle) + self._in_use + self._opening
+
+    @property
+    def in_use(self) -> int:
+        """当前借出的连接数"""
+        return self._in_use
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._created_at[conn] = time.monotonic()
+            self._counters["connections_created"] += 1
+        return conn
+
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created_at.pop(conn, None)
+            self._counters["connections_closed"] += 1
+
+    def _expired(self, conn, now: float) -> bool:
+        created = self._created_at.get(conn, now)
+        return conn.closed or now - created > self.max_lifetime
+
+    def _healthy(self, conn) -> bool:
+        """借出前的健康检查"""
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._counters["health_check_failures"] += 1
+            return False
+
+    def _prune_idle(self, now: float) -> list:
+        """取出需要关闭的空闲连接（调用方需持有锁）"""
+        stale = []
+        keep: deque = deque()
+        while self._idle:
+            conn, returned_at = self._idle.popleft()
+            over_min = len(keep) + self._in_use + self._opening >= self.min_size
+            if self._expired(conn, now) or (
+                over_min and now - returned_at > self.idle_timeout
+            ):
+                stale.append(conn)
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+        return stale
+
+    def warm_up(self) -> None:
+        """预先建立min_size个连接"""
+        while True:
+            with self._cond:
+                if self._closed or self.size >= self.min_size:
+                    return
+                self._opening += 1
+            try:
+                conn = self._open()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        """从连接池借出一个连接，必要时等待或新建"""
+        scope = _cancel_scope.get()
+        if scope is not None and scope.cancelled:
+            raise Exception("数据库调用已取消")
+        deadline = time.monotonic() + self.checkout_timeout
+        waited_since = None
+        while True:
+            conn = None
+            returned_at = 0.0
+            with self._cond:
+                if self._closed:
+                    raise Exception("数据库连接池已关闭")
+                stale = self._prune_idle(time.monotonic())
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    self._in_use += 1
+                elif self.size < self.max_size:
+                    self._opening += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["checkout_timeouts"] += 1
+                        raise Exception(
+                            f"获取数据库连接超时: 连接池已满（{self.max_size}个连接）"
+                        )
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._counters["checkout_waits"] += 1
+                    self._cond.wait(remaining)
+                    continue
+            for old in stale:
+                self._close(old)
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._in_use += 1
+            elif time.monotonic() - returned_at >= self.health_check_interval and (
+                not self._healthy(conn)
+            ):
+                with self._cond:
+                    self._in_use -= 1
+                self._close(conn)
+                continue
+
+            with self._cond:
+                self._counters["checkouts"] += 1
+                if waited_since is not None:
+                    self._counters["total_wait_seconds"] += (
+                        time.monotonic() - waited_since
+                    )
+            if scope is not None and not scope.attach(self, conn):
+                self.putconn(conn)
+                raise Exception("数据库调用已取消")
+            return conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """归还连接，出错或状态异常的连接直接关闭"""
+        scope = _cancel_scope.get()
+        if scope is not None:
+            scope.detach(conn)
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            now = time.monotonic()
+            if discard or self._closed or self._expired(conn, now):
+                discard = True
+            else:
+                self._idle.append((conn, now))
+            self._cond.notify()
+        if discard:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """借出连接的上下文管理器，连接异常时不再放回池中"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard or conn.closed)
+
+    def cancel(self, conn) -> None:
+        """取消连接上正在执行的查询，协议级取消失败时改用 pg_cancel_backend"""
+        with self._cond:
+            self._counters["cancellations"] += 1
+        try:
+            conn.cancel()
+            return
+        except Exception:
+            pass
+        try:
+            admin = self._connect()
+            try:
+                admin.autocommit = True
+                with admin.cursor() as cur:
+                    cur.execute(
+                        "SELECT pg_cancel_backend(%s)", (conn.info.backend_pid,)
+                    )
+            finally:
+                admin.close()
+        except Exception:
+            with self._cond:
+                self._counters["cancel_failures"] += 1
+
+    def closeall(self) -> None:
+        """关闭所有空闲连接，借出中的连接在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息，用于评估连接池大小配置"""
+        with self._cond:
+            checkouts = self._counters["checkouts"]
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "idle_timeout": self.idle_timeout,
+                "max_lifetime": self.max_lifetime,
+                "checkout_timeout": self.checkout_timeout,
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                **self._counters,
+                "avg_wait_ms": (
+                    round(self._counters["total_wait_seconds"] * 1000 / checkouts, 3)
+                    if checkouts
+                    else 0.0
+                ),
+            }
+
+
+class ReplicaRouter:
+    """
+    只读副本路由
+
+    接口与 ConnectionPool 相同，每个副本有独立的连接池。借出连接时按策略选择健康的副本：
+    round_robin 轮询，least_connections 选择借出连接最少的副本，lag_aware 选择复制延迟
+    最小的副本。后台线程定期检查副本可用性和复制延迟，延迟超过 max_lag 的副本暂不使用；
+    借出连接失败时立即重新检查该副本并改用下一个；所有副本都不可用时回退到主库。
+    """
+
+    STRATEGIES = ("round_robin", "least_connections", "lag_aware")
+
+    # 主库（或已提升的副本）延迟为0；WAL已全部回放时即使长时间没有写入也视为无延迟
+    LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag_seconds;
+    """
+
+    def __init__(
+        self,
+        primary: ConnectionPool,
+        replicas: Dict[str, Callable[[], Any]],
+        pool_config: Dict[str, Any],
+        strategy: str = "round_robin",
+        max_lag: float = 30,
+        check_interval: float = 10,
+        fallback_to_primary: bool = True,
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(
+                f"不支持的副本负载均衡策略 '{strategy}'，可选值: {', '.join(self.STRATEGIES)}"
+            )
+        self.primary = primary
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.fallback_to_primary = fallback_to_primary
+        self._connects = replicas
+        self.replicas = {
+            name: ConnectionPool(connect, **pool_config)
+            for name, connect in replicas.items()
+        }
+        # 启动时假定副本可用，由首次检查修正
+        self._state: Dict[str, Dict[str, Any]] = {
+            name: {"healthy": True, "lag_seconds": None, "last_error": None}
+            for name in replicas
+        }
+        # 借出的连接所属的连接池
+        self._owner: Dict[Any, ConnectionPool] = {}
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+        self._checker: Optional[threading.Thread] = None
+        self._counters = {"replica_checkouts": 0, "primary_fallbacks": 0}
+
+    def _candidates(self) -> List[str]:
+        """按策略排序的健康副本"""
+        with self._lock:
+            healthy = [name for name, state in self._state.items() if state["healthy"]]
+            lags = {name: self._state[name]["lag_seconds"] or 0 for name in healthy}
+        if not healthy:
+            return healthy
+        if self.strategy == "round_robin":
+            start = next(self._rotation) % len(healthy)
+            return healthy[start:] + healthy[:start]
+        if self.strategy == "least_connections":
+            return sorted(healthy, key=lambda name: self.replicas[name].in_use)
+        return sorted(healthy, key=lambda name: (lags[name], self.replicas[name].in_use))
+
+    def check(self, name: str) -> bool:
+        """用独立连接检查副本是否可用及其复制延迟"""
+        lag, error = None, None
+        try:
+            conn = self._connects[name]()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(self.LAG_QUERY)
+                    lag = float(cur.fetchone()[0])
+            finally:
+                conn.close()
+            if self.max_lag and lag > self.max_lag:
+                error = f"复制延迟 {lag:.1f} 秒超过上限 {self.max_lag:g} 秒"
+        except Exception as e:
+            error = str(e)
+        with self._lock:
+            self._state[name] = {
+                "healthy": error is None,
+                "lag_seconds": lag,
+                "last_error": error,
+            }
+        return error is None
+
+    def _ensure_checker(self) -> None:
+        if self._checker is None or not self._checker.is_alive():
+            self._checker = threading.Thread(
+                target=self._check_loop, name="pg-replica-checker", daemon=True
+            )
+            self._checker.start()
+
+    def _check_loop(self) -> None:
+        while True:
+            for name in self.replicas:
+                self.check(name)
+            time.sleep(self.check_interval)
+
+    def getconn(self):
+        """从选中的副本借出连接，所有副本都不可用时按配置回退到主库"""
+        self._ensure_checker()
+        for name in self._candidates():
+            pool = self.replicas[name]
+            try:
+                conn = pool.getconn()
+            except Exception:
+                scope = _cancel_scope.get()
+                if scope is not None and scope.cancelled:
+                    raise
+                self.check(name)
+                continue
+            with self._lock:
+                self._owner[conn] = pool
+                self._counters["replica_checkouts"] += 1
+            return conn
+        if not self.fallback_to_primary:
+            raise Exception("没有可用的只读副本")
+        conn = self.primary.getconn()
+        with self._lock:
+            self._owner[conn] = self.primary
+            self._counters["primary_fallbacks"] += 1
+        return conn
+
+    def pool_for(self, conn) -> ConnectionPool:
+        """借出中的连接所属的连接池"""
+        with self._lock:
+            return self._owner[conn]
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """把连接归还给它所属的连接池"""
+        with self._lock:
+            pool = self._owner.pop(conn)
+        pool.putconn(conn, discard)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """借出连接的上下文管理器，连接异常时不再放回池中"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard or conn.closed)
+
+    def cancel(self, conn) -> None:
+        """取消连接上正在执行的查询"""
+        with self._lock:
+            pool = self._owner.get(conn)
+        if pool is not None:
+            pool.cancel(conn)
+
+    def warm_up(self) -> None:
+        """检查所有副本并为可用的副本预先建立连接"""
+        for name, pool in self.replicas.items():
+            if self.check(name):
+                pool.warm_up()
+        self._ensure_checker()
+
+    def closeall(self) -> None:
+        for pool in [self.primary, *self.replicas.values()]:
+            pool.closeall()
+
+    def stats(self) -> Dict[str, Any]:
+        """各副本的健康状态、复制延迟和连接池统计"""
+        with self._lock:
+            states = {name: dict(state) for name, state in self._state.items()}
+            counters = dict(self._counters)
+        return {
+            "strategy": self.strategy,
+            "max_lag": self.max_lag,
+            **counters,
+            "replicas": {
+                name: {**states[name], **pool.stats()}
+                for name, pool in self.replicas.items()
+            },
+            "primary": self.primary.stats(),
+        }
+
+
+def create_pool(
+    config: Dict[str, Any],
+    pool_config: Dict[str, Any],
+    replicas: List[str],
+    replica_settings: Dict[str, Any],
+) -> Union[ConnectionPool, ReplicaRouter]:
+    """配置了只读副本时创建副本路由，否则创建主库连接池"""
+    connect = functools.partial(connect_database, config)
+    if not replicas:
+        return ConnectionPool(connect, **pool_config)
+    replica_connects = {}
+    for entry in replicas:
+        params = replica_config(entry, config)
+        name = f"{params['host']}:{params['port']}/{params['database']}"
+        replica_connects[name] = functools.partial(connect_database, params)
+    # 主库只作为回退，不预先建立连接
+    primary = ConnectionPool(connect, **{**pool_config, "min_size": 0})
+    return ReplicaRouter(primary, replica_connects, pool_config, **replica_settings)
@@ -0,0 +1,219 @@
+"""
+查询结果缓存
+
+以规范化SQL为键缓存只读查询的结果，按字节预算淘汰并支持按表失效。
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import QUERY_CACHE_CONFIG
+from .db import current_database
+
+
+# === 查询结果缓存 ===
+
+# 结果依赖调用时刻或会产生副作用的函数，包含这些函数的查询不缓存
+VOLATILE_SQL_PATTERN = re.compile(
+    r"\b(random|now|clock_timestamp|statement_timestamp|timeofday|nextval|"
+    r"currval|setval|gen_random_uuid|uuid_generate_v\d|current_timestamp|"
+    r"current_time|current_date|localtime|localtimestamp|pg_sleep)\b"
+)
+
+# FROM/JOIN 之后的表名，用于按表失效缓存
+TABLE_REFERENCE_PATTERN = re.compile(
+    r"\b(?:from|join)\s+((?:\"[^\"]+\"|[a-z_][\w$]*)(?:\s*\.\s*(?:\"[^\"]+\"|[a-z_][\w$]*))*)"
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    规范化SQL文本用于缓存键
+
+    去掉注释与末尾分号，合并空白，把字符串常量、带引号标识符和$$常量之外的文本转为小写。
+    """
+    out: List[str] = []
+    i, n = 0, len(sql)
+    pending_space = False
+    while i < n:
+        ch = sql[i]
+        if ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end < 0 else end + 1
+            pending_space = True
+            continue
+        if sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            pending_space = True
+            continue
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        if ch in ("'", '"'):
+            j = i + 1
+            while j < n:
+                if sql[j] == ch:
+                    # 两个连续引号表示转义
+                    if j + 1 < n and sql[j + 1] == ch:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            out.append(sql[i : j + 1])
+            i = j + 1
+            continue
+        if ch == "$":
+            match = re.match(r"\$[A-Za-z_]*\$", sql[i:])
+            if match:
+                tag = match.group(0)
+                end = sql.find(tag, i + len(tag))
+                end = n if end < 0 else end + len(tag)
+                out.append(sql[i:end])
+                i = end
+                continue
+        out.append(ch.lower())
+        i += 1
+    return "".join(out).rstrip("; ")
+
+
+def referenced_tables(normalized_sql: str) -> Set[str]:
+    """从规范化后的SQL中提取引用的表名（不含模式名）"""
+    tables = set()
+    for match in TABLE_REFERENCE_PATTERN.finditer(normalized_sql):
+        name = re.split(r"\s*\.\s*", match.group(1))[-1]
+        tables.add(name.strip('"'))
+    return tables
+
+
+class QueryResultCache:
+    """
+    查询结果缓存
+
+    以规范化SQL、目标数据库和行数限制作为键，条目超过TTL后失效，
+    总字节数超过预算时按LRU淘汰。维护表到缓存键的索引，支持按表失效。
+    """
+
+    def __init__(self, enabled: bool = False, ttl: float = 60, max_bytes: int = 0):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.generation = 0
+        # 键 -> (写入时间, 值, 字节数, 引用的表)
+        self._data: "OrderedDict[Any, Tuple[float, Any, int, Set[str]]]" = OrderedDict()
+        self._tables: Dict[str, Set[Any]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "uncacheable": 0,
+        }
+
+    @staticmethod
+    def make_key(sql: str, max_rows: int) -> Optional[Tuple[Any, ...]]:
+        """生成缓存键，包含易变函数的查询返回None"""
+        normalized = normalize_sql(sql)
+        if VOLATILE_SQL_PATTERN.search(normalized):
+            return None
+        return current_database().name, normalized, max_rows
+
+    def _remove(self, key: Any) -> None:
+        """删除条目（调用方需持有锁）"""
+        _, _, size, tables = self._data.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tables[table]
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """读取缓存"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._counters["misses"] += 1
+                return default
+            if time.monotonic() - item[0] > self.ttl:
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return item[1]
+
+    def set(self, key: Any, value: Any, size: int, generation: int) -> None:
+        """写入缓存，单个结果超过预算时不缓存"""
+        if size > self.max_bytes:
+            with self._lock:
+                self._counters["uncacheable"] += 1
+            return
+        tables = referenced_tables(key[1])
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic(), value, size, tables)
+            self._bytes += size
+            for table in tables:
+                self._tables.setdefault(table, set()).add(key)
+            while self._bytes > self.max_bytes and self._data:
+                self._remove(next(iter(self._data)))
+                self._counters["evictions"] += 1
+
+    def invalidate_tables(self, tables: List[str]) -> int:
+        """使引用指定表的缓存结果失效，返回失效的条目数"""
+        removed = 0
+        with self._lock:
+            for table in tables:
+                name = table.split(".")[-1].strip('"')
+                if not table.split(".")[-1].startswith('"'):
+                    name = name.lower()
+                for key in list(self._tables.get(name, ())):
+                    self._remove(key)
+                    removed += 1
+            self._counters["invalidations"] += removed
+        return removed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._counters["invalidations"] += len(self._data)
+            self._data.clear()
+            self._tables.clear()
+            self._bytes = 0
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "tables": len(self._tables),
+                **self._counters,
+                "hit_ratio": (
+                    round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+                ),
+            }
+
+
+query_cache = QueryResultCache(**QUERY_CACHE_CONFIG)
@@ -0,0 +1,82 @@
+"""
+行数统计
+
+按优化器的方式从统计信息估算表行数，需要时在超时限制内执行 COUNT(*)。
+"""
+
+from typing import Any, Dict
+
+from .config import EXACT_COUNT_TIMEOUT_MS
+from .db import aexecute_query
+
+
+# === 行数统计 ===
+
+# 按优化器的方式估算行数（c 为 pg_class 的别名）。从未分析过的表 reltuples 为 -1，
+# PostgreSQL 14 之前则为 0 且 relpages 为 0，两种情况都视为未知
+ESTIMATED_ROWS_SQL = """CASE
+            WHEN c.reltuples < 0 OR (c.reltuples = 0 AND c.relpages = 0) THEN NULL
+            WHEN c.relpages = 0 THEN c.reltuples
+            ELSE c.reltuples / c.relpages
+                * (pg_relation_size(c.oid) / current_setting('block_size')::int)
+        END::bigint"""
+
+
+async def get_row_count_estimate(table_name: str) -> Dict[str, Any]:
+    """
+    根据 pg_class 和 pg_stat_all_tables 估算表行数，不扫描表数据
+
+    与优化器的做法一致：用上次ANALYZE时的行密度（reltuples / relpages）
+    乘以当前的数据页数；表从未分析过时退回到 n_live_tup。
+    """
+    query = f"""
+    SELECT
+        {ESTIMATED_ROWS_SQL} AS estimated_rows,
+        s.n_live_tup,
+        s.n_dead_tup,
+        s.last_analyze,
+        s.last_autoanalyze
+    FROM pg_class c
+    LEFT JOIN pg_stat_all_tables s ON s.relid = c.oid
+    WHERE c.oid = %s::regclass;
+    """
+    rows = await aexecute_query(query, (table_name,), prepared="mcp_row_count_estimate")
+    if not rows:
+        return {"row_count": None, "row_count_source": "unavailable"}
+    row = rows[0]
+    if row["estimated_rows"] is not None:
+        row_count, source = row["estimated_rows"], "estimate"
+    else:
+        row_count, source = row["n_live_tup"], "n_live_tup"
+    analyzed = [t for t in (row["last_analyze"], row["last_autoanalyze"]) if t]
+    return {
+        "row_count": row_count,
+        "row_count_source": source,
+        "n_live_tup": row["n_live_tup"],
+        "n_dead_tup": row["n_dead_tup"],
+        "last_analyze": max(analyzed) if analyzed else None,
+    }
+
+
+async def get_row_count(
+    table_name: str, exact: bool = False, timeout_ms: int = EXACT_COUNT_TIMEOUT_MS
+) -> Dict[str, Any]:
+    """
+    获取表行数，默认返回估算值
+
+    exact 为真时执行 COUNT(*)，超过 timeout_ms 后放弃并返回估算值。
+    """
+    estimate = await get_row_count_estimate(table_name)
+    if not exact:
+        return estimate
+    try:
+        rows = await aexecute_query(
+            f"SELECT COUNT(*) AS row_count FROM {table_name};", timeout_ms=timeout_ms
+        )
+        return {
+            **estimate,
+            "row_count": rows[0]["row_count"],
+            "row_count_source": "exact",
+        }
+    except Exception as e:
+        return {**estimate, "exact_count_error": str(e)}
@@ -0,0 +1,204 @@
+"""
+模式元数据缓存
+
+按系统目录版本或DDL事件通知失效的LRU缓存。
+"""
+
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .db import aexecute_query
+from .pool import get_db_connection
+
+
+# === 元数据缓存 ===
+
+
+class LRUCache:
+    """线程安全的LRU缓存，条目超过TTL后失效"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        # 每次清空缓存时递增，用于丢弃清空前开始加载的结果
+        self.generation = 0
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """读取缓存，未命中或已过期时返回default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                if item is not None:
+                    del self._data[key]
+                self._counters["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return item[1]
+
+    def set(self, key: Any, value: Any, generation: Optional[int] = None) -> None:
+        """写入缓存；generation与当前不一致时说明期间缓存已被清空，放弃写入"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                **self._counters,
+                "hit_ratio": (
+                    round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+                ),
+            }
+
+
+class SchemaCache:
+    """
+    模式元数据缓存
+
+    通过系统目录版本指纹判断DDL变更：pg_class/pg_attribute/pg_constraint/pg_description
+    中用户对象的行数与xmin之和在任意DDL后都会变化，计算成本仅为毫秒级，
+    且在 check_interval 内最多检查一次。配置 notify_channel 后，
+    由监听线程接收DDL事件触发器的通知即时清空缓存，此时不再轮询版本。
+    """
+
+    VERSION_QUERY = """
+    SELECT concat_ws(
+        '/',
+        (SELECT count(*) || ':' || sum(xmin::text::bigint) FROM pg_class),
+        (SELECT count(*) || ':' || coalesce(sum(xmin::text::bigint), 0)
+            FROM pg_attribute WHERE attrelid >= 16384),
+        (SELECT count(*) || ':' || coalesce(sum(xmin::text::bigint), 0)
+            FROM pg_constraint),
+        (SELECT count(*) || ':' || coalesce(sum(xmin::text::bigint), 0)
+            FROM pg_description WHERE objoid >= 16384)
+    ) AS version;
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 600,
+        check_interval: float = 5,
+        notify_channel: str = "",
+        connect: Callable[[], Any] = get_db_connection,
+    ):
+        self.cache = LRUCache(max_entries, ttl)
+        self._connect = connect
+        self.check_interval = check_interval
+        self.notify_channel = notify_channel
+        self._version: Optional[str] = None
+        self._last_check = 0.0
+        self._listening = False
+        self._listener: Optional[threading.Thread] = None
+        # 缓存失效时需要同步清理的其他缓存
+        self._invalidation_hooks: List[Callable[[], None]] = []
+
+    def add_invalidation_hook(self, hook: Callable[[], None]) -> None:
+        """注册模式变更时的回调"""
+        self._invalidation_hooks.append(hook)
+
+    def invalidate(self) -> None:
+        """清空缓存"""
+        self.cache.clear()
+        for hook in self._invalidation_hooks:
+            hook()
+
+    async def validate(self) -> None:
+        """检查系统目录版本，发生变化时清空缓存"""
+        self._ensure_listener()
+        now = time.monotonic()
+        if self._listening or now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        rows = await aexecute_query(self.VERSION_QUERY)
+        version = rows[0]["version"] if rows else None
+        if self._version is not None and version != self._version:
+            self.invalidate()
+        self._version = version
+
+    async def get_or_load(self, key: Any, loader: Callable[[], Any]) -> Any:
+        """读取缓存，未命中时调用异步loader加载并写入缓存"""
+        await self.validate()
+        marker = object()
+        value = self.cache.get(key, marker)
+        if value is not marker:
+            return value
+        generation = self.cache.generation
+        value = await loader()
+        self.cache.set(key, value, generation)
+        return value
+
+    def _ensure_listener(self) -> None:
+        if not self.notify_channel:
+            return
+        if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(
+                target=self._listen_loop, name="pg-schema-listener", daemon=True
+            )
+            self._listener.start()
+
+    def _listen_loop(self) -> None:
+        """监听DDL变更通知，连接断开后自动重连"""
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.notify_channel}";')
+                # 监听建立前可能错过通知，先清空一次
+                self.invalidate()
+                self._listening = True
+                backoff = 1.0
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.invalidate()
+            except Exception:
+                self._listening = False
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                self._listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            **self.cache.stats(),
+            "catalog_version": self._version,
+            "check_interval": self.check_interval,
+            "listening": self._listening,
+        }
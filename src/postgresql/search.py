@@ -0,0 +1,327 @@
+"""
+模式搜索索引
+
+表和列的内存倒排索引，支持按词元、前缀和三元组相似度搜索。
+"""
+
+import asyncio
+import bisect
+import heapq
+import itertools
+import math
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .db import aexecute_query
+from .snapshot import USER_SCHEMA_FILTER, load_schema_snapshot
+
+
+# === 模式搜索索引 ===
+
+# 拆分标识符：连续大写缩写、驼峰单词、小写单词、数字、其他文字（如中文）
+IDENTIFIER_TOKEN_PATTERN = re.compile(
+    r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+|[^\W\d_a-zA-Z]+"
+)
+
+# 每个模式的目录版本：模式内关系、列和注释的任何变化都会改变该模式的指纹
+SCHEMA_VERSIONS_QUERY = f"""
+SELECT
+    n.nspname AS schema_name,
+    concat_ws(
+        '/',
+        count(*),
+        sum(c.xmin::text::bigint),
+        sum(att.n) || ':' || sum(att.x),
+        sum(des.n) || ':' || sum(des.x)
+    ) AS version
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+CROSS JOIN LATERAL (
+    SELECT count(*) AS n, coalesce(sum(a.xmin::text::bigint), 0) AS x
+    FROM pg_attribute a WHERE a.attrelid = c.oid
+) att
+CROSS JOIN LATERAL (
+    SELECT count(*) AS n, coalesce(sum(d.xmin::text::bigint), 0) AS x
+    FROM pg_description d WHERE d.objoid = c.oid
+) des
+WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+AND {USER_SCHEMA_FILTER}
+GROUP BY n.nspname;
+"""
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    把标识符或注释拆分为小写词元
+
+    同时按 snake_case、camelCase 和数字边界拆分；
+    中文等不以空格分词的文字切分为相邻两字的词元。
+    """
+    if not text:
+        return []
+    tokens = []
+    for part in IDENTIFIER_TOKEN_PATTERN.findall(text):
+        if part.isascii():
+            token = part.lower()
+            tokens.append(token)
+            # 简单的复数还原，使 customers 与 customer 互相匹配
+            if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+                tokens.append(token[:-1])
+        elif len(part) == 1:
+            tokens.append(part)
+        else:
+            tokens.extend(part[i : i + 2] for i in range(len(part) - 1))
+    return tokens
+
+
+def name_tokens(name: str) -> List[str]:
+    """标识符的词元，外加完整名称本身以便精确匹配优先"""
+    tokens = tokenize(name)
+    full = name.lower()
+    if full not in tokens:
+        tokens.append(full)
+    return tokens
+
+
+def trigrams(token: str) -> Set[str]:
+    """带边界标记的三元组，用于模糊匹配"""
+    padded = f"^{token}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SchemaSearchIndex:
+    """
+    表和列的内存倒排索引
+
+    文档为表或列，词元来自名称（权重高）、所属表名和注释；
+    查询词依次尝试精确匹配、前缀匹配，都没有时按三元组相似度模糊匹配，
+    按 IDF 加权求和并乘以查询词覆盖率排序。
+    索引按模式维护，刷新时只重建目录指纹发生变化的模式。
+    """
+
+    NAME_WEIGHT = 3.0
+    CONTEXT_WEIGHT = 1.0
+    PREFIX_FACTOR = 0.7
+    FUZZY_FACTOR = 0.5
+    FUZZY_MIN_SIMILARITY = 0.35
+    MAX_EXPANSIONS = 50
+
+    def __init__(self, refresh_interval: float = 5):
+        self.refresh_interval = refresh_interval
+        self._docs: Dict[int, Dict[str, Any]] = {}
+        self._doc_ids = itertools.count(1)
+        self._schema_docs: Dict[str, List[int]] = {}
+        self._schema_versions: Dict[str, str] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._trigram_tokens: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._last_refresh = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self._counters = {"refreshes": 0, "schemas_rebuilt": 0, "searches": 0}
+
+    def mark_stale(self) -> None:
+        """下次搜索前强制检查目录版本"""
+        self._stale = True
+
+    async def refresh(self) -> None:
+        """比较各模式的目录指纹，只重建新增或变化的模式并移除已删除的模式"""
+        now = time.monotonic()
+        if not self._stale and now - self._last_refresh < self.refresh_interval:
+            return
+        async with self._lock:
+            # 等待锁期间其他协程可能已完成刷新
+            if not self._stale and self._last_refresh > now:
+                return
+            self._stale = False
+            rows = await aexecute_query(SCHEMA_VERSIONS_QUERY, {"schema": None})
+            versions = {row["schema_name"]: row["version"] for row in rows}
+            for schema_name in list(self._schema_versions):
+                if schema_name not in versions:
+                    self._remove_schema(schema_name)
+            changed = [
+                name
+                for name, version in versions.items()
+                if self._schema_versions.get(name) != version
+            ]
+            if changed:
+                # 变化的模式较多时一次加载整库更省查询
+                if len(changed) > 1:
+                    snapshot = await load_schema_snapshot()
+                else:
+                    snapshot = await load_schema_snapshot(changed[0])
+                for schema_name in changed:
+                    self._remove_schema(schema_name)
+                    self._add_schema(schema_name, snapshot.get(schema_name, {}))
+                    self._schema_versions[schema_name] = versions[schema_name]
+                self._counters["schemas_rebuilt"] += len(changed)
+            self._counters["refreshes"] += 1
+            self._last_refresh = time.monotonic()
+
+    def _add_document(
+        self, doc: Dict[str, Any], fields: List[Tuple[List[str], float]]
+    ) -> int:
+        doc_id = next(self._doc_ids)
+        self._docs[doc_id] = doc
+        weights: Dict[str, float] = {}
+        for tokens, weight in fields:
+            for token in tokens:
+                weights[token] = max(weights.get(token, 0.0), weight)
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                for gram in trigrams(token):
+                    self._trigram_tokens.setdefault(gram, set()).add(token)
+                self._vocabulary_dirty = True
+            postings[doc_id] = weight
+        doc["_tokens"] = list(weights)
+        return doc_id
+
+    def _add_schema(self, schema_name: str, tables: Dict[str, Any]) -> None:
+        doc_ids = []
+        for table_name, table in tables.items():
+            table_context = name_tokens(table_name)
+            table_comment = tokenize(table.get("comment"))
+            doc_ids.append(
+                self._add_document(
+                    {
+                        "type": table["kind"],
+                        "schema": schema_name,
+                        "table": table_name,
+                        "comment": table.get("comment"),
+                        "estimated_rows": table.get("estimated_rows"),
+                    },
+                    [
+                        (table_context, self.NAME_WEIGHT),
+                        (table_comment, self.CONTEXT_WEIGHT),
+                        ([schema_name.lower()], self.CONTEXT_WEIGHT),
+                    ],
+                )
+            )
+            for column in table["columns"]:
+                doc_ids.append(
+                    self._add_document(
+                        {
+                            "type": "column",
+                            "schema": schema_name,
+                            "table": table_name,
+                            "column": column["name"],
+                            "data_type": column["type"],
+                            "comment": column.get("comment"),
+                        },
+                        [
+                            (name_tokens(column["name"]), self.NAME_WEIGHT),
+                            (tokenize(column.get("comment")), self.CONTEXT_WEIGHT),
+                            (table_context, self.CONTEXT_WEIGHT),
+                        ],
+                    )
+                )
+        self._schema_docs[schema_name] = doc_ids
+
+    def _remove_schema(self, schema_name: str) -> None:
+        for doc_id in self._schema_docs.pop(schema_name, []):
+            doc = self._docs.pop(doc_id)
+            for token in doc["_tokens"]:
+                postings = self._postings[token]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[token]
+                    for gram in trigrams(token):
+                        grams = self._trigram_tokens[gram]
+                        grams.discard(token)
+                        if not grams:
+                            del self._trigram_tokens[gram]
+                    self._vocabulary_dirty = True
+        self._schema_versions.pop(schema_name, None)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """查询词对应的索引词元及匹配系数"""
+        matches: Dict[str, float] = {}
+        if term in self._postings:
+            matches[term] = 1.0
+        if len(term) >= 2:
+            if self._vocabulary_dirty:
+                self._vocabulary = sorted(self._postings)
+                self._vocabulary_dirty = False
+            start = bisect.bisect_left(self._vocabulary, term)
+            for token in self._vocabulary[start : start + self.MAX_EXPANSIONS]:
+                if not token.startswith(term):
+                    break
+                if token != term:
+                    matches[token] = self.PREFIX_FACTOR * len(term) / len(token)
+        if not matches and len(term) >= 3:
+            grams = trigrams(term)
+            shared: Dict[str, int] = {}
+            for gram in grams:
+                for token in self._trigram_tokens.get(gram, ()):
+                    shared[token] = shared.get(token, 0) + 1
+            for token, count in shared.items():
+                similarity = count / (len(grams) + len(trigrams(token)) - count)
+                if similarity >= self.FUZZY_MIN_SIMILARITY:
+                    matches[token] = self.FUZZY_FACTOR * similarity
+        return list(matches.items())
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        kind: str = "all",
+        schema_name: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """返回按得分排序的前 limit 条结果及匹配总数"""
+        self._counters["searches"] += 1
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+        total_docs = max(len(self._docs), 1)
+        scores: Dict[int, float] = {}
+        matched_terms: Dict[int, int] = {}
+        for term in terms:
+            best: Dict[int, float] = {}
+            for token, factor in self._expand(term):
+                postings = self._postings[token]
+                idf = math.log(1 + total_docs / len(postings))
+                for doc_id, weight in postings.items():
+                    score = factor * weight * idf
+                    if score > best.get(doc_id, 0.0):
+                        best[doc_id] = score
+            for doc_id, score in best.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+                matched_terms[doc_id] = matched_terms.get(doc_id, 0) + 1
+
+        def accept(doc: Dict[str, Any]) -> bool:
+            if schema_name is not None and doc["schema"] != schema_name:
+                return False
+            if kind == "table":
+                return doc["type"] != "column"
+            return kind != "column" or doc["type"] == "column"
+
+        filtered = kind != "all" or schema_name is not None
+        candidates = [
+            (score * matched_terms[doc_id] / len(terms), doc_id)
+            for doc_id, score in scores.items()
+            if not filtered or accept(self._docs[doc_id])
+        ]
+        top = heapq.nlargest(limit, candidates)
+        results = []
+        for score, doc_id in top:
+            doc = {
+                key: value
+                for key, value in self._docs[doc_id].items()
+                if value is not None and key != "_tokens"
+            }
+            doc["score"] = round(score, 3)
+            results.append(doc)
+        return results, len(candidates)
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计信息"""
+        return {
+            "schemas": len(self._schema_docs),
+            "documents": len(self._docs),
+            "tokens": len(self._postings),
+            **self._counters,
+        }
@@ -0,0 +1,74 @@
+"""
+MCP会话标识
+
+用于隔离不同MCP会话的分页游标和快照会话，并在会话结束时释放它们。
+"""
+
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from mcp.server.lowlevel.server import request_ctx
+from mcp.shared.context import RequestContext
+
+# 会话结束时调用的清理函数，参数为会话标识
+_close_hooks: List[Callable[[str], Any]] = []
+
+
+def request_context() -> Optional[RequestContext]:
+    """当前正在处理的MCP请求的上下文，不在请求中时返回None"""
+    try:
+        return request_ctx.get()
+    except LookupError:
+        return None
+
+
+def session_key(ctx: Optional[Any] = None) -> str:
+    """
+    获取MCP会话标识，用于隔离不同会话的游标；ctx 为空时使用当前请求
+
+    标识由 session_lifespan 在会话建立时生成，不会在会话之间重复；
+    不在MCP会话中（如直接调用工具函数）时返回 "default"。
+    """
+    try:
+        context = ctx.request_context if ctx is not None else request_context()
+    except Exception:
+        # ctx 已经是底层的 RequestContext，或不在请求中
+        context = ctx
+    lifespan_context = getattr(context, "lifespan_context", None)
+    if isinstance(lifespan_context, dict) and "session_key" in lifespan_context:
+        return lifespan_context["session_key"]
+    return "default"
+
+
+def on_session_close(hook: Callable[[str], Any]) -> Callable[[str], Any]:
+    """注册会话结束时的清理函数"""
+    _close_hooks.append(hook)
+    return hook
+
+
+def close_session(key: str) -> None:
+    """依次调用清理函数，单个清理函数失败不影响其他清理函数"""
+    for hook in list(_close_hooks):
+        try:
+            hook(key)
+        except Exception:
+            pass
+
+
+@asynccontextmanager
+async def session_lifespan(server: Any) -> AsyncIterator[Dict[str, Any]]:
+    """
+    每个MCP会话的生命周期：建立时分配唯一标识，结束时释放该会话的游标和快照会话
+
+    清理需要回滚事务、归还连接，在后台线程中执行，不阻塞事件循环，
+    也不受会话结束时任务取消的影响。
+    """
+    key = f"session-{uuid.uuid4().hex}"
+    try:
+        yield {"session_key": key}
+    finally:
+        threading.Thread(
+            target=close_session, args=(key,), name="pg-session-close", daemon=True
+        ).start()
@@ -0,0 +1,245 @@
+"""
+数据库模式快照
+
+用四条集合查询加载整库或单个模式的表、列、约束和索引，按模式缓存。
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from .db import aexecute_query, current_database
+from .row_counts import ESTIMATED_ROWS_SQL
+
+
+# === 数据库模式快照 ===
+
+# 用户模式过滤条件（n 为 pg_namespace 的别名），第二个条件可按模式名收窄
+USER_SCHEMA_FILTER = """n.nspname NOT IN ('pg_catalog', 'information_schema')
+    AND n.nspname NOT LIKE 'pg\\_toast%%'
+    AND n.nspname NOT LIKE 'pg\\_temp\\_%%'
+    AND (%(schema)s::text IS NULL OR n.nspname = %(schema)s)"""
+
+# 快照包含的关系类型：普通表、分区表、视图、物化视图、外部表
+SNAPSHOT_RELKINDS = {
+    "r": "table",
+    "p": "partitioned table",
+    "v": "view",
+    "m": "materialized view",
+    "f": "foreign table",
+}
+
+SNAPSHOT_TABLES_QUERY = f"""
+SELECT
+    n.nspname AS schema_name,
+    c.relname AS table_name,
+    c.relkind,
+    obj_description(c.oid, 'pg_class') AS comment,
+    {ESTIMATED_ROWS_SQL} AS estimated_rows,
+    CASE WHEN c.relkind IN ('r', 'm', 'p') THEN pg_total_relation_size(c.oid) END
+        AS total_bytes
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+AND {USER_SCHEMA_FILTER}
+ORDER BY 1, 2;
+"""
+
+SNAPSHOT_COLUMNS_QUERY = f"""
+SELECT
+    n.nspname AS schema_name,
+    c.relname AS table_name,
+    a.attname AS column_name,
+    format_type(a.atttypid, a.atttypmod) AS data_type,
+    NOT a.attnotnull AS nullable,
+    pg_get_expr(d.adbin, d.adrelid) AS column_default,
+    col_description(c.oid, a.attnum) AS comment
+FROM pg_attribute a
+JOIN pg_class c ON c.oid = a.attrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+AND a.attnum > 0
+AND NOT a.attisdropped
+AND {USER_SCHEMA_FILTER}
+ORDER BY 1, 2, a.attnum;
+"""
+
+# 约束的列名按约束定义中的顺序展开；外键同时给出被引用的表和列
+SNAPSHOT_CONSTRAINTS_QUERY = f"""
+SELECT
+    n.nspname AS schema_name,
+    c.relname AS table_name,
+    con.conname AS constraint_name,
+    con.contype AS constraint_type,
+    pg_get_constraintdef(con.oid) AS definition,
+    ARRAY(
+        SELECT a.attname
+        FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+        ORDER BY k.ord
+    ) AS columns,
+    rn.nspname AS ref_schema,
+    rc.relname AS ref_table,
+    ARRAY(
+        SELECT a.attname
+        FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+        ORDER BY k.ord
+    ) AS ref_columns
+FROM pg_constraint con
+JOIN pg_class c ON c.oid = con.conrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_class rc ON rc.oid = con.confrelid
+LEFT JOIN pg_namespace rn ON rn.oid = rc.relnamespace
+WHERE con.contype IN ('p', 'u', 'f', 'c', 'x')
+AND {USER_SCHEMA_FILTER}
+ORDER BY 1, 2, con.conname;
+"""
+
+SNAPSHOT_INDEXES_QUERY = f"""
+SELECT
+    n.nspname AS schema_name,
+    c.relname AS table_name,
+    ic.relname AS index_name,
+    pg_get_indexdef(i.indexrelid) AS definition,
+    i.indisunique AS is_unique,
+    i.indisprimary AS is_primary,
+    pg_relation_size(i.indexrelid) AS bytes
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indrelid
+JOIN pg_class ic ON ic.oid = i.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE {USER_SCHEMA_FILTER}
+ORDER BY 1, 2, ic.relname;
+"""
+
+CONSTRAINT_TYPES = {"p": "primary key", "u": "unique", "c": "check", "x": "exclusion"}
+
+
+def build_schema_snapshot(
+    tables: List[Dict[str, Any]],
+    columns: List[Dict[str, Any]],
+    constraints: List[Dict[str, Any]],
+    indexes: List[Dict[str, Any]],
+) -> Dict[str, Dict[str, Any]]:
+    """把按集合查询得到的目录数据组装为 {模式: {表: 详情}}，省略空字段"""
+    snapshot: Dict[str, Dict[str, Any]] = {}
+    for row in tables:
+        table: Dict[str, Any] = {"kind": SNAPSHOT_RELKINDS[row["relkind"]]}
+        if row["comment"]:
+            table["comment"] = row["comment"]
+        if row["estimated_rows"] is not None:
+            table["estimated_rows"] = row["estimated_rows"]
+        if row["total_bytes"] is not None:
+            table["total_bytes"] = row["total_bytes"]
+        table["columns"] = []
+        snapshot.setdefault(row["schema_name"], {})[row["table_name"]] = table
+
+    def table_of(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return snapshot.get(row["schema_name"], {}).get(row["table_name"])
+
+    for row in columns:
+        table = table_of(row)
+        if table is None:
+            continue
+        column: Dict[str, Any] = {"name": row["column_name"], "type": row["data_type"]}
+        if not row["nullable"]:
+            column["not_null"] = True
+        if row["column_default"] is not None:
+            column["default"] = row["column_default"]
+        if row["comment"]:
+            column["comment"] = row["comment"]
+        table["columns"].append(column)
+
+    for row in constraints:
+        table = table_of(row)
+        if table is None:
+            continue
+        if row["constraint_type"] == "p":
+            table["primary_key"] = row["columns"]
+        elif row["constraint_type"] == "f":
+            table.setdefault("foreign_keys", []).append(
+                {
+                    "name": row["constraint_name"],
+                    "columns": row["columns"],
+                    "references": f"{row['ref_schema']}.{row['ref_table']}",
+                    "ref_columns": row["ref_columns"],
+                }
+            )
+        else:
+            table.setdefault("constraints", []).append(
+                {
+                    "name": row["constraint_name"],
+                    "type": CONSTRAINT_TYPES[row["constraint_type"]],
+                    "definition": row["definition"],
+                }
+            )
+
+    for row in indexes:
+        table = table_of(row)
+        if table is None:
+            continue
+        index: Dict[str, Any] = {
+            "name": row["index_name"],
+            "definition": row["definition"],
+            "bytes": row["bytes"],
+        }
+        if row["is_primary"]:
+            index["primary"] = True
+        elif row["is_unique"]:
+            index["unique"] = True
+        table.setdefault("indexes", []).append(index)
+    return snapshot
+
+
+async def load_schema_snapshot(
+    schema_name: Optional[str] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    用四条集合查询（表、列、约束、索引）加载整个数据库或单个模式的结构，
+    查询次数与表的数量无关，四条查询并发执行
+    """
+    params = {"schema": schema_name}
+    results = await asyncio.gather(
+        aexecute_query(SNAPSHOT_TABLES_QUERY, params),
+        aexecute_query(SNAPSHOT_COLUMNS_QUERY, params),
+        aexecute_query(SNAPSHOT_CONSTRAINTS_QUERY, params),
+        aexecute_query(SNAPSHOT_INDEXES_QUERY, params),
+    )
+    return build_schema_snapshot(*results)
+
+
+async def get_schema_snapshot(schema_name: str) -> Dict[str, Any]:
+    """获取单个模式的快照，按模式缓存"""
+
+    async def load() -> Dict[str, Any]:
+        snapshot = await load_schema_snapshot(schema_name)
+        return snapshot.get(schema_name, {})
+
+    return await current_database().schema_cache.get_or_load(
+        ("snapshot", schema_name), load
+    )
+
+
+async def get_database_snapshot() -> Dict[str, Dict[str, Any]]:
+    """
+    获取整个数据库的快照
+
+    整库加载后按模式拆分写入缓存，之后对单个模式的读取直接命中缓存；
+    所有模式都已缓存时直接拼装，不再查询。
+    """
+    schema_cache = current_database().schema_cache
+    await schema_cache.validate()
+    cache = schema_cache.cache
+    marker = object()
+    schema_names = cache.get(("snapshot_schemas",), marker)
+    if schema_names is not marker:
+        parts = {name: cache.get(("snapshot", name), marker) for name in schema_names}
+        if all(part is not marker for part in parts.values()):
+            return parts
+    generation = cache.generation
+    snapshot = await load_schema_snapshot()
+    for name, part in snapshot.items():
+        cache.set(("snapshot", name), part, generation)
+    cache.set(("snapshot_schemas",), sorted(snapshot), generation)
+    return snapshot
@@ -0,0 +1,352 @@
+"""
+快照会话
+
+把一个MCP会话的工具调用绑定到同一个 REPEATABLE READ 只读事务，看到同一个数据快照。
+"""
+
+import itertools
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Set
+
+import psycopg2
+
+from .config import SNAPSHOT_SESSION_CONFIG
+from .db import _snapshot_session
+from .pool import ReplicaRouter, _cancel_scope
+from .session import on_session_close, session_key
+
+if TYPE_CHECKING:
+    from .databases import Database
+
+
+# === 快照会话 ===
+
+
+class SessionConnection:
+    """
+    快照会话连接在单次调用中的视图
+
+    每次调用在保存点中执行，rollback/commit 只回滚到该保存点，不会结束会话的事务，
+    调用中设置的超时也随之恢复。其余属性和方法直接转发给底层连接。
+    """
+
+    def __init__(self, session: "SnapshotSession"):
+        self._session = session
+        self._conn = session.conn
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def rollback(self) -> None:
+        with self._conn.cursor() as cur:
+            cur.execute("ROLLBACK TO SAVEPOINT mcp_call")
+
+    commit = rollback
+
+    def prepare(self, name: str, query: str) -> str:
+        """
+        在会话连接上预备语句（只在第一次使用时 PREPARE），返回对应的 EXECUTE 语句
+
+        查询中的 %s 占位符改写为 $1、$2……，返回的 EXECUTE 语句仍以 %s 传递参数。
+        """
+        numbers = itertools.count(1)
+        count = 0
+
+        def placeholder(match: "re.Match[str]") -> str:
+            nonlocal count
+            if match.group(0) == "%%":
+                return "%"
+            count = next(numbers)
+            return f"${count}"
+
+        statement = re.sub(r"%%|%s", placeholder, query.strip().rstrip(";"))
+        if name not in self._session.prepared:
+            with self._conn.cursor() as cur:
+                cur.execute(f"PREPARE {name} AS {statement}")
+            self._session.prepared.add(name)
+        if not count:
+            return f"EXECUTE {name}"
+        return f"EXECUTE {name} ({', '.join(['%s'] * count)})"
+
+
+class SnapshotSession:
+    """
+    绑定到一个MCP会话的 REPEATABLE READ 只读事务
+
+    会话独占一个连接，之后的工具调用都在这个事务中执行，看到同一个数据快照，
+    并复用在该连接上预备的目录查询。导出快照后，会话连接正忙时的并发调用和分页游标
+    使用导入同一快照的其他连接并行执行。
+    """
+
+    def __init__(
+        self, key: str, database: "Database", export_snapshot: bool, idle_timeout: float
+    ):
+        self.key = key
+        self.database = database
+        self.idle_timeout = idle_timeout
+        self.pool = database.pool
+        self.conn = self.pool.getconn()
+        # 并行连接必须与会话连接位于同一台服务器才能导入快照
+        self.origin = (
+            self.pool.pool_for(self.conn)
+            if isinstance(self.pool, ReplicaRouter)
+            else self.pool
+        )
+        self.prepared: Set[str] = set()
+        self.snapshot_id: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.calls = 0
+        self.parallel_calls = 0
+        self.broken = False
+        self.lock = threading.Lock()
+        try:
+            self.conn.rollback()
+            with self.conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                # 会话在调用之间处于空闲事务中，由回收线程按空闲超时关闭
+                cur.execute(
+                    "SELECT set_config('idle_in_transaction_session_timeout', %s, true)",
+                    (str(int((idle_timeout + 60) * 1000)),),
+                )
+                cur.execute("SELECT now() AS started_at")
+                self.started_at = str(cur.fetchone()[0])
+                if export_snapshot:
+                    cur.execute("SELECT pg_export_snapshot()")
+                    self.snapshot_id = cur.fetchone()[0]
+        except psycopg2.Error as e:
+            self.pool.putconn(self.conn, discard=True)
+            raise Exception(f"打开快照会话失败: {e}")
+        # 连接由会话继续持有，不再随打开会话的调用一起取消
+        scope = _cancel_scope.get()
+        if scope is not None:
+            scope.detach(self.conn)
+
+    def _import_snapshot(self):
+        """从会话所在的连接池借出一个连接，并导入会话导出的快照"""
+        conn = self.origin.getconn()
+        try:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                cur.execute("SET TRANSACTION SNAPSHOT %s", (self.snapshot_id,))
+        except psycopg2.Error as e:
+            self.origin.putconn(conn, discard=True)
+            raise Exception(f"导入快照失败，快照会话可能已关闭: {e}")
+        return conn
+
+    def getconn(self):
+        """借出导入了会话快照的连接，供需要长期占用连接的分页游标使用"""
+        if self.snapshot_id is None:
+            raise Exception(
+                "快照会话中的分页游标需要导出快照，请使用 export_snapshot=true 重新打开会话"
+            )
+        self.parallel_calls += 1
+        return self._import_snapshot()
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        self.origin.putconn(conn, discard)
+
+    def cancel(self, conn) -> None:
+        self.origin.cancel(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        借出会话连接执行一次调用
+
+        会话连接正忙时，导出了快照的会话改用导入同一快照的连接并行执行，
+        否则等待会话连接空闲。
+        """
+        if self.broken:
+            raise Exception("快照会话已失效，请重新打开")
+        acquired = self.lock.acquire(blocking=False)
+        if not acquired and self.snapshot_id is not None:
+            conn = self.getconn()
+            discard = False
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                discard = True
+                raise
+            finally:
+                self.putconn(conn, discard=discard or conn.closed)
+            return
+        if not acquired and not self.lock.acquire(timeout=self.origin.checkout_timeout):
+            raise Exception("等待快照会话连接超时")
+
+        scope = _cancel_scope.get()
+        try:
+            if scope is not None and not scope.attach(self.origin, self.conn):
+                raise Exception("数据库调用已取消")
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SAVEPOINT mcp_call")
+                yield SessionConnection(self)
+            finally:
+                try:
+                    with self.conn.cursor() as cur:
+                        cur.execute("ROLLBACK TO SAVEPOINT mcp_call")
+                        cur.execute("RELEASE SAVEPOINT mcp_call")
+                except psycopg2.Error:
+                    self.broken = True
+                if scope is not None:
+                    scope.detach(self.conn)
+        finally:
+            self.calls += 1
+            self.last_used = time.monotonic()
+            self.lock.release()
+
+    def close(self) -> None:
+        """结束事务，清除预备语句并归还连接"""
+        with self.lock:
+            discard = self.broken or self.conn.closed != 0
+            if not discard:
+                try:
+                    self.conn.rollback()
+                    if self.prepared:
+                        with self.conn.cursor() as cur:
+                            cur.execute("DEALLOCATE ALL")
+                        self.conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            self.pool.putconn(self.conn, discard=discard)
+            self.broken = True
+
+    def describe(self) -> Dict[str, Any]:
+        """会话信息"""
+        return {
+            "database": self.database.name,
+            "isolation": "REPEATABLE READ READ ONLY",
+            "snapshot_started_at": self.started_at,
+            "snapshot_id": self.snapshot_id,
+            "idle_timeout": self.idle_timeout,
+            "age_seconds": round(time.monotonic() - self.created_at, 1),
+            "calls": self.calls,
+            "parallel_calls": self.parallel_calls,
+            "prepared_statements": sorted(self.prepared),
+        }
+
+
+class SnapshotSessionRegistry:
+    """
+    快照会话注册表
+
+    每个MCP会话最多一个快照会话，空闲超时的会话由后台线程关闭，并限制同时打开的会话数。
+    """
+
+    def __init__(self, idle_timeout: float = 300, max_open: int = 2):
+        self.idle_timeout = idle_timeout
+        self.max_open = max(1, max_open)
+        self._sessions: Dict[str, SnapshotSession] = {}
+        # 正在打开（已计入上限）的会话数
+        self._opening = 0
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._counters = {"opened": 0, "closed": 0, "expired": 0}
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(
+                target=self._reap_loop, name="pg-snapshot-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(max(1.0, min(self.idle_timeout / 2, 30.0)))
+            self.reap()
+
+    def reap(self) -> int:
+        """关闭空闲超时或连接已失效的会话，返回关闭的数量"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                self._sessions.pop(key)
+                for key, session in list(self._sessions.items())
+                if (session.broken or now - session.last_used > session.idle_timeout)
+                and not session.lock.locked()
+            ]
+            self._counters["expired"] += len(expired)
+        for session in expired:
+            session.close()
+        return len(expired)
+
+    def get(self, key: str) -> Optional[SnapshotSession]:
+        with self._lock:
+            return self._sessions.get(key)
+
+    def open(
+        self,
+        key: str,
+        database: "Database",
+        export_snapshot: bool = False,
+        idle_timeout: float = 0,
+    ) -> SnapshotSession:
+        """为MCP会话打开快照会话，已有的会话先关闭"""
+        self.close(key)
+        with self._lock:
+            if len(self._sessions) + self._opening >= self.max_open:
+                raise Exception(
+                    f"快照会话数量已达上限（{self.max_open}个），请先关闭不再使用的会话"
+                )
+            self._opening += 1
+        try:
+            session = SnapshotSession(
+                key, database, export_snapshot, idle_timeout or self.idle_timeout
+            )
+        finally:
+            with self._lock:
+                self._opening -= 1
+        with self._lock:
+            replaced = self._sessions.get(key)
+            self._sessions[key] = session
+            self._counters["opened"] += 1
+        # 同一MCP会话并发打开时只保留最后一个
+        if replaced is not None:
+            replaced.close()
+        self._ensure_reaper()
+        return session
+
+    def close(self, key: str) -> Optional[SnapshotSession]:
+        """关闭MCP会话的快照会话，返回被关闭的会话"""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            del self._sessions[key]
+            self._counters["closed"] += 1
+        session.close()
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        """快照会话统计信息"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "open": len(sessions),
+            "max_open": self.max_open,
+            "idle_timeout": self.idle_timeout,
+            "sessions": [session.describe() for session in sessions],
+            **self._counters,
+        }
+
+
+snapshot_sessions = SnapshotSessionRegistry(**SNAPSHOT_SESSION_CONFIG)
+on_session_close(snapshot_sessions.close)
+
+
+@contextmanager
+def use_snapshot_session(database: "Database") -> Iterator[Optional[SnapshotSession]]:
+    """当前MCP会话在该数据库上打开了快照会话时，上下文中的查询都在会话的事务中执行"""
+    session = snapshot_sessions.get(session_key())
+    if session is not None and session.database is not database:
+        session = None
+    token = _snapshot_session.set(session)
+    try:
+        yield session
+    finally:
+        _snapshot_session.reset(token)
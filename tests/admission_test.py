@@ -0,0 +1,139 @@
+"""
+准入控制的测试
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from postgresql.admission import AdmissionController, AdmissionRejected, with_admission
+
+
+def controller(**options):
+    config = {
+        "max_active": 2,
+        "client_max_active": 1,
+        "max_queued": 10,
+        "client_max_queued": 5,
+        "queue_timeout": 30,
+        "client_header": "x-client-id",
+    }
+    config.update(options)
+    return AdmissionController(**config)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_per_client_limit_queues_extra_calls():
+    admission = controller()
+    await admission.acquire("a")
+    await admission.acquire("b")
+    waiter = asyncio.ensure_future(admission.acquire("a"))
+    await settle()
+    assert not waiter.done()
+    assert admission.stats()["queued"] == 1
+
+    admission.release("a", 0.5)
+    await settle()
+    assert waiter.done()
+    stats = admission.stats()
+    assert (stats["active"], stats["queued"], stats["admitted"]) == (2, 0, 3)
+
+
+async def test_waiting_clients_are_served_in_turn():
+    admission = controller(max_active=1, client_max_active=1)
+    await admission.acquire("a")
+    order = []
+
+    async def call(client):
+        await admission.acquire(client)
+        order.append(client)
+
+    tasks = [asyncio.ensure_future(call(c)) for c in ("a", "a", "b", "b")]
+    await settle()
+    for _ in range(4):
+        admission.release(order[-1] if order else "a", 0.1)
+        await settle()
+    await asyncio.gather(*tasks)
+    # 刚执行完的客户端排到轮转顺序的末尾，两个客户端排队的调用交替执行
+    assert order == ["b", "a", "b", "a"]
+
+
+async def test_rejects_when_queues_are_full():
+    admission = controller(max_active=1, max_queued=2, client_max_queued=1)
+    await admission.acquire("a")
+    waiters = [asyncio.ensure_future(admission.acquire(c)) for c in ("a", "b")]
+    await settle()
+    with pytest.raises(AdmissionRejected, match="排队的请求已达上限"):
+        await admission.acquire("c")
+
+    admission = controller(max_active=1, client_max_queued=1)
+    await admission.acquire("a")
+    waiters.append(asyncio.ensure_future(admission.acquire("b")))
+    await settle()
+    with pytest.raises(AdmissionRejected, match="该客户端") as exc_info:
+        await admission.acquire("b")
+    assert exc_info.value.retry_after >= 1
+    for waiter in waiters:
+        waiter.cancel()
+
+
+async def test_rejects_when_estimated_wait_is_too_long():
+    admission = controller(max_active=1, queue_timeout=1)
+    await admission.acquire("a")
+    admission._avg_hold = 5.0
+    with pytest.raises(AdmissionRejected, match="预计等待时间过长"):
+        await admission.acquire("b")
+
+
+async def test_queue_timeout_and_cancellation_clean_up():
+    admission = controller(max_active=1, queue_timeout=1)
+    admission._avg_hold = 0.01
+    await admission.acquire("a")
+    with pytest.raises(AdmissionRejected, match="排队等待超时"):
+        await admission.acquire("b")
+    assert admission.stats()["queued"] == 0
+    assert admission.stats()["timed_out"] == 1
+
+    admission.queue_timeout = 30
+    waiter = asyncio.ensure_future(admission.acquire("c"))
+    await settle()
+    waiter.cancel()
+    await settle()
+    assert admission.stats()["queued"] == 0
+    admission.release("a", 0.1)
+    assert admission.stats()["active"] == 0
+
+
+def test_client_id():
+    admission = controller()
+
+    def context(headers, host):
+        client = SimpleNamespace(host=host) if host else None
+        return SimpleNamespace(request=SimpleNamespace(headers=headers, client=client))
+
+    assert admission.client_id(context({"x-client-id": "team-1"}, "10.0.0.1")) == (
+        "header:team-1"
+    )
+    assert admission.client_id(context({}, "10.0.0.1")) == "addr:10.0.0.1"
+    assert admission.client_id(None) == "default"
+
+
+async def test_with_admission_returns_retry_hint(monkeypatch):
+    admission = controller(max_active=1, max_queued=0)
+    admission.enabled = True
+    monkeypatch.setattr("postgresql.admission.admission", admission)
+
+    @with_admission
+    async def tool():
+        return "ok"
+
+    assert await tool() == "ok"
+    await admission.acquire("default")
+    text = await tool()
+    assert text.startswith("错误: 服务器繁忙")
+    assert "retry_after=" in text
@@ -4,7 +4,17 @@
 
 import asyncio
 
-from gen_images.bailian_mcpserver import mcp
+import pytest
+
+import gen_images.bailian_mcpserver as bailian
+from gen_images.bailian_mcpserver import (
+    POLL_BACKOFF,
+    POLL_INITIAL_INTERVAL,
+    CompletionTracker,
+    get_http_client,
+    http_client_lifespan,
+    mcp,
+)
 
 
 async def test_mcp_server():
@@ -15,5 +25,41 @@ async def test_mcp_server():
         print(f"   - {tool_name}")
 
 
+
+def test_completion_tracker_observe_uses_task_times():
+    tracker = CompletionTracker(10.0)
+    tracker.observe(
+        {"submit_time": "2025-01-01 00:00:00.000", "end_time": "2025-01-01 00:00:20.000"},
+        waited=99.0,
+    )
+    assert tracker.typical == pytest.approx(12.0)
+    # 缺少时间字段时使用等待时长
+    tracker.observe({}, waited=2.0)
+    assert tracker.typical == pytest.approx(10.0)
+    tracker.observe({}, waited=0)
+    assert tracker.typical == pytest.approx(10.0)
+
+
+def test_completion_tracker_next_delay():
+    tracker = CompletionTracker(100.0)
+    assert tracker.next_delay(0, 0, 3) == POLL_INITIAL_INTERVAL
+    assert tracker.next_delay(1, 0, 3) == POLL_INITIAL_INTERVAL * POLL_BACKOFF
+    assert tracker.next_delay(10, 0, 3) == 3
+    # 预计完成时刻早于下一次查询时，在预计完成时刻查询
+    tracker.typical = 12.0
+    assert tracker.next_delay(10, 10.0, 3) == pytest.approx(2.0)
+    # 已经超过预计完成时刻时按退避间隔查询
+    assert tracker.next_delay(10, 20.0, 3) == 3
+
+
+async def test_http_client_closed_after_last_session():
+    async with http_client_lifespan(mcp):
+        async with http_client_lifespan(mcp):
+            client = get_http_client()
+        assert not client.is_closed
+    assert client.is_closed
+    assert bailian._http_client is None
+
+
 if __name__ == "__main__":
     asyncio.run(test_mcp_server())
@@ -0,0 +1,127 @@
+"""
+列统计的测试
+"""
+
+import json
+
+import pytest
+
+from postgresql.column_stats import (
+    build_column_stats_query,
+    distinct_estimate,
+    scan_column_stats,
+)
+
+
+def column(name, base_type, category):
+    return {
+        "column_name": name,
+        "column_ident": name,
+        "data_type": base_type,
+        "base_type": base_type,
+        "type_category": category,
+    }
+
+
+def test_money_average_casts_to_numeric():
+    query, aliases = build_column_stats_query(
+        "accounts", [column("id", "int4", "N"), column("balance", "money", "N")]
+    )
+    assert "AVG(id) AS c0_avg_value" in query
+    assert "AVG(balance::numeric) AS c1_avg_value" in query
+    assert "MIN(balance) AS c1_min_value" in query
+    assert aliases["balance"]["avg_value"] == "c1_avg_value"
+
+
+def test_sampling_clause():
+    query, _ = build_column_stats_query("t", [column("id", "int4", "N")], ("SYSTEM", 1.5))
+    assert query.endswith("FROM t TABLESAMPLE SYSTEM (1.5);")
+
+
+class FakePgError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def failing_execute(pgcode, calls):
+    async def fake_execute(query, *args, **kwargs):
+        calls.append(query)
+        if "bad" in query:
+            raise Exception("SQL查询执行失败: boom") from FakePgError(pgcode)
+        return [{"scanned_rows": 4, "c0_non_null_count": 3}]
+
+    return fake_execute
+
+
+def test_distinct_only_counted_when_requested():
+    columns = [column("id", "int4", "N")]
+    query, aliases = build_column_stats_query("t", columns)
+    assert "DISTINCT" not in query
+    assert "distinct_count" not in aliases["id"]
+    query, aliases = build_column_stats_query("t", columns, exact_distinct=True)
+    assert "COUNT(DISTINCT id) AS c0_distinct_count" in query
+
+
+def test_distinct_estimate():
+    assert distinct_estimate(None, 100) is None
+    assert distinct_estimate(42.0, 100) == 42
+    assert distinct_estimate(-0.5, 100) == 50
+    assert distinct_estimate(-1.0, None) is None
+
+
+async def test_scan_falls_back_to_per_column_for_column_errors(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        "postgresql.column_stats.aexecute_query", failing_execute("42883", calls)
+    )
+    scanned_rows, stats = await scan_column_stats(
+        "t", [column("good", "text", "U"), column("bad", "int4", "N")]
+    )
+    assert len(calls) == 3
+    assert scanned_rows == 4
+    assert stats["good"] == {"non_null_count": 3}
+    assert "boom" in stats["bad"]["error"]
+
+
+async def test_scan_does_not_rescan_after_timeout(monkeypatch):
+    calls = []
+    # 57014: query_canceled（statement_timeout 或取消）
+    monkeypatch.setattr(
+        "postgresql.column_stats.aexecute_query", failing_execute("57014", calls)
+    )
+    with pytest.raises(Exception, match="boom"):
+        await scan_column_stats(
+            "t", [column("good", "text", "U"), column("bad", "int4", "N")]
+        )
+    assert len(calls) == 1
+
+
+@pytest.fixture
+def money_table(db):
+    with db.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS mcp_test_money")
+        cur.execute("CREATE TABLE mcp_test_money (id int, balance money)")
+        cur.execute("INSERT INTO mcp_test_money VALUES (1, 10), (2, 20), (3, NULL)")
+    yield "mcp_test_money"
+    with db.cursor() as cur:
+        cur.execute("DROP TABLE mcp_test_money")
+
+
+async def test_analyze_money_column(money_table):
+    from postgresql.pg_mcpserver import mcp
+
+    result = await mcp.call_tool("analyze_table_stats", {"table_name": money_table})
+    content = result[0] if isinstance(result, tuple) else result
+    stats = json.loads(content[0].text)["column_stats"]["balance"]
+    assert stats["non_null_count"] == 2
+    assert stats["null_count"] == 1
+    assert float(stats["avg_value"]) == 15
+    assert "distinct_count" not in stats
+
+    result = await mcp.call_tool(
+        "analyze_table_stats", {"table_name": money_table, "exact_distinct": True}
+    )
+    content = result[0] if isinstance(result, tuple) else result
+    stats = json.loads(content[0].text)["column_stats"]["balance"]
+    assert stats["distinct_count"] == 2
@@ -0,0 +1,36 @@
+"""
+测试配置
+
+不依赖 pytest-asyncio：协程测试函数在新的事件循环中运行。
+需要数据库的测试使用 db fixture，无法连接数据库时跳过。
+"""
+
+import asyncio
+import inspect
+
+import pytest
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        names = pyfuncitem._fixtureinfo.argnames
+        asyncio.run(pyfuncitem.obj(**{name: pyfuncitem.funcargs[name] for name in names}))
+        return True
+    return None
+
+
+@pytest.fixture(scope="session")
+def db():
+    """可写的自动提交连接，用于准备测试数据；无法连接数据库时跳过测试"""
+    import psycopg2
+
+    from postgresql.config import DB_CONFIG
+
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+    except psycopg2.Error as e:
+        pytest.skip(f"数据库不可用: {e}")
+    conn.autocommit = True
+    yield conn
+    conn.close()
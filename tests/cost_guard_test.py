@@ -0,0 +1,128 @@
+"""
+执行计划检查的测试
+"""
+
+import pytest
+
+from postgresql.config import COST_GUARD_CONFIG
+from postgresql.cost_guard import (
+    add_tablesample,
+    check_readonly_sql,
+    cost_violation,
+    effective_cost,
+    summarize_plan,
+    wrap_limit,
+)
+
+
+def test_check_readonly_sql():
+    assert check_readonly_sql("  select 1") is None
+    assert check_readonly_sql("WITH x AS (SELECT 1) SELECT * FROM x") is None
+    assert check_readonly_sql("VACUUM") is not None
+    assert check_readonly_sql("SELECT 1; DROP TABLE t") is not None
+
+
+def test_wrap_limit_strips_semicolon():
+    assert wrap_limit("SELECT * FROM t ;", 11) == (
+        "SELECT * FROM (\nSELECT * FROM t\n) AS limited_query LIMIT 11"
+    )
+
+
+def test_add_tablesample_keeps_or_adds_alias():
+    assert add_tablesample(
+        "SELECT o.id FROM orders o JOIN customers c ON c.id = o.cid", {"orders"}, 1.5
+    ) == (
+        "SELECT o.id FROM (SELECT * FROM orders TABLESAMPLE SYSTEM (1.5)) o "
+        "JOIN customers c ON c.id = o.cid"
+    )
+    assert add_tablesample(
+        "SELECT count(*) FROM public.orders WHERE orders.id > 5", {"orders"}, 10
+    ) == (
+        "SELECT count(*) FROM (SELECT * FROM public.orders TABLESAMPLE SYSTEM (10)) "
+        "AS orders WHERE orders.id > 5"
+    )
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT 'from orders' AS s FROM orders",
+        "SELECT extract(year FROM orders) FROM orders",
+        "SELECT substring(note FROM 2) FROM orders",
+        "SELECT * FROM public.orders WHERE public.orders.id > 5",
+        "SELECT * FROM orders -- from orders\nWHERE id > 5",
+        "SELECT * FROM orders /* join orders */",
+        "SELECT * FROM orders WHERE a IS DISTINCT FROM b",
+        'SELECT id AS "from orders" FROM orders',
+        "SELECT $$from orders$$ FROM orders",
+    ],
+)
+def test_add_tablesample_skips_unsafe_queries(sql):
+    assert add_tablesample(sql, {"orders"}, 5) == sql
+
+
+def plan_node(node_type, cost, rows, startup=0.0, **extra):
+    return {
+        "Node Type": node_type,
+        "Startup Cost": startup,
+        "Total Cost": cost,
+        "Plan Rows": rows,
+        **extra,
+    }
+
+
+def test_effective_cost_and_violation(monkeypatch):
+    plan = plan_node("Seq Scan", 1000.0, 1000, startup=100.0, **{"Relation Name": "t"})
+    assert effective_cost(plan, 10) == pytest.approx(109.0)
+    monkeypatch.setitem(COST_GUARD_CONFIG, "max_cost", 500)
+    monkeypatch.setitem(COST_GUARD_CONFIG, "max_plan_rows", 0)
+    assert cost_violation(plan, 10) is None
+    assert "估算代价" in cost_violation(plan, 1000)
+
+
+def test_summarize_plan():
+    scan = plan_node(
+        "Seq Scan", 900.0, 500000, **{"Relation Name": "orders", "Filter": "(x > 1)"}
+    )
+    index = plan_node(
+        "Index Scan",
+        10.0,
+        1,
+        **{
+            "Relation Name": "customers",
+            "Index Name": "customers_pkey",
+            "Index Cond": "(id = orders.cid)",
+        },
+    )
+    join = plan_node("Nested Loop", 1000.0, 500000, Plans=[scan, index])
+    plan = plan_node(
+        "Sort", 1200.0, 500000, startup=1100.0, **{"Sort Key": ["x"], "Plans": [join]}
+    )
+
+    summary = summarize_plan(plan, 101, {"orders": 500000})
+    assert summary["top_node"] == "Sort"
+    assert summary["seq_scans"] == [
+        {
+            "table": "orders",
+            "estimated_rows": 500000,
+            "table_rows": 500000,
+            "filter": "(x > 1)",
+        }
+    ]
+    assert summary["index_scans"][0]["index"] == "customers_pkey"
+    assert summary["joins"] == [
+        {"type": "Nested Loop", "join_type": None, "estimated_rows": 500000}
+    ]
+    assert summary["sorts"] == [{"sort_key": ["x"], "estimated_rows": 500000}]
+    # 内侧使用索引条件的嵌套循环不视为笛卡尔积，只提示大表顺序扫描
+    assert len(summary["warnings"]) == 1
+    assert "orders" in summary["warnings"][0]
+
+
+def test_summarize_plan_warns_about_cartesian_product():
+    inner = plan_node("Seq Scan", 10.0, 100, **{"Relation Name": "b"})
+    outer = plan_node("Seq Scan", 10.0, 100, **{"Relation Name": "a"})
+    plan = plan_node("Nested Loop", 200.0, 10000, Plans=[outer, inner])
+    summary = summarize_plan(plan, 101, {})
+    assert "index_scans" not in summary
+    assert any("笛卡尔积" in warning for warning in summary["warnings"])
@@ -0,0 +1,117 @@
+"""
+分页的测试：keyset续页令牌与 get_sample_data 的分页方式
+"""
+
+import base64
+import json
+
+import pytest
+
+from postgresql.cursors import (
+    cursor_registry,
+    decode_keyset_token,
+    encode_keyset_token,
+)
+
+
+STATE = {"d": "default", "t": "public.orders", "k": ["id"], "v": [5], "n": 10}
+
+
+def test_keyset_token_round_trip():
+    token = encode_keyset_token(STATE)
+    assert token.startswith("k.")
+    assert decode_keyset_token(token) == STATE
+
+
+def test_keyset_token_rejects_tampered_payload():
+    token = encode_keyset_token(STATE)
+    _, payload, signature = token.split(".")
+    state = json.loads(base64.urlsafe_b64decode(payload))
+    state["t"] = "orders; DROP TABLE orders"
+    forged = base64.urlsafe_b64encode(json.dumps(state).encode()).decode("ascii")
+    with pytest.raises(Exception, match="无效"):
+        decode_keyset_token(f"k.{forged}.{signature}")
+
+
+def test_keyset_token_rejects_unsigned_and_malformed():
+    unsigned = "k." + base64.urlsafe_b64encode(json.dumps(STATE).encode()).decode()
+    with pytest.raises(Exception):
+        decode_keyset_token(unsigned)
+    with pytest.raises(Exception):
+        decode_keyset_token("k.不是令牌.x")
+
+
+async def call(name, **arguments):
+    from postgresql.pg_mcpserver import mcp
+
+    result = await mcp.call_tool(name, arguments)
+    content = result[0] if isinstance(result, tuple) else result
+    return content[0].text
+
+
+@pytest.fixture
+def sample_tables(db):
+    with db.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS mcp_test_keyed, mcp_test_heap CASCADE")
+        cur.execute("CREATE TABLE mcp_test_keyed (id int PRIMARY KEY, v text)")
+        cur.execute("INSERT INTO mcp_test_keyed SELECT g, 'k' || g FROM generate_series(1, 5) g")
+        cur.execute("CREATE TABLE mcp_test_heap (v int)")
+        cur.execute("INSERT INTO mcp_test_heap SELECT generate_series(1, 5)")
+    yield
+    with db.cursor() as cur:
+        cur.execute("DROP TABLE mcp_test_keyed, mcp_test_heap")
+
+
+async def test_sample_data_keyset_pages(sample_tables):
+    first = json.loads(await call("get_sample_data", table_name="mcp_test_keyed", limit=3))
+    assert [row["id"] for row in first["data"]] == [1, 2, 3]
+    second = json.loads(await call("fetch_next_page", token=first["next_token"]))
+    assert [row["id"] for row in second["data"]] == [4, 5]
+    assert second["next_token"] is None
+
+
+async def test_sample_data_keyset_pages_with_long_text_key(db):
+    # 主键比 QUERY_VALUE_MAX_CHARS 长，续页令牌里必须是完整值
+    with db.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS mcp_test_long_key")
+        cur.execute("CREATE TABLE mcp_test_long_key (k text PRIMARY KEY, n int)")
+        cur.execute(
+            "INSERT INTO mcp_test_long_key "
+            "SELECT repeat('x', 5000) || lpad(g::text, 2, '0'), g "
+            "FROM generate_series(1, 7) g"
+        )
+    try:
+        seen = []
+        page = json.loads(
+            await call("get_sample_data", table_name="mcp_test_long_key", limit=2)
+        )
+        seen.extend(row["n"] for row in page["data"])
+        while page.get("next_token"):
+            page = json.loads(await call("fetch_next_page", token=page["next_token"]))
+            seen.extend(row["n"] for row in page["data"])
+        assert seen == list(range(1, 8))
+    finally:
+        with db.cursor() as cur:
+            cur.execute("DROP TABLE mcp_test_long_key")
+
+
+async def test_sample_data_without_key_does_not_hold_cursor(sample_tables):
+    before = cursor_registry.stats()["open"]
+    page = json.loads(await call("get_sample_data", table_name="mcp_test_heap", limit=2))
+    assert page["sample_size"] == 2
+    assert page["truncated"] is True
+    assert "next_token" not in page
+    assert cursor_registry.stats()["open"] == before
+
+    page = json.loads(
+        await call("get_sample_data", table_name="mcp_test_heap", limit=2, paginate=True)
+    )
+    assert page["next_token"]
+    assert cursor_registry.stats()["open"] == before + 1
+    await call("close_cursor", token=page["next_token"])
+    assert cursor_registry.stats()["open"] == before
+
+
+async def test_sample_data_rejects_unknown_table(sample_tables):
+    text = await call("get_sample_data", table_name="mcp_test_keyed; SELECT 1")
+    assert text.startswith("获取表")
@@ -0,0 +1,84 @@
+"""
+查询结果导出的测试
+"""
+
+import io
+import json
+import os
+import time
+
+import pytest
+
+from postgresql.export import CopyWriter, cleanup_exports, export_preview
+
+
+def test_copy_writer_keeps_head_and_enforces_limit():
+    file = io.BytesIO()
+    writer = CopyWriter(file, max_bytes=10, head_bytes=4)
+    writer.write(b"abcdef")
+    assert bytes(writer.head) == b"abcd"
+    assert file.getvalue() == b"abcdef"
+    with pytest.raises(Exception, match="上限"):
+        writer.write(b"ghijk")
+
+
+def test_export_preview_drops_incomplete_last_row():
+    head = "id,name\n1,甲\n2,乙\n3,丙丙".encode("utf-8")
+    columns, rows = export_preview(head, "utf-8", complete=False, limit=5)
+    assert columns == ["id", "name"]
+    assert rows == [{"id": "1", "name": "甲"}, {"id": "2", "name": "乙"}]
+    _, rows = export_preview(head, "utf-8", complete=True, limit=1)
+    assert rows == [{"id": "1", "name": "甲"}]
+    assert export_preview(b"", "utf-8", True, 5) == ([], [])
+
+
+def test_cleanup_exports_removes_only_expired_export_files(tmp_path):
+    old = tmp_path / "export_old.csv"
+    new = tmp_path / "export_new.csv"
+    other = tmp_path / "keep.csv"
+    for path in (old, new, other):
+        path.write_text("x")
+    past = time.time() - 3600
+    os.utime(old, (past, past))
+    os.utime(other, (past, past))
+    assert cleanup_exports(str(tmp_path), ttl=60) == 1
+    assert not old.exists() and new.exists() and other.exists()
+    assert cleanup_exports(str(tmp_path), ttl=0) == 0
+
+
+async def test_export_uses_its_own_cost_limit(db, monkeypatch, tmp_path):
+    from postgresql.config import COST_GUARD_CONFIG, EXPORT_CONFIG
+    from postgresql.pg_mcpserver import mcp
+
+    async def export():
+        result = await mcp.call_tool(
+            "export_query", {"sql": "SELECT generate_series(1, 100000) AS n"}
+        )
+        content = result[0] if isinstance(result, tuple) else result
+        return content[0].text
+
+    monkeypatch.setitem(EXPORT_CONFIG, "dir", str(tmp_path))
+    # 交互查询的代价上限不限制导出
+    monkeypatch.setitem(COST_GUARD_CONFIG, "max_cost", 1)
+    monkeypatch.setitem(EXPORT_CONFIG, "max_cost", 0)
+    assert json.loads(await export())["row_count"] == 100000
+
+    monkeypatch.setitem(EXPORT_CONFIG, "max_cost", 1)
+    assert "已拒绝导出" in await export()
+
+
+async def test_export_uses_its_own_statement_timeout(db, monkeypatch, tmp_path):
+    from postgresql.config import EXPORT_CONFIG, TOOL_TIMEOUTS
+    from postgresql.pg_mcpserver import mcp
+
+    assert TOOL_TIMEOUTS["export_query"]["statement_timeout"] == (
+        EXPORT_CONFIG["statement_timeout_ms"]
+    )
+    monkeypatch.setitem(EXPORT_CONFIG, "dir", str(tmp_path))
+    result = await mcp.call_tool(
+        "export_query",
+        {"sql": "SELECT current_setting('statement_timeout') AS timeout"},
+    )
+    content = result[0] if isinstance(result, tuple) else result
+    preview = json.loads(content[0].text)["preview"]
+    assert preview == [{"timeout": "0"}]
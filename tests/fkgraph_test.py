@@ -0,0 +1,93 @@
+"""
+外键关系图的测试
+"""
+
+import pytest
+
+from postgresql.fkgraph import ForeignKeyGraph
+
+
+def fk(
+    name, table, columns, ref_table, ref_columns, schema="public", ref_schema="public"
+):
+    return {
+        "constraint_name": name,
+        "schema_name": schema,
+        "table_name": table,
+        "table_ident": f"{schema}.{table}",
+        "ref_schema": ref_schema,
+        "ref_table": ref_table,
+        "ref_table_ident": f"{ref_schema}.{ref_table}",
+        "columns": columns,
+        "ref_columns": ref_columns,
+    }
+
+
+FOREIGN_KEYS = [
+    fk("orders_customer_fk", "orders", ["customer_id"], "customers", ["id"]),
+    fk("items_order_fk", "order_items", ["order_id"], "orders", ["id"]),
+    fk("items_product_fk", "order_items", ["product_id"], "products", ["id"]),
+    fk("orders_billing_fk", "orders", ["billing_customer_id"], "customers", ["id"]),
+    fk("employees_manager_fk", "employees", ["manager_id"], "employees", ["id"]),
+    fk("audit_customer_fk", "customers", ["id"], "customers", ["id"], "audit", "public"),
+]
+
+
+def test_resolve():
+    graph = ForeignKeyGraph(FOREIGN_KEYS)
+    assert graph.resolve("orders") == ("public", "orders")
+    assert graph.resolve('audit."customers"') == ("audit", "customers")
+    # 同名表优先 public
+    assert graph.resolve("customers") == ("public", "customers")
+    # 不在图中的表原样返回
+    assert graph.resolve("lonely") == ("public", "lonely")
+
+
+def test_resolve_ambiguous_without_public():
+    graph = ForeignKeyGraph(
+        [
+            fk("a_fk", "t", ["x"], "p", ["id"], "s1", "s1"),
+            fk("b_fk", "t", ["x"], "p", ["id"], "s2", "s2"),
+        ]
+    )
+    with pytest.raises(ValueError, match="不唯一"):
+        graph.resolve("t")
+
+
+def test_shortest_paths_enumerates_parallel_foreign_keys():
+    graph = ForeignKeyGraph(FOREIGN_KEYS)
+    paths = graph.shortest_paths(("public", "order_items"), ("public", "customers"))
+    assert len(paths) == 2
+    assert all(len(path) == 2 for path in paths)
+    constraints = {FOREIGN_KEYS[path[-1][2]]["constraint_name"] for path in paths}
+    assert constraints == {"orders_customer_fk", "orders_billing_fk"}
+
+
+def test_shortest_paths_limits():
+    graph = ForeignKeyGraph(FOREIGN_KEYS)
+    source, target = ("public", "products"), ("public", "customers")
+    assert len(graph.shortest_paths(source, target, max_paths=1)) == 1
+    assert graph.shortest_paths(source, target, max_depth=2) == []
+    assert graph.shortest_paths(source, source) == []
+    # 自引用外键不构成边
+    assert graph.shortest_paths(("public", "employees"), target) == []
+
+
+def test_describe_path_builds_join_clause():
+    graph = ForeignKeyGraph(FOREIGN_KEYS)
+    path = graph.shortest_paths(("public", "customers"), ("public", "products"))[0]
+    description = graph.describe_path(path)
+    assert description["length"] == 3
+    assert description["sql"].splitlines()[0] == "FROM public.customers t0"
+    assert description["steps"][0]["on"] in (
+        "t0.id = t1.customer_id",
+        "t0.id = t1.billing_customer_id",
+    )
+    assert description["sql"].splitlines()[-1] == (
+        "JOIN public.products t3 ON t2.product_id = t3.id"
+    )
+
+
+def test_stats():
+    graph = ForeignKeyGraph(FOREIGN_KEYS)
+    assert graph.stats() == {"tables": 5, "foreign_keys": 6}
@@ -0,0 +1,87 @@
+"""
+结果渲染与字节预算的测试
+"""
+
+import csv
+import io
+import json
+
+import pytest
+
+from postgresql.formatting import (
+    OUTPUT_FORMATS,
+    check_output_format,
+    fit_rows,
+    render_rows,
+)
+
+
+ROWS = [
+    {"id": i, "name": f"名称{i}", "tags": ["a", "b"], "note": None} for i in range(1000)
+]
+
+
+def meta(kept):
+    return {"row_count": kept}
+
+
+def test_json_without_budget_keeps_all_rows():
+    text, kept = render_rows(ROWS, "json", meta, "results", max_bytes=0)
+    payload = json.loads(text)
+    assert kept == 1000
+    assert payload["row_count"] == 1000
+    assert payload["results"][3] == ROWS[3]
+
+
+def test_columnar_lists_columns_once():
+    text, kept = render_rows(ROWS[:2], "columnar", meta, "results", max_bytes=0)
+    payload = json.loads(text)
+    assert payload["columns"] == ["id", "name", "tags", "note"]
+    assert payload["rows"] == [
+        [0, "名称0", ["a", "b"], None],
+        [1, "名称1", ["a", "b"], None],
+    ]
+
+
+def test_text_formats_start_with_meta_line():
+    text, _ = render_rows(ROWS[:2], "csv", meta, "results", max_bytes=0)
+    first, rest = text.split("\n", 1)
+    assert json.loads(first) == {"row_count": 2}
+    records = list(csv.reader(io.StringIO(rest)))
+    assert records[0] == ["id", "name", "tags", "note"]
+    assert records[1] == ["0", "名称0", '["a","b"]', ""]
+
+    text, _ = render_rows([{"a": "x|y"}], "markdown", meta, "results", max_bytes=0)
+    assert text.splitlines()[1:] == ["| a |", "| --- |", "| x\\|y |"]
+
+
+@pytest.mark.parametrize("fmt", OUTPUT_FORMATS)
+@pytest.mark.parametrize("max_bytes", [600, 2000, 8000])
+def test_budget_is_respected(fmt, max_bytes):
+    text, kept = render_rows(ROWS, fmt, meta, "results", max_bytes)
+    assert 1 <= kept < len(ROWS)
+    assert len(text.encode("utf-8")) <= max_bytes
+    # 元信息按最终保留的行数生成
+    if fmt in ("json", "columnar"):
+        assert json.loads(text)["row_count"] == kept
+    else:
+        assert json.loads(text.split("\n", 1)[0])["row_count"] == kept
+
+
+def test_budget_keeps_at_least_one_row():
+    rows = [{"blob": "x" * 5000}]
+    text, kept = render_rows(rows, "json", meta, "results", max_bytes=100)
+    assert kept == 1
+    assert len(text) > 100
+
+
+def test_check_output_format():
+    assert check_output_format("tsv") is None
+    assert "output_format" in check_output_format("xml")
+
+
+def test_fit_rows():
+    rows = [{"v": "x" * 100}] * 10
+    assert fit_rows(rows, 10**6, "csv") == 10
+    assert fit_rows(rows, 250, "csv") == 2
+    assert fit_rows(rows, 1, "json") == 1
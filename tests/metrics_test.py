@@ -0,0 +1,67 @@
+"""
+运行指标的测试
+"""
+
+import asyncio
+
+from postgresql.metrics import (
+    CallMetrics,
+    Histogram,
+    MetricsRegistry,
+    format_labels,
+    format_metric_value,
+    measure_serialization,
+    record_call,
+    with_metrics,
+)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    samples = list(histogram.samples())
+    assert samples[:3] == [("_bucket", "0.1", 1), ("_bucket", "1", 3), ("_bucket", "+Inf", 4)]
+    assert samples[-1] == ("_count", "", 4)
+
+
+def test_format_helpers():
+    assert format_metric_value(3.0) == "3"
+    assert format_metric_value(0.25) == "0.25"
+    assert format_metric_value(True) == "1"
+    assert format_labels({"tool": 'a"b\\c\n'}) == '{tool="a\\"b\\\\c\\n"}'
+    assert format_labels({}) == ""
+
+
+def test_registry_render_contains_counts_and_gauges():
+    registry = MetricsRegistry((0.1, 1.0), (256,))
+    call = CallMetrics()
+    call.add(db_seconds=0.05, rows=7)
+    registry.observe("execute_readonly_query", "ok", 0.2, call, 300)
+    text = registry.render([("pg_mcp_pool_in_use", "在用连接", [({"database": "x"}, 2)])])
+    assert 'pg_mcp_tool_calls_total{tool="execute_readonly_query",status="ok"} 1' in text
+    assert 'pg_mcp_tool_rows_fetched_total{tool="execute_readonly_query"} 7' in text
+    assert 'pg_mcp_tool_response_bytes_bucket{tool="execute_readonly_query",le="+Inf"} 1' in text
+    assert 'pg_mcp_pool_in_use{database="x"} 2' in text
+    assert text.endswith("\n")
+
+
+def test_with_metrics_records_status_rows_and_serialization(monkeypatch):
+    registry = MetricsRegistry((0.1, 1.0), (256,))
+    monkeypatch.setattr("postgresql.metrics.metrics", registry)
+
+    @with_metrics
+    async def tool(fail: bool = False) -> str:
+        record_call(rows=3)
+        with measure_serialization():
+            pass
+        return "查询执行失败: boom" if fail else "ok"
+
+    asyncio.run(tool())
+    asyncio.run(tool(fail=True))
+    # 不在工具调用中时忽略
+    record_call(rows=100)
+    text = registry.render([])
+    assert 'pg_mcp_tool_calls_total{tool="tool",status="ok"} 1' in text
+    assert 'pg_mcp_tool_calls_total{tool="tool",status="error"} 1' in text
+    assert 'pg_mcp_tool_rows_fetched_total{tool="tool"} 6' in text
@@ -0,0 +1,143 @@
+"""
+连接池的测试（使用不连接数据库的假连接）
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+from postgresql.pool import ConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.info = SimpleNamespace(
+            transaction_status=psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        )
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**options):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    options.setdefault("min_size", 0)
+    return ConnectionPool(connect, **options), created
+
+
+def test_connections_are_reused():
+    pool, created = make_pool(max_size=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(created) == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_checkout_times_out_when_pool_is_full():
+    pool, _ = make_pool(max_size=1, checkout_timeout=0.05)
+    pool.getconn()
+    with pytest.raises(Exception, match="连接池已满"):
+        pool.getconn()
+    assert pool.stats()["checkout_timeouts"] == 1
+
+
+def test_waiter_gets_returned_connection():
+    pool, created = make_pool(max_size=1, checkout_timeout=5)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats["checkout_waits"] == 1
+    assert stats["avg_wait_ms"] > 0
+    assert len(created) == 1
+
+
+def test_putconn_rolls_back_or_discards():
+    pool, _ = make_pool(max_size=2)
+    conn = pool.getconn()
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert not conn.closed
+
+    conn = pool.getconn()
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()["idle"] == 0
+
+
+def test_unhealthy_idle_connection_is_replaced():
+    pool, _ = make_pool(max_size=2, health_check_interval=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_expired_connection_is_closed_on_return():
+    pool, _ = make_pool(max_size=2, max_lifetime=0.01)
+    conn = pool.getconn()
+    time.sleep(0.02)
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.size == 0
+
+
+def test_connection_context_discards_broken_connection():
+    pool, _ = make_pool(max_size=2)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("connection lost")
+    assert conn.closed
+    assert pool.in_use == 0
+
+
+def test_warm_up_and_closeall():
+    pool, created = make_pool(min_size=2, max_size=4)
+    pool.warm_up()
+    assert len(created) == 2
+    assert pool.stats()["idle"] == 2
+    pool.closeall()
+    assert all(conn.closed for conn in created)
+    with pytest.raises(Exception, match="已关闭"):
+        pool.getconn()
@@ -0,0 +1,81 @@
+"""
+查询结果缓存的测试
+"""
+
+import time
+
+# 导入时加载数据库配置
+import postgresql.databases  # noqa: F401
+from postgresql.formatting import dumps_compact, result_size
+from postgresql.query_cache import QueryResultCache, normalize_sql, referenced_tables
+
+
+def key(sql, max_rows=100):
+    return "default", normalize_sql(sql), max_rows
+
+
+def test_normalize_sql_keeps_literals_and_quoted_identifiers():
+    sql = """SELECT  *  -- 注释
+        FROM "Orders" /* 块注释 */ WHERE Name = 'Ab  C' AND body = $x$Keep$x$ ;"""
+    assert normalize_sql(sql) == (
+        """select * from "Orders" where name = 'Ab  C' and body = $x$Keep$x$"""
+    )
+    assert normalize_sql("select 'it''s'") == "select 'it''s'"
+
+
+def test_referenced_tables():
+    normalized = normalize_sql(
+        'SELECT * FROM public.orders o JOIN "Customers" c ON c.id = o.cid'
+    )
+    assert referenced_tables(normalized) == {"orders", "Customers"}
+
+
+def test_make_key_skips_volatile_queries():
+    cache = QueryResultCache(enabled=True, max_bytes=1000)
+    assert cache.make_key("SELECT now()", 10) is None
+    assert cache.make_key("select 1", 10) == cache.make_key("SELECT   1;", 10)
+
+
+def test_result_size_matches_compact_json():
+    rows = [{"名称": "值", "n": 1}]
+    assert result_size(rows) == len(dumps_compact(rows).encode("utf-8"))
+
+
+def test_set_get_and_byte_budget_eviction():
+    cache = QueryResultCache(enabled=True, ttl=60, max_bytes=100)
+    cache.set(key("select * from a"), "a", 60, cache.generation)
+    cache.set(key("select * from b"), "b", 60, cache.generation)
+    assert cache.get(key("select * from a")) is None
+    assert cache.get(key("select * from b")) == "b"
+    # 单个结果超过预算时不缓存
+    cache.set(key("select * from c"), "c", 101, cache.generation)
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["uncacheable"] == 1
+    assert stats["bytes"] == 60
+
+
+def test_stale_generation_is_not_written():
+    cache = QueryResultCache(enabled=True, max_bytes=1000)
+    generation = cache.generation
+    cache.clear()
+    cache.set(key("select * from a"), "a", 10, generation)
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_expiration(monkeypatch):
+    cache = QueryResultCache(enabled=True, ttl=10, max_bytes=1000)
+    cache.set(key("select * from a"), "a", 10, cache.generation)
+    now = time.monotonic()
+    monkeypatch.setattr("postgresql.query_cache.time.monotonic", lambda: now + 11)
+    assert cache.get(key("select * from a")) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_invalidate_tables():
+    cache = QueryResultCache(enabled=True, max_bytes=1000)
+    cache.set(key("select * from orders join items on true"), 1, 10, cache.generation)
+    cache.set(key("select * from customers"), 2, 10, cache.generation)
+    assert cache.invalidate_tables(["public.ITEMS"]) == 1
+    assert cache.get(key("select * from customers")) == 2
+    assert cache.stats()["tables"] == 1
@@ -0,0 +1,49 @@
+"""
+行数统计的测试
+"""
+
+import pytest
+
+# 导入时加载数据库配置
+import postgresql.databases  # noqa: F401
+from postgresql.row_counts import ESTIMATED_ROWS_SQL, get_row_count
+
+
+@pytest.mark.parametrize(
+    "reltuples, relpages, expected",
+    [
+        # PostgreSQL 14 起从未分析过的表
+        (-1, 0, None),
+        # PostgreSQL 14 之前从未分析过的表
+        (0, 0, None),
+        # 已分析但没有数据页
+        (42, 0, 42),
+    ],
+)
+def test_estimated_rows_sql(db, reltuples, relpages, expected):
+    with db.cursor() as cur:
+        cur.execute(
+            f"SELECT {ESTIMATED_ROWS_SQL} FROM (VALUES (%s::real, %s, 0::oid))"
+            " AS c(reltuples, relpages, oid)",
+            (reltuples, relpages),
+        )
+        assert cur.fetchone()[0] == expected
+
+
+@pytest.fixture
+def unanalyzed_table(db):
+    with db.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS mcp_test_unanalyzed")
+        cur.execute("CREATE TABLE mcp_test_unanalyzed (v int)")
+        cur.execute("INSERT INTO mcp_test_unanalyzed SELECT generate_series(1, 10)")
+    yield "mcp_test_unanalyzed"
+    with db.cursor() as cur:
+        cur.execute("DROP TABLE mcp_test_unanalyzed")
+
+
+async def test_row_count_falls_back_for_unanalyzed_table(unanalyzed_table):
+    estimate = await get_row_count(unanalyzed_table)
+    assert estimate["row_count_source"] == "n_live_tup"
+    exact = await get_row_count(unanalyzed_table, exact=True)
+    assert exact["row_count"] == 10
+    assert exact["row_count_source"] == "exact"
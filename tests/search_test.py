@@ -0,0 +1,111 @@
+"""
+模式搜索索引的测试
+"""
+
+from postgresql.search import SchemaSearchIndex, name_tokens, tokenize, trigrams
+
+
+def table(kind="table", comment=None, columns=()):
+    return {
+        "kind": kind,
+        "comment": comment,
+        "estimated_rows": 10,
+        "columns": [{"name": name, "type": "text", "comment": None} for name in columns],
+    }
+
+
+SALES = {
+    "customers": table(comment="客户信息", columns=["customer_id", "emailAddress"]),
+    "orders": table(columns=["order_id", "customer_id", "total_amount"]),
+    "order_summary": table(kind="view", columns=["order_count"]),
+}
+HR = {"employees": table(columns=["employee_id", "email"])}
+
+
+def build_index():
+    index = SchemaSearchIndex()
+    index._add_schema("sales", SALES)
+    index._add_schema("hr", HR)
+    return index
+
+
+def test_tokenize():
+    assert tokenize("customer_id") == ["customer", "id"]
+    assert tokenize("emailAddress") == ["email", "address"]
+    assert tokenize("HTTPRequests") == ["http", "requests", "request"]
+    assert tokenize("客户信息") == ["客户", "户信", "信息"]
+    assert tokenize(None) == []
+    assert name_tokens("order_id") == ["order", "id", "order_id"]
+    assert trigrams("ab") == {"^ab", "ab$"}
+
+
+def test_exact_name_ranks_first():
+    index = build_index()
+    results, total = index.search("orders")
+    assert results[0]["table"] == "orders"
+    assert results[0]["type"] == "table"
+    assert total >= 3
+
+
+def test_column_and_comment_matches():
+    index = build_index()
+    results, _ = index.search("email address")
+    assert (results[0]["table"], results[0]["column"]) == ("customers", "emailAddress")
+    results, _ = index.search("客户")
+    assert results[0]["table"] == "customers"
+
+
+def test_prefix_and_fuzzy_matches():
+    index = build_index()
+    results, _ = index.search("employ")
+    assert results[0]["table"] == "employees"
+    results, _ = index.search("custmer")
+    assert {r["table"] for r in results} == {"customers", "orders"}
+
+
+def test_kind_and_schema_filters():
+    index = build_index()
+    results, _ = index.search("order", kind="table")
+    assert {r["table"] for r in results} == {"orders", "order_summary"}
+    results, _ = index.search("email", schema_name="hr")
+    assert [r["column"] for r in results] == ["email"]
+    results, _ = index.search("order", kind="column")
+    assert all(r["type"] == "column" for r in results)
+
+
+def test_remove_schema_drops_postings():
+    index = build_index()
+    tokens = index.stats()["tokens"]
+    index._remove_schema("hr")
+    assert index.search("employee") == ([], 0)
+    assert index.stats()["tokens"] < tokens
+    assert not any("employee" in token for token in index._postings)
+
+
+async def test_refresh_rebuilds_only_changed_schemas(monkeypatch):
+    versions = {"sales": "1", "hr": "1"}
+    loads = []
+
+    async def fake_query(query, params=None, *args, **kwargs):
+        return [{"schema_name": name, "version": v} for name, v in versions.items()]
+
+    async def fake_snapshot(schema_name=None):
+        loads.append(schema_name)
+        snapshot = {"sales": SALES, "hr": HR}
+        return snapshot if schema_name is None else {schema_name: snapshot[schema_name]}
+
+    monkeypatch.setattr("postgresql.search.aexecute_query", fake_query)
+    monkeypatch.setattr("postgresql.search.load_schema_snapshot", fake_snapshot)
+    index = SchemaSearchIndex(refresh_interval=0)
+    await index.refresh()
+    assert loads == [None]
+    assert index.stats()["schemas"] == 2
+
+    versions["hr"] = "2"
+    await index.refresh()
+    assert loads == [None, "hr"]
+
+    del versions["hr"]
+    await index.refresh()
+    assert index.stats()["schemas"] == 1
+    assert index.search("employee") == ([], 0)
@@ -0,0 +1,72 @@
+"""
+MCP会话标识与会话结束时清理的测试
+"""
+
+import json
+import time
+
+from mcp.shared.memory import create_connected_server_and_client_session
+
+from postgresql.session import (
+    close_session,
+    on_session_close,
+    session_key,
+    session_lifespan,
+)
+
+
+class FakeRequestContext:
+    def __init__(self, lifespan_context):
+        self.lifespan_context = lifespan_context
+
+
+async def test_session_lifespan_assigns_unique_keys(monkeypatch):
+    closed = []
+    monkeypatch.setattr("postgresql.session._close_hooks", [closed.append])
+
+    async with session_lifespan(None) as first, session_lifespan(None) as second:
+        assert first["session_key"] != second["session_key"]
+        assert session_key(FakeRequestContext(first)) == first["session_key"]
+
+    deadline = time.monotonic() + 5
+    while len(closed) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(closed) == sorted([first["session_key"], second["session_key"]])
+
+
+def test_session_key_outside_session():
+    assert session_key() == "default"
+    assert session_key(FakeRequestContext({})) == "default"
+
+
+def test_close_session_isolates_failing_hooks(monkeypatch):
+    closed = []
+
+    def broken(key):
+        raise RuntimeError(key)
+
+    monkeypatch.setattr("postgresql.session._close_hooks", [])
+    on_session_close(broken)
+    on_session_close(closed.append)
+    close_session("session-x")
+    assert closed == ["session-x"]
+
+
+async def test_cursors_released_when_session_ends(db):
+    from postgresql.cursors import cursor_registry
+    from postgresql.pg_mcpserver import mcp
+
+    before = cursor_registry.stats()["open"]
+    async with create_connected_server_and_client_session(mcp._mcp_server) as client:
+        result = await client.call_tool(
+            "execute_readonly_query",
+            {"sql": "SELECT generate_series(1, 10) AS n", "max_rows": 2, "paginate": True},
+        )
+        page = json.loads(result.content[0].text)
+        assert page["next_token"]
+        assert cursor_registry.stats()["open"] == before + 1
+
+    deadline = time.monotonic() + 5
+    while cursor_registry.stats()["open"] > before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cursor_registry.stats()["open"] == before
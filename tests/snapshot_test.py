@@ -0,0 +1,98 @@
+"""
+数据库模式快照的组装测试
+"""
+
+from postgresql.snapshot import build_schema_snapshot
+
+
+def table_row(schema, table, relkind="r", **extra):
+    row = {
+        "schema_name": schema,
+        "table_name": table,
+        "relkind": relkind,
+        "comment": None,
+        "estimated_rows": None,
+        "total_bytes": None,
+    }
+    row.update(extra)
+    return row
+
+
+def column_row(schema, table, name, data_type, nullable=True, default=None, comment=None):
+    return {
+        "schema_name": schema,
+        "table_name": table,
+        "column_name": name,
+        "data_type": data_type,
+        "nullable": nullable,
+        "column_default": default,
+        "comment": comment,
+    }
+
+
+def test_build_schema_snapshot_groups_by_schema_and_omits_empty_fields():
+    snapshot = build_schema_snapshot(
+        [
+            table_row("public", "orders", estimated_rows=10, total_bytes=8192),
+            table_row("sales", "v_orders", relkind="v", comment="订单视图"),
+        ],
+        [
+            column_row("public", "orders", "id", "bigint", nullable=False),
+            column_row("public", "orders", "note", "text", comment="备注"),
+            column_row("public", "missing", "id", "int"),
+        ],
+        [],
+        [],
+    )
+    assert set(snapshot) == {"public", "sales"}
+    orders = snapshot["public"]["orders"]
+    assert orders["kind"] == "table"
+    assert orders["estimated_rows"] == 10
+    assert orders["columns"] == [
+        {"name": "id", "type": "bigint", "not_null": True},
+        {"name": "note", "type": "text", "comment": "备注"},
+    ]
+    view = snapshot["sales"]["v_orders"]
+    assert view == {"kind": "view", "comment": "订单视图", "columns": []}
+
+
+def test_build_schema_snapshot_constraints_and_indexes():
+    constraint = {
+        "schema_name": "public",
+        "table_name": "orders",
+        "definition": "",
+        "ref_schema": None,
+        "ref_table": None,
+        "ref_columns": None,
+    }
+    snapshot = build_schema_snapshot(
+        [table_row("public", "orders")],
+        [],
+        [
+            {**constraint, "constraint_name": "orders_pkey", "constraint_type": "p",
+             "columns": ["id"]},
+            {**constraint, "constraint_name": "orders_customer_fkey", "constraint_type": "f",
+             "columns": ["customer_id"], "ref_schema": "public", "ref_table": "customers",
+             "ref_columns": ["id"]},
+            {**constraint, "constraint_name": "amount_positive", "constraint_type": "c",
+             "columns": ["amount"], "definition": "CHECK ((amount > 0))"},
+        ],
+        [
+            {"schema_name": "public", "table_name": "orders", "index_name": "orders_pkey",
+             "definition": "CREATE UNIQUE INDEX ...", "bytes": 16384,
+             "is_unique": True, "is_primary": True},
+        ],
+    )
+    orders = snapshot["public"]["orders"]
+    assert orders["primary_key"] == ["id"]
+    assert orders["foreign_keys"] == [
+        {
+            "name": "orders_customer_fkey",
+            "columns": ["customer_id"],
+            "references": "public.customers",
+            "ref_columns": ["id"],
+        }
+    ]
+    assert orders["constraints"][0]["type"] == "check"
+    assert orders["indexes"][0]["primary"] is True
+    assert "unique" not in orders["indexes"][0]